@@ -0,0 +1,48 @@
+"""
+Gunicorn configuration: `gunicorn -c gunicorn.conf.py`
+
+The app is loaded (and templates/URL caches warmed) once in the master
+before forking, so workers start serving immediately and share that memory
+copy-on-write. Each worker then opens its own database and LLM connections.
+Set LISTLAB_ASGI=1 to serve listlab.asgi with uvicorn workers instead; sync
+views then run in a thread pool with per-thread database connections, so the
+connections warmed in post_fork are not reused (see README).
+"""
+import multiprocessing
+import os
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'listlab.settings_production')
+# Workers warm their connections in post_fork rather than at import
+os.environ['LISTLAB_FORKED_WORKERS'] = '1'
+
+asgi = os.getenv('LISTLAB_ASGI') == '1'
+
+wsgi_app = 'listlab.asgi:application' if asgi else 'listlab.wsgi:application'
+worker_class = 'uvicorn.workers.UvicornWorker' if asgi else 'sync'
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+preload_app = True
+timeout = 60
+graceful_timeout = 30
+max_requests = 2000
+max_requests_jitter = 200
+
+
+def when_ready(server):
+    from listlab.serving import STARTUP
+    server.log.info(f"Application preloaded: {STARTUP}")
+
+
+def post_fork(server, worker):
+    from listlab import serving
+    start = time.perf_counter()
+    serving.warm_worker()
+    server.log.info(f"Worker {worker.pid} warmed up in {time.perf_counter() - start:.2f}s")
+
+
+def child_exit(server, worker):
+    # Fold the exited worker's metrics snapshot into merged.json, so workers
+    # recycled by max_requests don't each leave a file for /metrics to read
+    from lists import metrics
+    metrics.registry.fold_dead_snapshots()
@@ -0,0 +1,126 @@
+"""
+Start-up warm-up for the WSGI/ASGI entry points.
+
+`preload()` runs once per server, in the master process when the server
+preloads the app (gunicorn.conf.py sets preload_app), so forked workers
+inherit the work: it imports the app modules, compiles every template into
+the cached loader and populates the URL resolver caches.
+`warm_worker()` runs in every worker after the fork, because connections
+cannot be shared across processes: it opens the database connection and a
+pooled connection to the LLM API.
+
+Servers without a post-fork hook get both steps from `warm_up()`, which the
+entry points call; gunicorn.conf.py sets LISTLAB_FORKED_WORKERS so the
+master only preloads and each worker warms itself in post_fork.
+Timings of each step are logged and kept in STARTUP.
+"""
+import logging
+import os
+import time
+from importlib import import_module
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.template import engines
+from django.urls import get_resolver, reverse
+
+logger = logging.getLogger(__name__)
+
+SERVING_DEFAULTS = {
+    'WARM_UP': True,
+    'WARM_LLM': True,
+    'LLM_WARM_TIMEOUT': 2.0,
+}
+
+# Set by servers that call warm_worker() themselves after forking
+FORKED_WORKERS_ENV = 'LISTLAB_FORKED_WORKERS'
+
+# Seconds per step, filled in as the steps run
+STARTUP = {}
+
+
+def serving_setting(name):
+    return getattr(settings, 'SERVING', {}).get(name, SERVING_DEFAULTS[name])
+
+
+def _timed(name, func):
+    start = time.perf_counter()
+    try:
+        func()
+    except Exception as e:
+        logger.warning(f"Warm-up step {name} failed: {str(e)}")
+    STARTUP[name] = round(time.perf_counter() - start, 4)
+
+
+def _import_app_modules():
+    # Modules that are otherwise imported lazily by the first request
+    for app in apps.get_app_configs():
+        for module in ('views', 'api', 'services'):
+            try:
+                import_module(f'{app.name}.{module}')
+            except ModuleNotFoundError as e:
+                if e.name != f'{app.name}.{module}':
+                    raise
+
+
+def _compile_templates():
+    for engine in engines.all():
+        template_dirs = getattr(engine, 'template_dirs', None)
+        if template_dirs is None:
+            continue
+        for template_dir in template_dirs:
+            template_dir = Path(template_dir)
+            for path in template_dir.rglob('*.html'):
+                engine.get_template(path.relative_to(template_dir).as_posix())
+
+
+def _populate_urls():
+    resolver = get_resolver()
+    resolver.reverse_dict  # populates the resolver caches
+    for name in ('home', 'explore'):
+        reverse(name)
+
+
+def _connect_databases():
+    for connection in connections.all():
+        connection.ensure_connection()
+
+
+def _connect_llm():
+    from lists.services import ListGenerationService
+    ListGenerationService().warm_up(timeout=serving_setting('LLM_WARM_TIMEOUT'))
+
+
+def preload():
+    """Fork-safe warm-up, run once before workers are forked"""
+    if not serving_setting('WARM_UP'):
+        return
+    _timed('import_app_modules', _import_app_modules)
+    _timed('compile_templates', _compile_templates)
+    _timed('populate_urls', _populate_urls)
+    # Nothing opened here may be inherited by the workers
+    connections.close_all()
+
+
+def warm_worker():
+    """Per-process warm-up of connections, run in each worker"""
+    if not serving_setting('WARM_UP'):
+        return
+    _timed('connect_databases', _connect_databases)
+    if serving_setting('WARM_LLM'):
+        _timed('connect_llm', _connect_llm)
+
+
+def warm_up(started):
+    """
+    Called by the entry points once the application object exists.
+    `started` is the perf_counter() value taken at the top of the entry point.
+    """
+    STARTUP['import'] = round(time.perf_counter() - started, 4)
+    preload()
+    if os.environ.get(FORKED_WORKERS_ENV) != '1':
+        warm_worker()
+    STARTUP['total'] = round(time.perf_counter() - started, 4)
+    logger.info(f"Application loaded in {STARTUP['total']:.2f}s: {STARTUP}")
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -20,6 +21,10 @@ load_dotenv()
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# `manage.py test` keeps its cache, static files and metrics away from the ones
+# a development server on the same checkout uses
+TESTING = sys.argv[1:2] == ['test']
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
@@ -49,7 +54,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'lists.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'django.middleware.gzip.GZipMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -85,11 +93,47 @@ WSGI_APPLICATION = 'listlab.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.getenv('SQLITE_PATH') or BASE_DIR / 'db.sqlite3',
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Sessions, session users and buffered like state live here, so every worker
+# process must see the same cache. The file cache is shared by all processes
+# on one host; set REDIS_URL (requires the redis package) to share it across hosts.
+# Tests get a private in-memory cache so their keys never meet the dev server's.
+
+if TESTING:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+elif os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'lists.caching.FileCache',
+            'LOCATION': os.path.join(BASE_DIR, 'var', 'cache'),
+            'OPTIONS': {
+                'MAX_ENTRIES': 50000,
+                'CULL_INTERVAL': 60,
+            },
+        }
+    }
+
+# Sessions are read from the cache and only fall back to the database on a miss
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -125,10 +169,29 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static'),
 ]
 
+# collectstatic writes content-hashed copies plus .gz/.br variants; WhiteNoise
+# serves the hashed files with far-future, immutable cache headers
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# The manifest only exists after collectstatic, and with DEBUG off (as in tests)
+# every {% static %} tag needs it, so tests use the unhashed storage
+if TESTING:
+    STORAGES['staticfiles'] = {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    }
+
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -147,8 +210,102 @@ LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'home'
 LOGIN_URL = 'login'
 
+# Session users (and their profiles) are cached for a short time so
+# authenticated requests don't query auth_user on every hit
+AUTHENTICATION_BACKENDS = ['lists.backends.CachedModelBackend']
+USER_CACHE_TIMEOUT = 60
+
 # OpenAI settings
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+# Point at `manage.py run_openai_stub` (http://127.0.0.1:8001/v1) for offline load tests
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1')
+
+# Model tiers for generation, tried in order (fast model first, fallbacks after).
+# A call still running past the model's recent HEDGE_PERCENTILE latency is
+# hedged with a second identical call; the first answer wins.
+GENERATION_MODELS = {
+    'TIERS': [
+        {'MODEL': 'gpt-4o-mini', 'MAX_TOKENS': 400, 'TIMEOUT': 20},
+        {'MODEL': 'gpt-4o', 'MAX_TOKENS': 400, 'TIMEOUT': 40},
+    ],
+    'HEDGE': True,
+    'HEDGE_PERCENTILE': 95,
+    'HEDGE_MIN_DELAY': 1.0,
+    'HEDGE_INITIAL_DELAY': 5.0,
+    'LATENCY_WINDOW': 200,
+    'MIN_SAMPLES': 20,
+}
+
+# Admission control for upstream generation calls (per process)
+GENERATION_SCHEDULER = {
+    'MAX_CONCURRENCY': 4,
+    'MAX_QUEUE': 16,
+    'MAX_WAIT': 30,
+    'USER_REQUESTS_PER_MINUTE': 6,
+    'USER_BURST': 3,
+    'UPSTREAM_REQUESTS_PER_MINUTE': 60,
+    'UPSTREAM_BURST': 10,
+}
+
+# Reuse generations for similar prompts (cosine similarity of prompt vectors)
+PROMPT_CACHE = {
+    'ENABLED': True,
+    'THRESHOLD': 0.8,
+    'MAX_ENTRIES': 20000,
+    'REFRESH_INTERVAL': 30,
+}
+
+# Background generation queue (see `manage.py run_generation_workers`)
+GENERATION_JOBS = {
+    'PROCESSES': 1,
+    'THREADS': 4,
+    'POLL_INTERVAL': 1.0,
+    'MAX_ATTEMPTS': 3,
+    'RETRY_BACKOFF': 5,
+    'LEASE_SECONDS': 300,
+    'MAX_ACTIVE_PER_USER': 5,
+    # Submissions get 503 once this many jobs are waiting
+    'MAX_QUEUED': 500,
+    # A job put back this many times by rate limits or load shedding fails
+    'MAX_DEFERRALS': 20,
+}
+
+# Write-behind like buffer (flush with `manage.py flush_likes --interval 5`)
+LIKE_BUFFER = {
+    'ENABLED': os.getenv('LIKE_BUFFER_ENABLED') == '1',
+    'LOG_PATH': os.path.join(BASE_DIR, 'var', 'likes.log'),
+    'FLUSH_INTERVAL': 5,
+    'STATE_TIMEOUT': 300,
+    'FSYNC': False,
+}
+
+# Prometheus metrics served at /metrics. Every worker process writes a
+# snapshot to DIR at most every FLUSH_INTERVAL seconds; clear DIR on deploy.
+# Test runs write theirs to a temporary directory that is removed on exit.
+METRICS = {
+    'DIR': os.getenv('METRICS_DIR') or os.path.join(BASE_DIR, 'var', 'metrics'),
+    'FLUSH_INTERVAL': 5,
+    'TOKEN': os.getenv('METRICS_TOKEN'),
+    # Addresses allowed without the token, matched against REMOTE_ADDR. Leave
+    # empty behind a reverse proxy, where every request comes from the proxy.
+    'ALLOWED_IPS': (),
+}
+
+if TESTING:
+    import atexit
+    import shutil
+    import tempfile
+
+    METRICS['DIR'] = tempfile.mkdtemp(prefix='listlab-metrics-')
+    # atexit runs handlers in reverse order, so this runs after lists.metrics' final flush
+    atexit.register(shutil.rmtree, METRICS['DIR'], ignore_errors=True)
+
+# Start-up warm-up run by listlab/wsgi.py and listlab/asgi.py (see listlab/serving.py)
+SERVING = {
+    'WARM_UP': True,
+    'WARM_LLM': os.getenv('SERVING_WARM_LLM', '1') == '1',
+    'LLM_WARM_TIMEOUT': 2.0,
+}
 
 # Logging configuration
 LOGGING = {
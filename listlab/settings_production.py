@@ -0,0 +1,32 @@
+"""
+Production settings for listlab.
+
+Use with DJANGO_SETTINGS_MODULE=listlab.settings_production. Everything not
+overridden here comes from settings.py.
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+
+DEBUG = False
+
+SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
+
+ALLOWED_HOSTS = [host.strip() for host in os.getenv('DJANGO_ALLOWED_HOSTS', '').split(',') if host.strip()]
+
+# Compile each template once per process instead of on every render
+TEMPLATES[0]['APP_DIRS'] = False
+TEMPLATES[0]['OPTIONS']['context_processors'] = [
+    processor for processor in TEMPLATES[0]['OPTIONS']['context_processors']
+    if processor != 'django.template.context_processors.debug'
+]
+TEMPLATES[0]['OPTIONS']['loaders'] = [
+    ('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+]
+
+# Keep database connections open between requests (warmed when a worker starts)
+CONN_MAX_AGE = 60
+CONN_HEALTH_CHECKS = True
@@ -8,9 +8,18 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/wsgi/
 """
 
 import os
+import time
 
-from django.core.wsgi import get_wsgi_application
+_started = time.perf_counter()
+
+from django.core.wsgi import get_wsgi_application  # noqa: E402
+
+from listlab import serving  # noqa: E402
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'listlab.settings')
 
 application = get_wsgi_application()
+
+# Compile templates, populate URL caches and open connections before the
+# first request instead of during it
+serving.warm_up(_started)
@@ -1,14 +1,125 @@
-from django.contrib import admin
-from .models import List, UserProfile
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Value
+from django.db.models.functions import Concat, Lower
+from django.utils import timezone
+from django.utils.functional import cached_property
+from .models import GenerationJob, List, PromptCacheEntry, UserProfile
+
+# Below this many rows an exact COUNT(*) is cheap enough
+EXACT_COUNT_THRESHOLD = 10000
+
+
+def estimate_row_count(model):
+    """
+    Cheap row-count estimate for a whole table, or None if unavailable.
+    PostgreSQL/MySQL read planner statistics; SQLite uses MAX(rowid), which
+    over-counts after deletes but costs a single index probe.
+    """
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute(
+                "SELECT table_rows FROM information_schema.tables "
+                "WHERE table_schema = DATABASE() AND table_name = %s", [table]
+            )
+        elif connection.vendor == 'sqlite':
+            cursor.execute(f"SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}")
+        else:
+            return None
+        row = cursor.fetchone()
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that avoids full-table COUNT(*) scans: unfiltered changelists
+    use the table estimate, filtered ones count at most EXACT_COUNT_THRESHOLD rows.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_row_count(queryset.model)
+            if estimate is not None and estimate > EXACT_COUNT_THRESHOLD:
+                return estimate
+        return queryset.order_by()[:EXACT_COUNT_THRESHOLD].count()
+
 
 @admin.register(List)
 class ListAdmin(admin.ModelAdmin):
-    list_display = ('title', 'owner', 'is_public', 'created_at', 'updated_at')
-    list_filter = ('is_public', 'created_at', 'updated_at')
-    search_fields = ('title', 'description', 'content', 'tags')
+    list_display = ('title', 'owner', 'is_public', 'like_count', 'fork_count', 'created_at', 'updated_at')
+    list_filter = ('is_public',)
+    list_select_related = ('owner',)
+    search_fields = ('title',)
+    search_help_text = 'Title prefix, a list id, or @username'
     raw_id_fields = ('owner', 'original_list')
+    readonly_fields = ('like_count', 'fork_count')
+    date_hierarchy = 'created_at'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+    actions = ['publish', 'unpublish', 'recount']
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Index-backed search instead of icontains over four text columns:
+        digits match the id, @name matches the owner's username, anything
+        else is a case-insensitive title prefix (range scan on Lower(title)).
+        The term is lowered by the database as well, so both sides match
+        whatever its LOWER() does: SQLite's only folds ASCII, so there a
+        non-ASCII prefix matches its own case only.
+        """
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if term.isdigit():
+            return queryset.filter(pk=int(term)), False
+        if term.startswith('@'):
+            return queryset.filter(owner__username=term[1:]), False
+        prefix = Lower(Value(term))
+        queryset = queryset.alias(title_lower=Lower('title')).filter(
+            title_lower__gte=prefix, title_lower__lt=Concat(prefix, Value('\U0010ffff'))
+        )
+        return queryset, False
+
+    @admin.action(description='Publish selected lists')
+    def publish(self, request, queryset):
+        updated = queryset.update(is_public=True, updated_at=timezone.now())
+        self.message_user(request, f'{updated} list(s) published.', messages.SUCCESS)
+
+    @admin.action(description='Unpublish selected lists')
+    def unpublish(self, request, queryset):
+        updated = queryset.update(is_public=False, updated_at=timezone.now())
+        self.message_user(request, f'{updated} list(s) unpublished.', messages.SUCCESS)
+
+    @admin.action(description='Recount likes and forks')
+    def recount(self, request, queryset):
+        updated = queryset.recount()
+        self.message_user(request, f'Recounted {updated} list(s).', messages.SUCCESS)
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'bio')
+    list_select_related = ('user',)
     search_fields = ('user__username', 'bio')
+
+@admin.register(GenerationJob)
+class GenerationJobAdmin(admin.ModelAdmin):
+    list_display = ('prompt', 'user', 'status', 'attempts', 'created_at', 'run_seconds')
+    list_filter = ('status',)
+    search_fields = ('prompt', 'user__username')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+
+@admin.register(PromptCacheEntry)
+class PromptCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('prompt', 'normalized', 'hits', 'created_at', 'last_hit_at')
+    search_fields = ('normalized',)
+    readonly_fields = ('normalized', 'hits', 'created_at', 'last_hit_at')
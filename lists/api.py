@@ -0,0 +1,166 @@
+"""
+Read-only JSON API for lists, feeds and lineage.
+
+Every endpoint accepts a `fields` parameter for sparse field selection and
+answers conditional GETs through an ETag computed over the response body.
+"""
+import hashlib
+import json
+
+from django.db import connection
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.views.decorators.http import require_GET
+
+from .models import List, UserProfile
+from .serializers import SUMMARY_LIST_FIELDS, parse_fields, serialize_lists
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+MAX_LINEAGE_DEPTH = 50
+
+
+# Follows original_list upwards in one query; the depth column caps the walk,
+# which also stops it going round a cycle
+ANCESTORS_SQL = """
+    WITH RECURSIVE ancestors(id, depth) AS (
+        SELECT original_list_id, 1 FROM {table} WHERE id = %s
+        UNION ALL
+        SELECT l.original_list_id, a.depth + 1
+        FROM {table} l JOIN ancestors a ON l.id = a.id
+        WHERE a.depth < %s
+    )
+    SELECT id FROM ancestors WHERE id IS NOT NULL ORDER BY depth
+"""
+
+
+def _json_response(request, payload):
+    """Compact JSON response carrying an ETag; returns 304 when it matches"""
+    body = json.dumps(payload, separators=(',', ':')).encode()
+    etag = '"%s"' % hashlib.md5(body, usedforsecurity=False).hexdigest()
+    response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    # Viewer flags depend on who is logged in
+    patch_vary_headers(response, ('Cookie',))
+    return get_conditional_response(request, etag=etag, response=response)
+
+
+def _error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+def _positive_int(value, default):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return default
+    return number if number > 0 else default
+
+
+def _paginate(request, queryset, fields):
+    """Offset pagination that fetches one extra row instead of counting"""
+    page = _positive_int(request.GET.get('page'), 1)
+    page_size = min(_positive_int(request.GET.get('page_size'), DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE)
+    offset = (page - 1) * page_size
+    results = serialize_lists(queryset[offset:offset + page_size + 1], fields, request.user)
+    return {
+        'page': page,
+        'page_size': page_size,
+        'has_next': len(results) > page_size,
+        'results': results[:page_size],
+    }
+
+
+def _ancestor_ids(pk):
+    """Ids up the original_list chain of a list, nearest first"""
+    with connection.cursor() as cursor:
+        cursor.execute(ANCESTORS_SQL.format(table=List._meta.db_table), [pk, MAX_LINEAGE_DEPTH])
+        rows = cursor.fetchall()
+    ancestor_ids = []
+    seen = {pk}
+    for (ancestor_id,) in rows:
+        if ancestor_id in seen:
+            break
+        seen.add(ancestor_id)
+        ancestor_ids.append(ancestor_id)
+    return ancestor_ids
+
+
+@require_GET
+def list_detail(request, pk):
+    """A single list with counts and viewer flags"""
+    try:
+        fields = parse_fields(request.GET.get('fields'))
+    except ValueError as e:
+        return _error(str(e))
+    results = serialize_lists(List.objects.visible_to(request.user).filter(pk=pk), fields, request.user)
+    if not results:
+        raise Http404('List not found')
+    return _json_response(request, results[0])
+
+
+@require_GET
+def explore(request):
+    """Paginated feed of public lists, optionally filtered by `q`"""
+    try:
+        fields = parse_fields(request.GET.get('fields'), default=SUMMARY_LIST_FIELDS)
+    except ValueError as e:
+        return _error(str(e))
+    lists = List.objects.filter(is_public=True)
+    query = request.GET.get('q', '')
+    if query:
+        lists = lists.search(query)
+    lists = lists.order_by('-created_at', '-pk')
+    return _json_response(request, _paginate(request, lists, fields))
+
+
+@require_GET
+def user_lists(request, username):
+    """Paginated feed of a user's lists visible to the viewer"""
+    try:
+        fields = parse_fields(request.GET.get('fields'), default=SUMMARY_LIST_FIELDS)
+    except ValueError as e:
+        return _error(str(e))
+    profile = get_object_or_404(UserProfile.objects.select_related('user'), user__username=username)
+    lists = (
+        List.objects.filter(owner=profile.user)
+        .visible_to(request.user)
+        .order_by('-created_at', '-pk')
+    )
+    payload = _paginate(request, lists, fields)
+    payload['user'] = {'username': profile.user.username, 'bio': profile.bio}
+    return _json_response(request, payload)
+
+
+@require_GET
+def list_lineage(request, pk):
+    """
+    Ancestors of a list (nearest first) and its direct forks.
+    Ancestors and forks the viewer may not see are left out.
+    """
+    try:
+        fields = parse_fields(request.GET.get('fields'), default=SUMMARY_LIST_FIELDS)
+    except ValueError as e:
+        return _error(str(e))
+    visible = List.objects.visible_to(request.user)
+    results = serialize_lists(visible.filter(pk=pk), fields, request.user)
+    if not results:
+        raise Http404('List not found')
+
+    ancestor_ids = _ancestor_ids(pk)
+
+    ancestors = {}
+    if ancestor_ids:
+        lookup_fields = fields if 'id' in fields else ('id',) + fields
+        for row in serialize_lists(visible.filter(pk__in=ancestor_ids), lookup_fields, request.user):
+            ancestors[row['id']] = row if 'id' in fields else {k: v for k, v in row.items() if k != 'id'}
+
+    forks = serialize_lists(
+        visible.filter(original_list=pk).order_by('-created_at', '-pk'), fields, request.user
+    )
+    return _json_response(request, {
+        'list': results[0],
+        'ancestors': [ancestors[i] for i in ancestor_ids if i in ancestors],
+        'forks': forks,
+    })
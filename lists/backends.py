@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from . import metrics
+from .caching import user_cache_key
+
+UserModel = get_user_model()
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend that serves the per-request session user lookup from the cache.
+    The user is loaded together with its profile, so neither `request.user` nor
+    `request.user.userprofile` hits the database while the entry is warm.
+    Entries are dropped by the post_save/post_delete handlers in lists.models.
+    """
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        metrics.CACHE_REQUESTS.inc('user', 'miss' if user is None else 'hit')
+        if user is None:
+            user = (
+                UserModel._default_manager
+                .select_related('userprofile')
+                .filter(pk=user_id)
+                .first()
+            )
+            if user is None:
+                return None
+            cache.set(key, user, settings.USER_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,37 @@
+import time
+
+from django.core.cache import cache
+from django.core.cache.backends.filebased import FileBasedCache
+
+USER_CACHE_KEY = 'lists:user:{}'
+
+
+def user_cache_key(user_id):
+    """Cache key for the session user (with profile) of the given id"""
+    return USER_CACHE_KEY.format(user_id)
+
+
+def invalidate_cached_user(user_id):
+    """Drop the cached session user so the next request reloads it"""
+    cache.delete(user_cache_key(user_id))
+
+
+class FileCache(FileBasedCache):
+    """
+    FileBasedCache that culls at most once every CULL_INTERVAL seconds.
+    The stock backend lists the whole cache directory on every set() to count
+    its entries, which gets slower the fuller the cache is; here the cache may
+    overshoot MAX_ENTRIES by whatever is written between two culls.
+    """
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self._cull_interval = float(params.get('OPTIONS', {}).get('CULL_INTERVAL', 60))
+        self._next_cull = 0.0
+
+    def _cull(self):
+        now = time.monotonic()
+        if now < self._next_cull:
+            return
+        self._next_cull = now + self._cull_interval
+        super()._cull()
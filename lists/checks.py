@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+from . import likebuffer
+
+# Cache backends whose contents are private to one process
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register()
+def check_like_buffer_cache(app_configs, **kwargs):
+    """The like buffer keeps each user's pending state in the default cache"""
+    if not likebuffer.buffer_setting('ENABLED'):
+        return []
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in PROCESS_LOCAL_CACHES:
+        return [Error(
+            'LIKE_BUFFER is enabled but the default cache is not shared between processes.',
+            hint='Use a file, database or Redis cache so every worker sees pending likes.',
+            id='lists.E001',
+        )]
+    return []
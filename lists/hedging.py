@@ -0,0 +1,152 @@
+"""
+Model tiers, per-model latency tracking and hedged upstream calls.
+
+Generation tries the tiers in GENERATION_MODELS['TIERS'] in order (a fast
+model first, slower fallbacks after it). Within a tier the call is hedged:
+if it has not answered by the model's recent HEDGE_PERCENTILE latency, an
+identical second call is started and whichever succeeds first is used. The
+loser is left to finish in the background, since a blocking HTTP call cannot
+be cancelled. A hedge needs a token from the scheduler's upstream bucket, so
+hedging never pushes the process past the provider's rate limit, and a
+scheduler slot that stays reserved until both calls have finished, so an
+abandoned call still counts against MAX_CONCURRENCY.
+"""
+import math
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError, wait
+
+from django.conf import settings
+
+MODEL_DEFAULTS = {
+    'TIERS': [
+        {'MODEL': 'gpt-4o-mini', 'MAX_TOKENS': 400, 'TIMEOUT': 20},
+        {'MODEL': 'gpt-4o', 'MAX_TOKENS': 400, 'TIMEOUT': 40},
+    ],
+    'HEDGE': True,
+    'HEDGE_PERCENTILE': 95,
+    'HEDGE_MIN_DELAY': 1.0,
+    'HEDGE_INITIAL_DELAY': 5.0,
+    'LATENCY_WINDOW': 200,
+    'MIN_SAMPLES': 20,
+}
+
+
+def model_setting(name):
+    return getattr(settings, 'GENERATION_MODELS', {}).get(name, MODEL_DEFAULTS[name])
+
+
+class LatencyTracker:
+    """Sliding window of successful call latencies per model"""
+
+    def __init__(self, window, min_samples, percentile, min_delay, initial_delay):
+        self.window = window
+        self.min_samples = min_samples
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.initial_delay = initial_delay
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def record(self, model, seconds):
+        with self._lock:
+            samples = self._samples.get(model)
+            if samples is None:
+                samples = self._samples[model] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def quantile(self, model, percentile):
+        """Nearest-rank percentile of the model's window, or None without enough samples"""
+        with self._lock:
+            samples = sorted(self._samples.get(model, ()))
+        if len(samples) < self.min_samples:
+            return None
+        rank = max(1, math.ceil(percentile / 100 * len(samples)))
+        return samples[rank - 1]
+
+    def hedge_delay(self, model):
+        """Seconds to wait for the first call before hedging"""
+        value = self.quantile(model, self.percentile)
+        if value is None:
+            value = self.initial_delay
+        return max(self.min_delay, value)
+
+
+def hedged_call(call, delay, may_hedge, release_hedge):
+    """
+    Run `call()`; if it is still running after `delay` seconds and
+    `may_hedge()` reserves capacity for it, start a second `call()` and
+    return the first successful result. The reservation is given back with
+    `release_hedge()` once both calls have finished, which may be after this
+    returns. Returns (result, winner) where winner is 'first', 'second' or
+    None when no hedge was sent. Raises the last error if every call failed.
+    """
+    executor = _get_executor()
+    first = executor.submit(call)
+    try:
+        return first.result(timeout=delay), None
+    except TimeoutError:
+        pass
+    if not may_hedge():
+        return first.result(), None
+
+    try:
+        second = executor.submit(call)
+    except BaseException:
+        release_hedge()
+        raise
+    names = {first: 'first', second: 'second'}
+    running = [len(names)]
+    running_lock = threading.Lock()
+
+    def call_finished(future):
+        with running_lock:
+            running[0] -= 1
+            last = not running[0]
+        if last:
+            release_hedge()
+
+    for future in names:
+        future.add_done_callback(call_finished)
+    pending = set(names)
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result(), names[future]
+            error = future.exception()
+    raise error
+
+
+_executor = None
+_tracker = None
+_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                # A first call and a hedge per admitted generation, plus room
+                # for abandoned calls that are still finishing
+                concurrency = getattr(settings, 'GENERATION_SCHEDULER', {}).get('MAX_CONCURRENCY', 4)
+                _executor = ThreadPoolExecutor(max_workers=4 * concurrency, thread_name_prefix='llm-call')
+    return _executor
+
+
+def get_latency_tracker():
+    """Process-wide latency tracker configured from settings.GENERATION_MODELS"""
+    global _tracker
+    if _tracker is None:
+        with _lock:
+            if _tracker is None:
+                _tracker = LatencyTracker(
+                    window=model_setting('LATENCY_WINDOW'),
+                    min_samples=model_setting('MIN_SAMPLES'),
+                    percentile=model_setting('HEDGE_PERCENTILE'),
+                    min_delay=model_setting('HEDGE_MIN_DELAY'),
+                    initial_delay=model_setting('HEDGE_INITIAL_DELAY'),
+                )
+    return _tracker
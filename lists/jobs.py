@@ -0,0 +1,228 @@
+"""
+Database-backed job queue for list generation.
+
+Web requests call `submit_generation_job()` and return the job id at once;
+the `run_generation_workers` command claims jobs with `claim_job()` and runs
+them with `run_job()`. Claims are a conditional UPDATE, so any number of
+worker processes can share the table without row locks, and a job whose
+worker died is reclaimed once its lease expires.
+
+The scheduler's per-user token bucket lives in each worker process, so on its
+own it would let a user through once per process. Workers therefore also check
+the user's starts over the last minute in the table itself, which every
+process sees. Deferrals for either limit (or for local load shedding) do not
+spend an attempt but are capped at MAX_DEFERRALS, and submissions are refused
+once MAX_QUEUED jobs are waiting.
+"""
+import logging
+import random
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import GenerationJob
+from .scheduler import PRIORITY_BACKGROUND, GenerationRejected, get_scheduler
+from .services import ListGenerationService
+
+logger = logging.getLogger(__name__)
+
+JOB_DEFAULTS = {
+    'PROCESSES': 1,
+    'THREADS': 4,
+    'POLL_INTERVAL': 1.0,
+    'MAX_ATTEMPTS': 3,
+    'RETRY_BACKOFF': 5,
+    'LEASE_SECONDS': 300,
+    'MAX_ACTIVE_PER_USER': 5,
+    'MAX_QUEUED': 500,
+    'MAX_DEFERRALS': 20,
+}
+
+# Window for the per-user start rate shared by all worker processes
+USER_RATE_WINDOW = timedelta(minutes=1)
+
+ACTIVE_STATUSES = (GenerationJob.PENDING, GenerationJob.RUNNING)
+
+
+class TooManyJobs(Exception):
+    """The user already has the maximum number of unfinished jobs"""
+
+
+class QueueFull(Exception):
+    """MAX_QUEUED jobs are already waiting for a worker"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def job_setting(name):
+    return getattr(settings, 'GENERATION_JOBS', {}).get(name, JOB_DEFAULTS[name])
+
+
+def submit_generation_job(user, prompt, idempotency_key=None):
+    """
+    Queue a generation for `user` and return the job.
+
+    Submitting again with the same idempotency key returns the existing job
+    (a failed one is re-queued). Without a key, an unfinished job for the
+    same prompt is reused instead of queueing a duplicate.
+    """
+    if idempotency_key:
+        job = GenerationJob.objects.filter(user=user, idempotency_key=idempotency_key).first()
+    else:
+        job = GenerationJob.objects.filter(user=user, prompt=prompt, status__in=ACTIVE_STATUSES).first()
+    if job is not None:
+        if job.status == GenerationJob.FAILED:
+            GenerationJob.objects.filter(pk=job.pk, status=GenerationJob.FAILED).update(
+                status=GenerationJob.PENDING, attempts=0, deferrals=0, run_after=timezone.now(),
+                error='', finished_at=None
+            )
+            job.refresh_from_db()
+        return job
+
+    active = GenerationJob.objects.filter(user=user, status__in=ACTIVE_STATUSES).count()
+    if active >= job_setting('MAX_ACTIVE_PER_USER'):
+        raise TooManyJobs('Too many generation jobs in progress')
+    max_queued = job_setting('MAX_QUEUED')
+    # The slice keeps the count cheap however long the backlog is
+    if GenerationJob.objects.filter(status=GenerationJob.PENDING)[:max_queued].count() >= max_queued:
+        raise QueueFull('Generation is overloaded', job_setting('RETRY_BACKOFF'))
+
+    try:
+        return GenerationJob.objects.create(
+            user=user,
+            prompt=prompt,
+            idempotency_key=idempotency_key or None,
+            max_attempts=job_setting('MAX_ATTEMPTS'),
+        )
+    except IntegrityError:
+        # A concurrent request with the same key won the race
+        return GenerationJob.objects.get(user=user, idempotency_key=idempotency_key)
+
+
+def _claimable(now):
+    lease_expired = now - timedelta(seconds=job_setting('LEASE_SECONDS'))
+    return (
+        Q(status=GenerationJob.PENDING, run_after__lte=now) |
+        Q(status=GenerationJob.RUNNING, started_at__lt=lease_expired)
+    )
+
+
+def claim_job(worker_id):
+    """Atomically claim the next runnable job for `worker_id`, or return None"""
+    now = timezone.now()
+    claimable = _claimable(now)
+    candidates = (
+        GenerationJob.objects.filter(claimable)
+        .order_by('run_after')
+        .values_list('pk', flat=True)[:10]
+    )
+    for pk in candidates:
+        claimed = GenerationJob.objects.filter(claimable, pk=pk).update(
+            status=GenerationJob.RUNNING,
+            locked_by=worker_id,
+            started_at=now,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return GenerationJob.objects.get(pk=pk)
+    return None
+
+
+def _finish(job, **fields):
+    """Update the job only if this worker still holds it"""
+    return GenerationJob.objects.filter(
+        pk=job.pk, status=GenerationJob.RUNNING, locked_by=job.locked_by
+    ).update(**fields)
+
+
+def _user_rate_wait(job):
+    """
+    Seconds until the job's user may start another generation, or 0.
+    Counts the user's jobs started within USER_RATE_WINDOW across all workers.
+    """
+    limit = max(1, round(get_scheduler().user_rate * 60))
+    window_start = job.started_at - USER_RATE_WINDOW
+    starts = list(
+        GenerationJob.objects
+        .filter(user_id=job.user_id, started_at__gte=window_start)
+        .exclude(pk=job.pk)
+        .order_by('-started_at')
+        .values_list('started_at', flat=True)[:limit]
+    )
+    if len(starts) < limit:
+        return 0
+    # Wait for the oldest of the last `limit` starts to leave the window
+    return max(1, (starts[-1] + USER_RATE_WINDOW - job.started_at).total_seconds())
+
+
+def _defer(job, retry_after, reason):
+    """
+    Put the job back without spending an attempt, since the deferral is not
+    the job's fault; fail it once it has been deferred MAX_DEFERRALS times.
+    """
+    if job.deferrals >= job_setting('MAX_DEFERRALS'):
+        _finish(
+            job, status=GenerationJob.FAILED, attempts=F('attempts') - 1,
+            error=f"Gave up after {job.deferrals} deferrals: {reason}", finished_at=timezone.now()
+        )
+        logger.error(f"Job {job.pk} failed after {job.deferrals} deferrals: {reason}")
+        return
+    # Clearing started_at keeps the deferred claim out of the user's start rate
+    _finish(
+        job, status=GenerationJob.PENDING, locked_by='', started_at=None,
+        attempts=F('attempts') - 1, deferrals=F('deferrals') + 1,
+        run_after=timezone.now() + timedelta(seconds=retry_after)
+    )
+    logger.info(f"Job {job.pk} deferred for {retry_after:.0f}s: {reason}")
+
+
+def run_job(job):
+    """Run a claimed job, recording its result or scheduling a retry"""
+    wait = _user_rate_wait(job)
+    if wait:
+        _defer(job, wait, 'User rate limit reached')
+        return
+
+    start = time.monotonic()
+    try:
+        result = ListGenerationService().generate_list(
+            job.prompt, user_key=job.user_id, priority=PRIORITY_BACKGROUND
+        )
+    except GenerationRejected as e:
+        # Local load shedding, the per-process user bucket (GenerationThrottled)
+        # or an upstream pause
+        _defer(job, e.retry_after, str(e))
+        return
+    except Exception as e:
+        elapsed = time.monotonic() - start
+        if job.attempts < job.max_attempts:
+            backoff = job_setting('RETRY_BACKOFF') * 2 ** (job.attempts - 1)
+            backoff *= random.uniform(0.5, 1.5)
+            _finish(
+                job, status=GenerationJob.PENDING, locked_by='', error=str(e),
+                run_seconds=elapsed, run_after=timezone.now() + timedelta(seconds=backoff)
+            )
+            logger.warning(f"Job {job.pk} attempt {job.attempts} failed, retrying in {backoff:.1f}s: {str(e)}")
+        else:
+            _finish(
+                job, status=GenerationJob.FAILED, error=str(e),
+                run_seconds=elapsed, finished_at=timezone.now()
+            )
+            logger.error(f"Job {job.pk} failed after {job.attempts} attempts: {str(e)}")
+        return
+
+    elapsed = time.monotonic() - start
+    _finish(
+        job, status=GenerationJob.SUCCEEDED, result=result, error='',
+        run_seconds=elapsed, finished_at=timezone.now()
+    )
+    logger.info(
+        f"Job {job.pk} succeeded in {elapsed:.2f}s "
+        f"after {job.queue_seconds:.2f}s queued (attempt {job.attempts})"
+    )
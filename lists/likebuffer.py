@@ -0,0 +1,201 @@
+"""
+Optional write-behind buffer for like toggles.
+
+With settings.LIKE_BUFFER['ENABLED'], `toggle_like` does not write Like rows.
+Instead it appends "<list_id> <user_id> <0|1>" to a local append-only log and
+remembers the user's new state in the cache, so their next read sees it at
+once. That cache must be shared by all worker processes (see lists.checks).
+A user's unflushed states are kept together under one key, so a page of
+lists needs a single cache read (see `apply_pending()`).
+
+`flush()` (run by `manage.py flush_likes`) rotates the log, replays it
+last-write-wins, and applies the result per list with one bulk_create plus
+set-based deletes, followed by a single recount of the affected lists.
+
+A rotated log is deleted only after its transaction commits, and replaying
+desired states is idempotent, so an interrupted flush is simply redone.
+Writers hold a shared flock while appending and the flusher takes an
+exclusive one after rotating, so no append is lost to a rotation (POSIX only).
+"""
+import glob
+import logging
+import os
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Like, List
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; the buffer stays disabled there
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+BUFFER_DEFAULTS = {
+    'ENABLED': False,
+    'LOG_PATH': os.path.join(settings.BASE_DIR, 'var', 'likes.log'),
+    'FLUSH_INTERVAL': 5,
+    'STATE_TIMEOUT': 300,
+    'FSYNC': False,
+}
+
+
+def buffer_setting(name):
+    return getattr(settings, 'LIKE_BUFFER', {}).get(name, BUFFER_DEFAULTS[name])
+
+
+def enabled():
+    return fcntl is not None and buffer_setting('ENABLED')
+
+
+def _states_key(user_id):
+    return f'lists:likes:{user_id}'
+
+
+def _read_user_states(user_id):
+    """The user's unexpired {list_id: (liked, recorded_at)} entries"""
+    cutoff = time.time() - buffer_setting('STATE_TIMEOUT')
+    entries = cache.get(_states_key(user_id)) or {}
+    return {list_id: entry for list_id, entry in entries.items() if entry[1] > cutoff}
+
+
+def pending_state(user_id, list_id):
+    """The user's unflushed like state for the list, or None if there is none"""
+    return pending_states(user_id, [list_id]).get(list_id)
+
+
+def pending_states(user_id, list_ids):
+    """The user's unflushed like states for several lists, as {list_id: liked}"""
+    entries = _read_user_states(user_id)
+    return {list_id: entries[list_id][0] for list_id in list_ids if list_id in entries}
+
+
+def apply_pending(lists, user):
+    """
+    Evaluate `lists` (annotated by with_viewer_flags) and overlay the user's
+    unflushed like states on their `liked` flags, with one cache read.
+    """
+    lists = list(lists)
+    if enabled() and user.is_authenticated and lists:
+        states = pending_states(user.pk, [list_obj.pk for list_obj in lists])
+        for list_obj in lists:
+            if list_obj.pk in states:
+                list_obj.liked = states[list_obj.pk]
+    return lists
+
+
+def record_toggle(user_id, list_id, liked):
+    """Append the new state to the log and make it visible to the user"""
+    record_states(user_id, {list_id: liked})
+
+
+def record_states(user_id, states):
+    """
+    Append several {list_id: liked} states in one write and make them visible
+    to the user. Two processes recording for the same user at the same moment
+    can lose one cache update; the log still has it, so the user only sees
+    the old state until the next flush.
+    """
+    if not states:
+        return
+    _append(b''.join(f"{list_id} {user_id} {int(liked)}\n".encode() for list_id, liked in states.items()))
+    now = time.time()
+    entries = _read_user_states(user_id)
+    entries.update({list_id: (liked, now) for list_id, liked in states.items()})
+    cache.set(_states_key(user_id), entries, buffer_setting('STATE_TIMEOUT'))
+
+
+def _append(data):
+    path = buffer_setting('LOG_PATH')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    while True:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            try:
+                rotated = os.fstat(fd).st_ino != os.stat(path).st_ino
+            except FileNotFoundError:
+                rotated = True
+            if rotated:
+                # The flusher renamed the log after we opened it; reopen
+                continue
+            os.write(fd, data)
+            if buffer_setting('FSYNC'):
+                os.fsync(fd)
+            return
+        finally:
+            os.close(fd)
+
+
+def _read_states(paths):
+    """Replay rotated logs in order; later entries win"""
+    states = {}
+    for path in paths:
+        with open(path, 'rb') as f:
+            # Wait for appends that started before the rotation
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            for line in f:
+                try:
+                    list_id, user_id, liked = line.split()
+                    states[(int(list_id), int(user_id))] = liked == b'1'
+                except ValueError:
+                    logger.warning(f"Skipping malformed like log line in {path}: {line!r}")
+    return states
+
+
+def _apply(states):
+    list_ids = {list_id for list_id, _ in states}
+    user_ids = {user_id for _, user_id in states}
+    # Lists or users deleted since the toggle are dropped
+    lists = set(List.objects.filter(pk__in=list_ids).values_list('pk', flat=True))
+    users = set(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+
+    likes = []
+    unlikes = defaultdict(list)
+    for (list_id, user_id), liked in states.items():
+        if list_id not in lists or user_id not in users:
+            continue
+        if liked:
+            likes.append(Like(user_id=user_id, list_id=list_id))
+        else:
+            unlikes[list_id].append(user_id)
+
+    with transaction.atomic():
+        Like.objects.bulk_create(likes, ignore_conflicts=True, batch_size=1000)
+        for list_id, unliked_by in unlikes.items():
+            Like.objects.filter(list_id=list_id, user_id__in=unliked_by).delete()
+        List.objects.filter(pk__in=lists).recount()
+    return len(likes), sum(len(u) for u in unlikes.values()), len(lists)
+
+
+def flush():
+    """
+    Apply all buffered toggles to the database.
+    Returns (likes, unlikes, lists) counts, or None if another flush is running.
+    """
+    path = buffer_setting('LOG_PATH')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f'{path}.lock', 'w') as lock:
+        try:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+
+        if os.path.exists(path):
+            os.rename(path, f'{path}.{time.time_ns():020d}.flushing')
+        # Leftovers of an interrupted flush sort before the log just rotated
+        rotated = sorted(glob.glob(f'{glob.escape(path)}.*.flushing'))
+        if not rotated:
+            return (0, 0, 0)
+
+        states = _read_states(rotated)
+        result = _apply(states) if states else (0, 0, 0)
+        for rotated_path in rotated:
+            os.remove(rotated_path)
+        return result
@@ -0,0 +1,109 @@
+import statistics
+import time
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.template import engines
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from lists import views
+from lists.models import Like, List
+
+# Median time to render 1,000 cards; about 3x what a laptop needs today
+DEFAULT_BUDGET_MS = 500
+
+# Queries per render of the explore page, whatever the number of cards (one today)
+DEFAULT_MAX_QUERIES = 2
+
+class Command(BaseCommand):
+    help = ('Renders the explore page for N saved lists and reports the time per card '
+            'and the queries per render; the lists are rolled back afterwards')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1000, help='Number of cards to render')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of timed renders')
+        parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                            help=f'Fail if the median render of all cards takes longer than this (default {DEFAULT_BUDGET_MS:.0f}, 0 disables)')
+        parser.add_argument('--max-queries', type=int, default=DEFAULT_MAX_QUERIES,
+                            help=f'Fail if a render runs more queries than this (default {DEFAULT_MAX_QUERIES})')
+        parser.add_argument('--authenticated', action='store_true',
+                            help='Render as a logged-in viewer (cards show like/fork state)')
+
+    def handle(self, *args, **options):
+        if options['count'] < 1 or options['repeat'] < 1:
+            raise CommandError('--count and --repeat must be positive')
+
+        # Real rows rendered through the real view, so per-row queries show up
+        # in the count; nothing written here outlives the benchmark
+        with transaction.atomic():
+            try:
+                viewer = self.create_lists(options['count'])
+                self.benchmark(viewer if options['authenticated'] else AnonymousUser(), options)
+            finally:
+                transaction.set_rollback(True)
+
+    def create_lists(self, count):
+        owner = User.objects.create(username='benchmark-owner')
+        viewer = User.objects.create(username='benchmark-viewer')
+        lists = List.objects.bulk_create(
+            List(
+                title=f'Sample list {i}',
+                content='\n'.join(f'{n}. Item {n} of list {i}' for n in range(1, 11)),
+                owner=owner,
+                is_public=True,
+            )
+            for i in range(count)
+        )
+        Like.objects.bulk_create(Like(user=viewer, list=list_obj) for list_obj in lists[::3])
+        # Private forks, so they add fork state without adding cards
+        List.objects.bulk_create(
+            List(title=list_obj.title, content=list_obj.content, owner=viewer,
+                 is_public=False, original_list=list_obj)
+            for list_obj in lists[::5]
+        )
+        List.objects.filter(owner=owner).recount()
+        return viewer
+
+    def render(self, request):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = views.explore(request)
+            elapsed = (time.perf_counter() - start) * 1000
+        if response.status_code != 200:
+            raise CommandError(f'Explore page answered {response.status_code}')
+        return elapsed, len(queries)
+
+    def benchmark(self, user, options):
+        count = options['count']
+        request = RequestFactory().get('/explore/')
+        request.user = user
+
+        loaders = engines['django'].engine.loaders
+        self.stdout.write(f'Template loaders: {loaders}')
+
+        elapsed, _ = self.render(request)
+        self.stdout.write(f'First render (includes compile): {elapsed:.1f} ms')
+
+        timings = []
+        query_counts = set()
+        for _ in range(options['repeat']):
+            elapsed, queries = self.render(request)
+            timings.append(elapsed)
+            query_counts.add(queries)
+
+        median = statistics.median(timings)
+        self.stdout.write(f'Cards: {count}, renders: {len(timings)}, queries per render: {max(query_counts)}')
+        self.stdout.write(f'Median: {median:.1f} ms ({median * 1000 / count:.1f} us/card), '
+                          f'best: {min(timings):.1f} ms, worst: {max(timings):.1f} ms')
+
+        if max(query_counts) > options['max_queries']:
+            raise CommandError(
+                f'A render ran {max(query_counts)} queries, more than {options["max_queries"]}; '
+                f'look for per-card queries in the grid template'
+            )
+        budget = options['budget_ms']
+        if budget:
+            if median > budget:
+                raise CommandError(f'Median render {median:.1f} ms exceeds budget of {budget:.1f} ms')
+            self.stdout.write(self.style.SUCCESS(f'Within budget of {budget:.1f} ms'))
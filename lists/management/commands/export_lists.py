@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from lists.models import List
+from lists.transfer import export_records, gzip_chunks, ndjson_lines
+import sys
+
+class Command(BaseCommand):
+    help = 'Exports lists as NDJSON (one list per line), streaming from the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='-',
+                            help="Output file, or '-' for stdout")
+        parser.add_argument('--gzip', action='store_true',
+                            help='Gzip-compress the output')
+        parser.add_argument('--owner', help='Only export lists owned by this username')
+        parser.add_argument('--public-only', action='store_true',
+                            help='Only export public lists')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Rows fetched from the database per round-trip')
+
+    def handle(self, *args, **options):
+        lists = List.objects.all()
+        if options['owner']:
+            lists = lists.filter(owner__username=options['owner'])
+        if options['public_only']:
+            lists = lists.filter(is_public=True)
+
+        chunks = ndjson_lines(export_records(lists, chunk_size=options['chunk_size']))
+        if options['gzip']:
+            chunks = gzip_chunks(chunks)
+
+        to_stdout = options['output'] == '-'
+        try:
+            out = sys.stdout.buffer if to_stdout else open(options['output'], 'wb')
+        except OSError as e:
+            raise CommandError(str(e))
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if to_stdout:
+                out.flush()
+            else:
+                out.close()
+
+        if not to_stdout:
+            self.stdout.write(self.style.SUCCESS(f"Exported lists to {options['output']}"))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from lists import likebuffer
+import time
+
+class Command(BaseCommand):
+    help = 'Applies buffered like toggles (LIKE_BUFFER) to the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Keep running and flush every INTERVAL seconds '
+                                 '(defaults to LIKE_BUFFER FLUSH_INTERVAL when --loop is given)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running instead of flushing once')
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        loop = options['loop'] or interval is not None
+        if interval is None:
+            interval = likebuffer.buffer_setting('FLUSH_INTERVAL')
+
+        while True:
+            start = time.monotonic()
+            result = likebuffer.flush()
+            if result is None:
+                self.stdout.write('Another flush is in progress')
+            elif any(result):
+                likes, unlikes, lists = result
+                self.stdout.write(
+                    f'Flushed {likes} like(s) and {unlikes} unlike(s) across {lists} list(s) '
+                    f'in {time.monotonic() - start:.3f}s'
+                )
+            if not loop:
+                break
+            time.sleep(max(0, interval - (time.monotonic() - start)))
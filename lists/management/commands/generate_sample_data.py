@@ -111,4 +111,7 @@ class Command(BaseCommand):
                 )
                 self.stdout.write(f'Created fork of list: {forked_list.title} for user {user.username}')
 
+        # Forks were created directly, so bring the fork counters up to date
+        List.objects.recount()
+
         self.stdout.write(self.style.SUCCESS('Successfully generated sample data')) 
\ No newline at end of file
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from lists.transfer import ListImporter
+import gzip
+import sys
+
+class Command(BaseCommand):
+    help = 'Imports lists from an NDJSON export (plain or gzip-compressed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help="NDJSON file (.gz is decompressed), or '-' for stdin")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Lists inserted per bulk_create')
+        parser.add_argument('--keep-ids', action='store_true',
+                            help='Reuse the exported ids (for restoring into an empty database)')
+        parser.add_argument('--create-users', action='store_true',
+                            help='Create missing owners with unusable passwords instead of skipping their lists')
+
+    def handle(self, *args, **options):
+        path = options['input']
+        try:
+            if path == '-':
+                source = sys.stdin.buffer
+            elif path.endswith('.gz'):
+                source = gzip.open(path, 'rb')
+            else:
+                source = open(path, 'rb')
+        except OSError as e:
+            raise CommandError(str(e))
+
+        importer = ListImporter(
+            batch_size=options['batch_size'],
+            keep_ids=options['keep_ids'],
+            create_users=options['create_users'],
+        )
+        try:
+            stats = importer.run(source)
+        finally:
+            if source is not sys.stdin.buffer:
+                source.close()
+
+        for error in stats.errors[:20]:
+            self.stderr.write(error)
+        if stats.error_count > 20:
+            self.stderr.write(f'... and {stats.error_count - 20} more')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {stats.created} lists ({stats.forks_linked} fork links, '
+            f'{stats.users_created} users created, {stats.skipped} skipped)'
+        ))
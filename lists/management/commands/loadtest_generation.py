@@ -0,0 +1,154 @@
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+TERMINAL_STATUSES = ('succeeded', 'failed')
+
+PROMPT_SUBJECTS = (
+    'camping gear', 'healthy breakfasts', 'classic movies', 'houseplants',
+    'weekend habits', 'board games', 'road trip snacks', 'podcast topics',
+    'rainy day activities', 'kitchen gadgets', 'study tips', 'hiking trails',
+)
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, min(len(sorted_values), round(p / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[rank - 1]
+
+
+class LoadClient:
+    """One logged-in session that submits generations and polls them to completion"""
+
+    def __init__(self, base_url, username, password, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        login_url = f'{self.base_url}/accounts/login/'
+        self.session.get(login_url, timeout=10)
+        response = self.session.post(login_url, data={
+            'username': username,
+            'password': password,
+            'csrfmiddlewaretoken': self.session.cookies.get('csrftoken', ''),
+        }, headers={'Referer': login_url}, allow_redirects=False, timeout=10)
+        if response.status_code != 302 or 'sessionid' not in self.session.cookies:
+            raise CommandError(f'Could not log in as {username} (HTTP {response.status_code})')
+
+    def generate(self, prompt):
+        """(outcome, seconds from submit to a final status)"""
+        start = time.perf_counter()
+        response = self.session.post(
+            f'{self.base_url}/create/generate/',
+            data={'title': prompt},
+            headers={
+                'X-Requested-With': 'XMLHttpRequest',
+                'X-CSRFToken': self.session.cookies.get('csrftoken', ''),
+                'Idempotency-Key': uuid.uuid4().hex,
+            },
+            timeout=10,
+        )
+        if response.status_code == 429:
+            return 'rejected', time.perf_counter() - start
+        if response.status_code != 202:
+            return f'http_{response.status_code}', time.perf_counter() - start
+
+        payload = response.json()
+        while payload['status'] not in TERMINAL_STATUSES:
+            if time.perf_counter() - start > self.timeout:
+                return 'timeout', time.perf_counter() - start
+            time.sleep(payload.get('poll_after_ms', 500) / 1000)
+            payload = self.session.get(f"{self.base_url}{payload['status_url']}", timeout=10).json()
+        return payload['status'], time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = ('Drives create/generate/ on a running server (e.g. against run_openai_stub) '
+            'and reports throughput and tail latency')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the running app')
+        parser.add_argument('--requests', type=int, default=100, help='Total generations to submit')
+        parser.add_argument('--concurrency', type=int, default=10, help='Concurrent clients')
+        parser.add_argument('--users', type=int, default=10,
+                            help='Number of loadtest-N users to spread requests over (created if missing)')
+        parser.add_argument('--password', default='loadtest-password')
+        parser.add_argument('--prompt-pool', type=int, default=0,
+                            help='Draw prompts from this many distinct prompts (0 = every prompt unique, '
+                                 'which bypasses the prompt cache)')
+        parser.add_argument('--timeout', type=float, default=120, help='Give up on a job after this many seconds')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1 or options['users'] < 1:
+            raise CommandError('--requests, --concurrency and --users must be positive')
+
+        usernames = [f'loadtest-{i}' for i in range(options['users'])]
+        for username in usernames:
+            user, created = User.objects.get_or_create(username=username)
+            if created or not user.check_password(options['password']):
+                user.set_password(options['password'])
+                user.save()
+
+        rng = random.Random(options['seed'])
+
+        def make_prompt(n):
+            # A random token per prompt keeps distinct prompts far apart for the prompt cache
+            return f'{PROMPT_SUBJECTS[n % len(PROMPT_SUBJECTS)]} {rng.getrandbits(64):016x}'
+
+        if options['prompt_pool']:
+            distinct = [make_prompt(n) for n in range(options['prompt_pool'])]
+            prompts = [rng.choice(distinct) for _ in range(options['requests'])]
+        else:
+            prompts = [make_prompt(n) for n in range(options['requests'])]
+
+        self.stdout.write(f"Logging in {options['concurrency']} client(s) at {options['url']}")
+        clients = [
+            LoadClient(options['url'], usernames[i % len(usernames)], options['password'], options['timeout'])
+            for i in range(options['concurrency'])
+        ]
+
+        results = []
+        results_lock = threading.Lock()
+        next_prompt = iter(prompts)
+        prompt_lock = threading.Lock()
+
+        def run(client):
+            while True:
+                with prompt_lock:
+                    prompt = next(next_prompt, None)
+                if prompt is None:
+                    return
+                try:
+                    outcome = client.generate(prompt)
+                except requests.RequestException as e:
+                    outcome = (type(e).__name__, 0.0)
+                with results_lock:
+                    results.append(outcome)
+
+        self.stdout.write(f"Submitting {len(prompts)} generation(s) with concurrency {len(clients)}")
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(clients)) as pool:
+            list(pool.map(run, clients))
+        elapsed = time.perf_counter() - start
+
+        outcomes = Counter(outcome for outcome, _ in results)
+        latencies = sorted(seconds for outcome, seconds in results if outcome == 'succeeded')
+        self.stdout.write(f'Elapsed: {elapsed:.1f} s')
+        self.stdout.write('Outcomes: ' + ', '.join(f'{name}={count}' for name, count in outcomes.most_common()))
+        self.stdout.write(f"Throughput: {outcomes['succeeded'] / elapsed:.2f} succeeded/s "
+                          f"({len(results) / elapsed:.2f} submitted/s)")
+        if latencies:
+            self.stdout.write(
+                'Latency (submit to result): '
+                + ', '.join(f'p{p}={percentile(latencies, p):.2f}s' for p in (50, 90, 95, 99))
+                + f', max={latencies[-1]:.2f}s'
+            )
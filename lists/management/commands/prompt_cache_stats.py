@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+from lists.models import PromptCacheEntry
+from lists.promptcache import PromptIndex, cache_setting, normalize, prompt_key
+
+class Command(BaseCommand):
+    help = 'Reports prompt cache hit rates and shows nearest cached prompts for tuning the threshold'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--probe', action='append', default=[],
+                            help='Show the nearest cached prompts for this prompt (repeatable)')
+        parser.add_argument('--threshold', type=float, default=None,
+                            help='Threshold to evaluate probes against (defaults to PROMPT_CACHE THRESHOLD)')
+        parser.add_argument('--top', type=int, default=10,
+                            help='Number of entries / neighbours to show')
+
+    def handle(self, *args, **options):
+        threshold = options['threshold'] if options['threshold'] is not None else cache_setting('THRESHOLD')
+        entries = PromptCacheEntry.objects.count()
+        hits = PromptCacheEntry.objects.aggregate(total=Sum('hits'))['total'] or 0
+        # Every miss that generated successfully stored an entry, so this
+        # approximates the share of generations served from the cache
+        hit_rate = hits / (hits + entries) if hits + entries else 0.0
+
+        self.stdout.write(f'Entries: {entries}')
+        self.stdout.write(f'Hits: {hits}')
+        self.stdout.write(f'Estimated hit rate: {hit_rate:.1%} '
+                          f'(upstream calls reduced {(hits + entries) / entries if entries else 1:.1f}x)')
+
+        self.stdout.write('\nMost reused prompts:')
+        for entry in PromptCacheEntry.objects.order_by('-hits')[:options['top']]:
+            self.stdout.write(f'  {entry.hits:6d}  {entry.prompt}')
+
+        if options['probe']:
+            index = PromptIndex(threshold=threshold, max_entries=cache_setting('MAX_ENTRIES'), refresh_interval=0)
+            prompts = dict(PromptCacheEntry.objects.values_list('pk', 'prompt'))
+            for probe in options['probe']:
+                self.stdout.write(f'\nProbe: {probe!r} -> {prompt_key(normalize(probe))!r}')
+                for score, pk in index.nearest(probe, limit=options['top']):
+                    marker = 'HIT ' if index.is_match(probe, score, pk) else '    '
+                    self.stdout.write(f'  {marker}{score:.3f}  {prompts.get(pk, "?")}')
@@ -0,0 +1,97 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from lists.jobs import claim_job, job_setting, run_job
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Upper bound (seconds) for the back-off after a worker error
+MAX_ERROR_BACKOFF = 30
+
+
+def worker_loop(worker_id, stop, poll_interval, burst):
+    """Claim and run jobs until stopped (or, in burst mode, until the queue is empty)"""
+    failures = 0
+    try:
+        while not stop.is_set():
+            try:
+                job = claim_job(worker_id)
+                if job is not None:
+                    run_job(job)
+            except Exception:
+                # e.g. "database is locked" with several SQLite writers. Back off
+                # and keep the thread alive; a job left RUNNING is reclaimed once
+                # its lease expires.
+                failures += 1
+                delay = min(MAX_ERROR_BACKOFF, poll_interval * 2 ** min(failures, 10))
+                delay *= random.uniform(0.5, 1.5)
+                logger.exception(f"Worker {worker_id} error, retrying in {delay:.1f}s")
+                connection.close_if_unusable_or_obsolete()
+                stop.wait(delay)
+                continue
+            failures = 0
+            if job is None:
+                if burst:
+                    return
+                stop.wait(poll_interval)
+    finally:
+        connection.close()
+
+
+def run_process(threads, poll_interval, burst):
+    """Run `threads` worker loops in this process"""
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda *args: stop.set())
+
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for i in range(threads):
+            pool.submit(worker_loop, f"{prefix}:{i}", stop, poll_interval, burst)
+
+
+class Command(BaseCommand):
+    help = 'Runs worker processes that execute queued list generation jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=job_setting('PROCESSES'),
+                            help='Number of worker processes')
+        parser.add_argument('--threads', type=int, default=job_setting('THREADS'),
+                            help='Worker threads per process')
+        parser.add_argument('--poll-interval', type=float, default=job_setting('POLL_INTERVAL'),
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        processes = max(1, options['processes'])
+        threads = max(1, options['threads'])
+        run_args = (threads, options['poll_interval'], options['burst'])
+        self.stdout.write(f'Starting {processes} process(es) x {threads} thread(s)')
+
+        if processes == 1:
+            run_process(*run_args)
+        else:
+            # Forked children must not share the parent's database connections
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            children = [context.Process(target=run_process, args=run_args) for _ in range(processes)]
+            for child in children:
+                child.start()
+            try:
+                for child in children:
+                    child.join()
+            except KeyboardInterrupt:
+                for child in children:
+                    child.terminate()
+                for child in children:
+                    child.join()
+
+        self.stdout.write(self.style.SUCCESS('Generation workers stopped'))
@@ -0,0 +1,69 @@
+import json
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+from lists.openai_stub import LATENCY_DISTRIBUTIONS, StubConfig, make_server
+
+def _interrupt(*args):
+    raise KeyboardInterrupt
+
+class Command(BaseCommand):
+    help = 'Runs a local OpenAI-compatible chat-completions stub for offline load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument('--latency', type=float, default=1.0,
+                            help='Median response time in seconds (mean for exponential)')
+        parser.add_argument('--distribution', choices=LATENCY_DISTRIBUTIONS, default='lognormal',
+                            help='Latency distribution')
+        parser.add_argument('--spread', type=float, default=0.5,
+                            help='Lognormal sigma, or +/- fraction of the latency for uniform')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Fraction of requests answered with 500')
+        parser.add_argument('--rate-limit-rate', type=float, default=0.0,
+                            help='Fraction of requests answered with 429')
+        parser.add_argument('--retry-after', type=int, default=1,
+                            help='Retry-After seconds sent with 429 responses')
+        parser.add_argument('--max-concurrency', type=int, default=0,
+                            help='Answer 429 beyond this many requests in flight (0 = unlimited)')
+        parser.add_argument('--payloads', help='JSON file with a list of {"title", "content"} payloads')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for repeatable runs')
+
+    def handle(self, *args, **options):
+        payloads = None
+        if options['payloads']:
+            try:
+                with open(options['payloads']) as f:
+                    payloads = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read payloads: {str(e)}")
+            if not isinstance(payloads, list) or not payloads:
+                raise CommandError('Payloads file must contain a non-empty JSON list')
+
+        config = StubConfig(
+            latency=options['latency'],
+            distribution=options['distribution'],
+            spread=options['spread'],
+            error_rate=options['error_rate'],
+            rate_limit_rate=options['rate_limit_rate'],
+            retry_after=options['retry_after'],
+            max_concurrency=options['max_concurrency'],
+            payloads=payloads,
+            seed=options['seed'],
+        )
+        server = make_server(options['host'], options['port'], config)
+        self.stdout.write(
+            f"OpenAI stub listening on http://{options['host']}:{options['port']}/v1 "
+            f"({options['distribution']} latency ~{options['latency']}s, "
+            f"{options['rate_limit_rate']:.0%} 429s, {options['error_rate']:.0%} 500s)"
+        )
+        self.stdout.write(f"Run the app with OPENAI_BASE_URL=http://{options['host']}:{options['port']}/v1")
+        signal.signal(signal.SIGTERM, _interrupt)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f'Stub stopped: {config.stats}')
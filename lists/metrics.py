@@ -0,0 +1,384 @@
+"""
+In-process metrics registry exposed in the Prometheus text format.
+
+Counters and histograms are plain dicts updated under a lock, so recording
+costs about a microsecond. Each process periodically writes a snapshot of
+its own values to METRICS['DIR'] (at most every FLUSH_INTERVAL seconds, from
+whichever request crosses the interval), and `/metrics` sums the snapshots of
+every process plus its own live values. That keeps the output correct under a
+pre-fork server without shared memory: a worker that forks from a preloaded
+parent starts from zero under its own snapshot file.
+
+Snapshots of exited processes are folded into a single `merged.json` so
+counters never go backwards while the directory stays small: gunicorn's
+master does it when a worker exits (gunicorn.conf.py `child_exit`), and a
+scrape does it for any other process found dead (management commands, tests).
+Clear the directory when deploying, as with prometheus_client's multiprocess
+mode.
+"""
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; dead snapshots are then kept as they are
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+METRICS_DEFAULTS = {
+    'DIR': os.path.join(settings.BASE_DIR, 'var', 'metrics'),
+    'FLUSH_INTERVAL': 5,
+    'TOKEN': None,
+    'ALLOWED_IPS': (),
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LLM_LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 16, 32, 64)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+QUEUE_WAIT_BUCKETS = (0, 0.1, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+SIMILARITY_BUCKETS = tuple(round(i * 0.05, 2) for i in range(1, 21))
+
+# Totals of processes that have exited, kept next to the live snapshots
+MERGED_SNAPSHOT = 'merged.json'
+
+# Anything else is counted as 'other', so clients cannot add label values
+HTTP_METHODS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'})
+
+
+def metrics_setting(name):
+    return getattr(settings, 'METRICS', {}).get(name, METRICS_DEFAULTS[name])
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        with self.registry.lock:
+            self.registry.check_pid()
+            self.values[labels] = self.values.get(labels, 0) + amount
+        self.registry.maybe_flush()
+
+    def dump(self):
+        return self.dump_values(self.values)
+
+    def dump_values(self, values):
+        return [[list(labels), value] for labels, value in values.items()]
+
+    def merge(self, into, dumped):
+        for labels, value in dumped:
+            labels = tuple(labels)
+            into[labels] = into.get(labels, 0) + value
+
+    def samples(self, values):
+        for labels, value in sorted(values.items()):
+            yield self.name, self._labels(labels), value
+
+    def _labels(self, labels, extra=()):
+        return tuple(zip(self.labelnames, labels)) + tuple(extra)
+
+
+class Histogram(Counter):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        with self.registry.lock:
+            self.registry.check_pid()
+            state = self.values.get(labels)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                state = self.values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+        self.registry.maybe_flush()
+
+    def dump_values(self, values):
+        return [[list(labels), [list(state[0]), state[1], state[2]]] for labels, state in values.items()]
+
+    def quantile(self, state, q):
+        """
+        Upper bound of the bucket holding the q-quantile of a collected state,
+        or None when it is empty or the quantile lies past the last bucket
+        """
+        counts, _, count = state
+        cumulative = 0
+        for bound, bucket in zip(self.buckets, counts):
+            cumulative += bucket
+            if count and cumulative >= q * count:
+                return bound
+        return None
+
+    def merge(self, into, dumped):
+        for labels, (counts, total, count) in dumped:
+            labels = tuple(labels)
+            state = into.setdefault(labels, [[0] * len(self.buckets), 0.0, 0])
+            if len(counts) != len(self.buckets):
+                continue
+            state[0] = [a + b for a, b in zip(state[0], counts)]
+            state[1] += total
+            state[2] += count
+
+    def samples(self, values):
+        for labels, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                yield f'{self.name}_bucket', self._labels(labels, [('le', _format_value(bound))]), cumulative
+            yield f'{self.name}_bucket', self._labels(labels, [('le', '+Inf')]), count
+            yield f'{self.name}_sum', self._labels(labels), total
+            yield f'{self.name}_count', self._labels(labels), count
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self._pid = os.getpid()
+        self._started = time.time_ns()
+        self._last_flush = time.monotonic()
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def check_pid(self):
+        """Forget values inherited from the parent after a fork (lock held)"""
+        pid = os.getpid()
+        if pid != self._pid:
+            self._pid = pid
+            self._started = time.time_ns()
+            self._last_flush = time.monotonic()
+            for metric in self.metrics.values():
+                metric.values = {}
+
+    def _snapshot_path(self):
+        # Start time in the name so a reused pid never overwrites a dead worker's totals
+        return os.path.join(metrics_setting('DIR'), f'{self._pid}-{self._started}.json')
+
+    def _dump(self):
+        return {name: metric.dump() for name, metric in self.metrics.items() if metric.values}
+
+    def maybe_flush(self):
+        if time.monotonic() - self._last_flush >= metrics_setting('FLUSH_INTERVAL'):
+            self.flush()
+
+    def flush(self):
+        """Write this process's values to its snapshot file"""
+        with self.lock:
+            self.check_pid()
+            self._last_flush = time.monotonic()
+            data = self._dump()
+            path = self._snapshot_path()
+        if not data:
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Could not write metrics snapshot {path}: {str(e)}")
+
+    def _load(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _merge(self, dumps):
+        merged = {name: {} for name in self.metrics}
+        for dump in dumps:
+            for name, dumped in dump.items():
+                metric = self.metrics.get(name)
+                if metric is not None:
+                    metric.merge(merged[name], dumped)
+        return merged
+
+    def fold_dead_snapshots(self):
+        """
+        Add the snapshots of processes that are no longer running to
+        merged.json and delete them. Returns the number of snapshots folded.
+        """
+        directory = metrics_setting('DIR')
+        if fcntl is None or not os.path.isdir(directory):
+            return 0
+        with open(os.path.join(directory, '.lock'), 'w') as lock:
+            try:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0  # Another process is folding
+            dead = [path for path in self._snapshot_paths(directory) if not _pid_alive(_snapshot_pid(path))]
+            if not dead:
+                return 0
+            merged_path = os.path.join(directory, MERGED_SNAPSHOT)
+            dumps = [self._load(path) or {} for path in [merged_path] + dead]
+            merged = self._merge(dumps)
+            data = {
+                name: self.metrics[name].dump_values(values)
+                for name, values in merged.items() if values
+            }
+            tmp = f'{merged_path}.{os.getpid()}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp, merged_path)
+            for path in dead:
+                os.remove(path)
+        return len(dead)
+
+    def _snapshot_paths(self, directory):
+        """Per-process snapshot files (<pid>-<start>.json)"""
+        return [
+            path for path in glob.glob(os.path.join(directory, '*.json'))
+            if _snapshot_pid(path) is not None
+        ]
+
+    def collect(self):
+        """Values of all processes: snapshot files plus this process's live values"""
+        with self.lock:
+            self.check_pid()
+            own = self._dump()
+            own_path = self._snapshot_path()
+        try:
+            self.fold_dead_snapshots()
+        except OSError as e:
+            logger.warning(f"Could not fold metrics snapshots: {str(e)}")
+        dumps = [own]
+        for path in glob.glob(os.path.join(metrics_setting('DIR'), '*.json')):
+            if path == own_path:
+                continue
+            dump = self._load(path)
+            if dump is not None:
+                dumps.append(dump)
+        return self._merge(dumps)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        merged = self.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for sample, labels, value in metric.samples(merged[name]):
+                if labels:
+                    rendered = ','.join(f'{key}="{_escape(val)}"' for key, val in labels)
+                    lines.append(f'{sample}{{{rendered}}} {_format_value(value)}')
+                else:
+                    lines.append(f'{sample} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _snapshot_pid(path):
+    name = os.path.basename(path)[:-len('.json')]
+    pid, _, started = name.partition('-')
+    return int(pid) if pid.isdigit() and started.isdigit() else None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Running, under another user
+    return True
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else repr(value)
+    return str(value)
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+HTTP_REQUESTS = registry.counter(
+    'listlab_http_requests_total', 'HTTP requests by URL name, method and status',
+    ('view', 'method', 'status'),
+)
+HTTP_LATENCY = registry.histogram(
+    'listlab_http_request_duration_seconds', 'Time spent producing a response, by URL name',
+    ('view',),
+)
+DB_QUERIES = registry.histogram(
+    'listlab_db_queries_per_request', 'Database queries executed per request, by URL name',
+    ('view',), buckets=QUERY_COUNT_BUCKETS,
+)
+LLM_REQUESTS = registry.counter(
+    'listlab_llm_requests_total', 'Upstream chat-completions calls by model and HTTP status',
+    ('model', 'status'),
+)
+LLM_LATENCY = registry.histogram(
+    'listlab_llm_request_duration_seconds', 'Upstream chat-completions latency by model',
+    ('model',), buckets=LLM_LATENCY_BUCKETS,
+)
+LLM_TOKENS = registry.counter(
+    'listlab_llm_tokens_total', 'Tokens reported by the upstream API, by model and kind',
+    ('model', 'kind'),
+)
+LLM_HEDGES = registry.counter(
+    'listlab_llm_hedges_total', 'Hedged second calls by model and which call answered first',
+    ('model', 'winner'),
+)
+LLM_FALLBACKS = registry.counter(
+    'listlab_llm_fallbacks_total', 'Model tiers that failed and handed over to the next tier',
+    ('model',),
+)
+GENERATION_ADMISSIONS = registry.counter(
+    'listlab_generation_admissions_total',
+    'Scheduler decisions by outcome (admitted/throttled/shed/timed_out)',
+    ('outcome',),
+)
+GENERATION_QUEUE_WAIT = registry.histogram(
+    'listlab_generation_queue_wait_seconds', 'Time admitted generations waited for a scheduler slot',
+    buckets=QUEUE_WAIT_BUCKETS,
+)
+PROMPT_SIMILARITY = registry.histogram(
+    'listlab_prompt_cache_similarity', 'Best-match similarity of prompt cache lookups, for tuning THRESHOLD',
+    buckets=SIMILARITY_BUCKETS,
+)
+CACHE_REQUESTS = registry.counter(
+    'listlab_cache_requests_total', 'Cache lookups by cache and result (hit/miss)',
+    ('cache', 'result'),
+)
+LIKES = registry.counter(
+    'listlab_likes_total', 'Like state changes by action (like/unlike)',
+    ('action',),
+)
+FORKS = registry.counter(
+    'listlab_forks_total', 'Lists forked',
+)
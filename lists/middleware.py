@@ -0,0 +1,41 @@
+import time
+
+from django.db import connection
+
+from . import metrics
+
+
+class QueryCounter:
+    """connection.execute_wrapper hook that only counts queries"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """
+    Record request count, latency and database queries per URL name.
+    Place it first in MIDDLEWARE so the timing covers the whole stack.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        queries = QueryCounter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unresolved'
+        method = request.method if request.method in metrics.HTTP_METHODS else 'other'
+        metrics.HTTP_REQUESTS.inc(view, method, str(response.status_code))
+        metrics.HTTP_LATENCY.observe(elapsed, view)
+        metrics.DB_QUERIES.observe(queries.count, view)
+        return response
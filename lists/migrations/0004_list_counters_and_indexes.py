@@ -0,0 +1,60 @@
+# Generated by Django 5.1.4 on 2026-10-19 18:03
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counts(apps, schema_editor):
+    List = apps.get_model('lists', 'List')
+    Like = apps.get_model('lists', 'Like')
+    likes = (
+        Like.objects.filter(list=OuterRef('pk'))
+        .order_by().values('list')
+        .annotate(count=Count('pk')).values('count')
+    )
+    forks = (
+        List.objects.filter(original_list=OuterRef('pk'))
+        .order_by().values('original_list')
+        .annotate(count=Count('pk')).values('count')
+    )
+    List.objects.update(
+        like_count=Coalesce(Subquery(likes), 0),
+        fork_count=Coalesce(Subquery(forks), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lists', '0003_generationjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='list',
+            name='fork_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='list',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counts, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='list',
+            index=models.Index(fields=['created_at'], name='lists_list_created_41ba05_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='list',
+            index=models.Index(fields=['is_public', 'created_at'], name='lists_list_is_publ_91f5b0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='list',
+            index=models.Index(django.db.models.functions.text.Lower('title'), name='lists_list_title_lower_idx'),
+        ),
+    ]
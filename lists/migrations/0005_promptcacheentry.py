@@ -0,0 +1,25 @@
+# Generated by Django 5.1.4 on 2026-10-19 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lists', '0004_list_counters_and_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromptCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prompt', models.TextField()),
+                ('normalized', models.CharField(db_index=True, max_length=500)),
+                ('result', models.JSONField()),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_hit_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-19 18:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lists', '0005_promptcacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='deferrals',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,7 +1,13 @@
+import uuid
 from django.db import models
+from django.db.models import Count, Exists, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Lower
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from django.utils import timezone
+from .caching import invalidate_cached_user
 
 class Like(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -14,6 +20,51 @@ class Like(models.Model):
     def __str__(self):
         return f"{self.user.username} likes {self.list.title}"
 
+class ListQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """Lists the given user may see: public ones plus their own"""
+        if user.is_authenticated:
+            return self.filter(Q(is_public=True) | Q(owner=user))
+        return self.filter(is_public=True)
+
+    def search(self, query):
+        """Case-insensitive match on title, description, content or tags"""
+        return self.filter(
+            Q(title__icontains=query) |
+            Q(description__icontains=query) |
+            Q(content__icontains=query) |
+            Q(tags__icontains=query)
+        )
+
+    def recount(self):
+        """
+        Recompute the like_count/fork_count columns from the Like and fork
+        rows in a single set-based UPDATE; returns the number of lists updated.
+        """
+        likes = (
+            Like.objects.filter(list=OuterRef('pk'))
+            .order_by().values('list')
+            .annotate(count=Count('pk')).values('count')
+        )
+        forks = (
+            List.objects.filter(original_list=OuterRef('pk'))
+            .order_by().values('original_list')
+            .annotate(count=Count('pk')).values('count')
+        )
+        return self.update(
+            like_count=Coalesce(Subquery(likes), 0),
+            fork_count=Coalesce(Subquery(forks), 0),
+        )
+
+    def with_viewer_flags(self, user):
+        """Annotate whether the given user has liked / forked each list"""
+        if not user.is_authenticated:
+            return self.annotate(liked=Value(False), forked=Value(False))
+        return self.annotate(
+            liked=Exists(Like.objects.filter(list=OuterRef('pk'), user=user)),
+            forked=Exists(List.objects.filter(original_list=OuterRef('pk'), owner=user)),
+        )
+
 class List(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField()
@@ -26,9 +77,21 @@ class List(models.Model):
     original_list = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='forks')
     prompt = models.TextField()  # Store the original prompt used to generate the list
     liked_by = models.ManyToManyField(User, through='Like', related_name='liked_lists')
+    # Denormalized counters kept in step by the like/fork code paths;
+    # ListQuerySet.recount() repairs any drift (e.g. after users are deleted)
+    like_count = models.PositiveIntegerField(default=0)
+    fork_count = models.PositiveIntegerField(default=0)
+
+    objects = ListQuerySet.as_manager()
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['is_public', 'created_at']),
+            # Backs the case-insensitive title prefix search in the admin
+            models.Index(Lower('title'), name='lists_list_title_lower_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -45,6 +108,7 @@ class List(models.Model):
             original_list=self,
             prompt=self.prompt
         )
+        List.objects.filter(pk=self.pk).update(fork_count=F('fork_count') + 1)
         return forked_list
 
 class UserProfile(models.Model):
@@ -55,6 +119,67 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"{self.user.username}'s profile"
 
+class GenerationJob(models.Model):
+    """A list generation request processed by the run_generation_workers command"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='generation_jobs')
+    prompt = models.TextField()
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    deferrals = models.PositiveIntegerField(default=0)  # Times put back without running (rate limits, load)
+    run_after = models.DateTimeField(default=timezone.now)  # Earliest time a worker may claim it
+    locked_by = models.CharField(max_length=100, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)  # Start of the latest attempt
+    finished_at = models.DateTimeField(null=True, blank=True)
+    run_seconds = models.FloatField(null=True, blank=True)  # Duration of the latest attempt
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='unique_generation_job_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.prompt[:50]} ({self.status})"
+
+    @property
+    def queue_seconds(self):
+        """Time between submission and the start of the latest attempt"""
+        if self.started_at is None:
+            return None
+        return (self.started_at - self.created_at).total_seconds()
+
+class PromptCacheEntry(models.Model):
+    """A generated list reused for similar prompts (see lists.promptcache)"""
+    prompt = models.TextField()
+    normalized = models.CharField(max_length=500, db_index=True)
+    result = models.JSONField()
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.prompt[:50]
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     """Create a UserProfile for every new User"""
@@ -65,3 +190,22 @@ def create_user_profile(sender, instance, created, **kwargs):
 def save_user_profile(sender, instance, **kwargs):
     """Save the UserProfile when the User is saved"""
     instance.userprofile.save()
+    invalidate_cached_user(instance.pk)
+
+@receiver(post_save, sender=UserProfile)
+def invalidate_profile_user(sender, instance, **kwargs):
+    """Drop the cached session user when its profile changes"""
+    invalidate_cached_user(instance.user_id)
+
+@receiver(post_delete, sender=List)
+def decrement_fork_count(sender, instance, **kwargs):
+    """Keep the original's fork_count in step when a fork is deleted"""
+    if instance.original_list_id:
+        List.objects.filter(pk=instance.original_list_id, fork_count__gt=0).update(
+            fork_count=F('fork_count') - 1
+        )
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_user(sender, instance, **kwargs):
+    """Drop the cached session user when the User is deleted"""
+    invalidate_cached_user(instance.pk)
@@ -0,0 +1,289 @@
+"""
+Local stand-in for the OpenAI chat-completions API, for offline load tests.
+
+Answers POST /v1/chat/completions (plain and `"stream": true` server-sent
+events) with canned lists in the JSON shape ListGenerationService asks for.
+Latency is drawn from a configurable distribution, and a share of requests
+can be answered with 429 (with Retry-After) or 500 to exercise back-off and
+retries. Point OPENAI_BASE_URL at it, e.g. http://127.0.0.1:8001/v1.
+"""
+import json
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'lognormal', 'exponential')
+
+CANNED_LISTS = [
+    {
+        "title": "Essential Camping Gear",
+        "content": [
+            "Waterproof tent",
+            "Sleeping bag rated for local climate",
+            "Headlamp with extra batteries",
+            "First aid kit",
+            "Water filter or purification tablets",
+        ],
+    },
+    {
+        "title": "Quick Healthy Breakfasts",
+        "content": [
+            "Overnight oats with berries",
+            "Greek yogurt with honey and nuts",
+            "Avocado toast on whole grain bread",
+            "Spinach and feta omelette",
+            "Banana peanut butter smoothie",
+            "Chia pudding with mango",
+        ],
+    },
+    {
+        "title": "Classic Movies Worth Watching",
+        "content": [
+            "Casablanca",
+            "Seven Samurai",
+            "The Godfather",
+            "Singin' in the Rain",
+            "Spirited Away",
+            "Rear Window",
+            "12 Angry Men",
+        ],
+    },
+    {
+        "title": "Weekend Productivity Habits",
+        "content": [
+            "Plan the week on Sunday evening",
+            "Batch small errands together",
+            "Keep one morning free of screens",
+            "Prepare meals for busy days",
+            "Tidy the workspace before Monday",
+        ],
+    },
+    {
+        "title": "Houseplants That Are Hard to Kill",
+        "content": [
+            "Snake plant",
+            "Pothos",
+            "ZZ plant",
+            "Spider plant",
+            "Cast iron plant",
+            "Peace lily",
+            "Rubber plant",
+            "Aloe vera",
+        ],
+    },
+]
+
+
+class StubConfig:
+    """Tunable behaviour of the stub; all delays are in seconds"""
+
+    def __init__(self, latency=1.0, distribution='lognormal', spread=0.5,
+                 error_rate=0.0, rate_limit_rate=0.0, retry_after=1,
+                 max_concurrency=0, stream_chunk_chars=24, payloads=None, seed=None):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {distribution}")
+        self.latency = latency
+        self.distribution = distribution
+        self.spread = spread
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.max_concurrency = max_concurrency
+        self.stream_chunk_chars = stream_chunk_chars
+        self.payloads = payloads or CANNED_LISTS
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.stats = {'requests': 0, 'ok': 0, 'rate_limited': 0, 'errors': 0, 'streamed': 0}
+
+    def sample_latency(self):
+        """Draw a latency with `latency` as its median (mean for exponential)"""
+        with self._lock:
+            if self.distribution == 'fixed':
+                value = self.latency
+            elif self.distribution == 'uniform':
+                value = self.random.uniform(self.latency * (1 - self.spread), self.latency * (1 + self.spread))
+            elif self.distribution == 'lognormal':
+                value = self.latency * math.exp(self.random.gauss(0, self.spread))
+            else:
+                value = self.random.expovariate(1 / self.latency) if self.latency > 0 else 0
+        return max(0.0, value)
+
+    def outcome(self):
+        """'ok', 'rate_limited' or 'error' for a new request"""
+        with self._lock:
+            self.stats['requests'] += 1
+            roll = self.random.random()
+            if self.max_concurrency and self.in_flight >= self.max_concurrency:
+                result = 'rate_limited'
+            elif roll < self.rate_limit_rate:
+                result = 'rate_limited'
+            elif roll < self.rate_limit_rate + self.error_rate:
+                result = 'error'
+            else:
+                result = 'ok'
+                self.in_flight += 1
+            self.stats[result if result != 'error' else 'errors'] += 1
+            return result
+
+    def finished(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def payload_for(self, prompt):
+        # Same prompt -> same list, so runs are repeatable
+        return self.payloads[sum(prompt.encode()) % len(self.payloads)]
+
+
+def _estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'OpenAIStub/1.0'
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            return self._send_json(200, {'object': 'list', 'data': []})
+        self._send_json(404, {'error': {'message': 'Not found', 'type': 'invalid_request_error'}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return self._send_json(400, {'error': {'message': 'Invalid JSON', 'type': 'invalid_request_error'}})
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            return self._send_json(404, {'error': {'message': 'Not found', 'type': 'invalid_request_error'}})
+
+        config = self.server.config
+        outcome = config.outcome()
+        if outcome == 'rate_limited':
+            return self._send_json(
+                429, {'error': {'message': 'Rate limit reached', 'type': 'rate_limit_exceeded'}},
+                headers={'Retry-After': str(config.retry_after)},
+            )
+        try:
+            latency = config.sample_latency()
+            if outcome == 'error':
+                time.sleep(latency)
+                return self._send_json(500, {'error': {'message': 'Injected server error', 'type': 'server_error'}})
+            self._complete(config, body, latency)
+        finally:
+            if outcome == 'ok':
+                config.finished()
+
+    def _complete(self, config, body, latency):
+        messages = body.get('messages') or []
+        prompt = next((m.get('content', '') for m in reversed(messages) if m.get('role') == 'user'), '')
+        content = json.dumps(config.payload_for(prompt))
+        prompt_tokens = sum(_estimate_tokens(m.get('content', '')) for m in messages)
+        completion_tokens = _estimate_tokens(content)
+        finish_reason = 'stop'
+        max_tokens = body.get('max_tokens') or body.get('max_completion_tokens')
+        if max_tokens and completion_tokens > max_tokens:
+            content = content[:max_tokens * 4]
+            completion_tokens = max_tokens
+            finish_reason = 'length'
+
+        completion_id = f'chatcmpl-stub-{uuid.uuid4().hex[:12]}'
+        model = body.get('model', 'stub')
+        created = int(time.time())
+        if body.get('stream'):
+            try:
+                self._stream(config, completion_id, model, created, content, finish_reason, latency)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client stopped reading mid-stream
+                self.close_connection = True
+            return
+
+        time.sleep(latency)
+        self._send_json(200, {
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': created,
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': finish_reason,
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens,
+            },
+        })
+
+    def _stream(self, config, completion_id, model, created, content, finish_reason, latency):
+        """Server-sent events; a fifth of the latency before the first token"""
+        with config._lock:
+            config.stats['streamed'] += 1
+        size = max(1, config.stream_chunk_chars)
+        pieces = [content[i:i + size] for i in range(0, len(content), size)]
+        first_token = latency * 0.2
+        per_piece = (latency - first_token) / max(1, len(pieces))
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def chunk(delta, reason=None):
+            return {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': reason}],
+            }
+
+        time.sleep(first_token)
+        self._send_event(chunk({'role': 'assistant', 'content': ''}))
+        for piece in pieces:
+            time.sleep(per_piece)
+            self._send_event(chunk({'content': piece}))
+        self._send_event(chunk({}, finish_reason))
+        self._write_chunk(b'data: [DONE]\n\n')
+        self._write_chunk(b'')
+
+    def _send_event(self, data):
+        self._write_chunk(b'data: ' + json.dumps(data, separators=(',', ':')).encode() + b'\n\n')
+
+    def _write_chunk(self, data):
+        self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+        self.wfile.flush()
+
+    def _send_json(self, status, data, headers=None):
+        encoded = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(encoded)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(encoded)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, config):
+        super().__init__(address, StubHandler)
+        self.config = config
+
+
+def make_server(host='127.0.0.1', port=8001, config=None):
+    return StubServer((host, port), config or StubConfig())
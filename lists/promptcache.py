@@ -0,0 +1,295 @@
+"""
+Semantic cache of generated lists keyed by prompt similarity.
+
+A prompt is normalized into its content words in their original order, each
+tagged with the connecting words in front of it ("from", "to", "for",
+"without", ...), after dropping filler ("a", "ideas", "please", ...) and
+folding plurals. Two prompts are the same request only if their normalized
+forms line up term by term: the same connecting words, and words that are
+equal or near-equal spellings. That keeps "flights from london to paris"
+apart from "flights from paris to london", "gifts for mom from dad" from
+"gifts for dad from mom", and "breakfast with eggs" from "breakfast without
+eggs".
+
+The normalized form joined into a string is the exact-match key. Other
+entries are found through an inverted index on the content words and ranked
+by the cosine similarity of L2-normalized word and character-trigram vectors,
+all computed in-process; that bag of words only picks candidates, which must
+reach PROMPT_CACHE['THRESHOLD'] and then pass the term-by-term check.
+
+So "healthy breakfasts", "Healthy breakfast ideas" and "ideas for a healthy
+breakfast" all normalize to "healthi breakfast" and share one upstream call.
+Entries live in the PromptCacheEntry table; each process keeps an in-memory
+index and picks up entries written by other processes every REFRESH_INTERVAL.
+"""
+import copy
+import math
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics
+from .models import PromptCacheEntry
+
+CACHE_DEFAULTS = {
+    'ENABLED': True,
+    'THRESHOLD': 0.8,
+    'MAX_ENTRIES': 20000,
+    'REFRESH_INTERVAL': 30,
+}
+
+# Words that don't change which list a prompt asks for
+FILLER = frozenset("""
+    a an the please give me some list lists idea ideas example examples
+    suggestion suggestions thing things
+""".split())
+
+# Connecting words: they say how the next content word relates to the rest
+# of the prompt, so they are kept as part of its term
+ROLE_WORDS = frozenset("""
+    for from to with without no not non in on at by of into onto about near
+    under over before after during between versus vs and or but than
+""".split())
+
+# Role words that are kept even at the start of a prompt ("no sugar desserts")
+NEGATIONS = frozenset({'no', 'not', 'non', 'without'})
+
+TRIGRAM_WEIGHT = 0.3
+# Trigram overlap (Dice) at which two words count as spellings of the same word
+WORD_MATCH = 0.7
+MAX_CANDIDATES = 50
+# Best-scoring candidates checked term by term
+MAX_MATCHES = 5
+
+# Keeps "c++" and "c#" apart from "c"
+_word_re = re.compile(r"[a-z0-9]+[+#]*")
+
+
+def _stem(word):
+    """Very light plural folding: breakfasts -> breakfast, movies/movie -> movi"""
+    if len(word) > 4 and word.endswith('ies'):
+        word = word[:-3] + 'i'
+    elif len(word) > 4 and word.endswith(('ses', 'xes', 'ches', 'shes')):
+        word = word[:-2]
+    elif len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        word = word[:-1]
+    if len(word) > 3 and word.endswith('ie'):
+        word = word[:-1]
+    elif len(word) > 2 and word.endswith('y'):
+        word = word[:-1] + 'i'
+    return word
+
+
+def normalize(prompt):
+    """
+    (role, word) terms of a prompt in their original order: each content word
+    (stemmed) with the role words just before it, space-separated, or ''.
+    Role words before the first content word only link it to filler ("ideas
+    for ...") and are dropped, except negations.
+    """
+    terms = []
+    role = []
+    for word in _word_re.findall(prompt.lower()):
+        if word in FILLER:
+            continue
+        if word in ROLE_WORDS:
+            if terms or word in NEGATIONS:
+                role.append(word)
+            continue
+        terms.append((' '.join(role), _stem(word)))
+        role = []
+    return terms
+
+
+def prompt_key(terms):
+    """Exact-match key of normalized terms, e.g. 'flight from:london to:pari'"""
+    return ' '.join(f'{role}:{word}' if role else word for role, word in terms)
+
+
+def content_words(terms):
+    return [word for _, word in terms]
+
+
+def vectorize(words):
+    """L2-normalized sparse vector of word and character-trigram features"""
+    features = Counter()
+    for word in words:
+        features['w:' + word] += 1.0
+        padded = f' {word} '
+        for i in range(len(padded) - 2):
+            features['t:' + padded[i:i + 3]] += TRIGRAM_WEIGHT
+    norm = math.sqrt(sum(v * v for v in features.values()))
+    if not norm:
+        return {}
+    return {k: v / norm for k, v in features.items()}
+
+
+def cosine(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0.0) for k, v in a.items())
+
+
+def _trigrams(word):
+    padded = f' {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _similar_word(a, b):
+    if a == b:
+        return True
+    grams_a, grams_b = _trigrams(a), _trigrams(b)
+    return 2 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b)) >= WORD_MATCH
+
+
+def same_terms(a, b):
+    """Whether two normalized prompts line up term by term (same roles, equal or near-equal words)"""
+    return len(a) == len(b) and all(
+        role_a == role_b and _similar_word(word_a, word_b)
+        for (role_a, word_a), (role_b, word_b) in zip(a, b)
+    )
+
+
+def cache_setting(name):
+    return getattr(settings, 'PROMPT_CACHE', {}).get(name, CACHE_DEFAULTS[name])
+
+
+class PromptIndex:
+    def __init__(self, threshold, max_entries, refresh_interval):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._vectors = {}
+        self._terms = {}
+        self._postings = {}
+        self._exact = {}
+        self._last_pk = 0
+        self._last_refresh = None
+
+    def _add(self, pk, prompt):
+        terms = normalize(prompt)
+        if not terms:
+            return
+        words = content_words(terms)
+        self._vectors[pk] = vectorize(words)
+        self._terms[pk] = terms
+        self._exact.setdefault(prompt_key(terms), pk)
+        for word in set(words):
+            self._postings.setdefault(word, set()).add(pk)
+        if len(self._vectors) > self.max_entries:
+            self._evict(min(self._vectors))
+
+    def _evict(self, pk):
+        terms = self._terms.pop(pk)
+        self._vectors.pop(pk)
+        key = prompt_key(terms)
+        if self._exact.get(key) == pk:
+            del self._exact[key]
+        for word in set(content_words(terms)):
+            posting = self._postings.get(word)
+            if posting is not None:
+                posting.discard(pk)
+                if not posting:
+                    del self._postings[word]
+
+    def _refresh(self):
+        """Load entries added (by any process) since the last refresh"""
+        now = time.monotonic()
+        if self._last_refresh is not None and now - self._last_refresh < self.refresh_interval:
+            return
+        self._last_refresh = now
+        entries = PromptCacheEntry.objects.filter(pk__gt=self._last_pk).order_by('pk')
+        if not self._last_pk:
+            # Cold start: only the newest entries fit
+            newest = PromptCacheEntry.objects.order_by('-pk').values_list('pk', flat=True)[self.max_entries:self.max_entries + 1]
+            if newest:
+                entries = entries.filter(pk__gt=newest[0])
+        for pk, prompt in entries.values_list('pk', 'prompt').iterator():
+            self._add(pk, prompt)
+            self._last_pk = pk
+
+    def nearest(self, prompt, limit=1):
+        """[(similarity, entry pk)] of the closest cached prompts, best first"""
+        terms = normalize(prompt)
+        if not terms:
+            return []
+        words = content_words(terms)
+        with self._lock:
+            self._refresh()
+            exact = self._exact.get(prompt_key(terms))
+            if exact is not None and limit == 1:
+                return [(1.0, exact)]
+            overlap = Counter()
+            for word in set(words):
+                overlap.update(self._postings.get(word, ()))
+            vector = vectorize(words)
+            scored = [
+                (cosine(vector, self._vectors[pk]), pk)
+                for pk, _ in overlap.most_common(MAX_CANDIDATES)
+            ]
+        scored.sort(reverse=True)
+        return scored[:limit]
+
+    def is_match(self, prompt, score, pk):
+        """Whether the cached entry `pk` at similarity `score` may answer `prompt`"""
+        if score < self.threshold:
+            return False
+        with self._lock:
+            terms = self._terms.get(pk)
+        return terms is not None and same_terms(normalize(prompt), terms)
+
+    def lookup(self, prompt):
+        """Stored generation for a similar enough prompt, or None"""
+        matches = self.nearest(prompt, limit=MAX_MATCHES)
+        best = matches[0][0] if matches else 0.0
+        _, pk = next(((s, pk) for s, pk in matches if self.is_match(prompt, s, pk)), (0.0, None))
+        metrics.PROMPT_SIMILARITY.observe(best)
+        if pk is None:
+            metrics.CACHE_REQUESTS.inc('prompt', 'miss')
+            return None
+        entry = PromptCacheEntry.objects.filter(pk=pk).values_list('result', flat=True).first()
+        if entry is None:
+            metrics.CACHE_REQUESTS.inc('prompt', 'miss')
+            return None
+        metrics.CACHE_REQUESTS.inc('prompt', 'hit')
+        PromptCacheEntry.objects.filter(pk=pk).update(hits=F('hits') + 1, last_hit_at=timezone.now())
+        return copy.deepcopy(entry)
+
+    def store(self, prompt, result):
+        """Remember a fresh generation unless an identical prompt is cached"""
+        terms = normalize(prompt)
+        if not terms:
+            return
+        key = prompt_key(terms)
+        with self._lock:
+            if key in self._exact:
+                return
+        entry = PromptCacheEntry.objects.create(prompt=prompt, normalized=key[:500], result=result)
+        with self._lock:
+            self._add(entry.pk, prompt)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_prompt_cache():
+    """Process-wide prompt index, or None when PROMPT_CACHE is disabled"""
+    global _index
+    if not cache_setting('ENABLED'):
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = PromptIndex(
+                    threshold=cache_setting('THRESHOLD'),
+                    max_entries=cache_setting('MAX_ENTRIES'),
+                    refresh_interval=cache_setting('REFRESH_INTERVAL'),
+                )
+    return _index
@@ -0,0 +1,264 @@
+"""
+In-process admission control for upstream LLM calls.
+
+Every generation goes through `GenerationScheduler.slot()`, which enforces:
+- a per-user token bucket (too many requests -> GenerationThrottled / 429)
+- an upstream token bucket sized to the provider's rate limit
+- a global concurrency cap
+- a bounded, priority-ordered wait queue (full queue or too long a wait ->
+  GenerationOverloaded / 503)
+"""
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from . import metrics
+
+# Lower values are admitted first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+
+class GenerationRejected(Exception):
+    """A generation was refused before reaching the upstream API"""
+    status_code = 503
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class GenerationThrottled(GenerationRejected):
+    """The user exceeded their own request rate"""
+    status_code = 429
+    outcome = 'throttled'
+
+
+class GenerationOverloaded(GenerationRejected):
+    """The wait queue is full"""
+    status_code = 503
+    outcome = 'shed'
+
+
+class GenerationTimedOut(GenerationOverloaded):
+    """The wait deadline passed before a slot came free"""
+    outcome = 'timed_out'
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate` tokens per second"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self):
+        """Take one token; returns 0 on success or the seconds until one is available"""
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def give_back(self):
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def pause(self, seconds):
+        """Empty the bucket so nothing is admitted for roughly `seconds`"""
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+class GenerationScheduler:
+    def __init__(self, max_concurrency=4, max_queue=16, max_wait=30,
+                 user_requests_per_minute=6, user_burst=3,
+                 upstream_requests_per_minute=60, upstream_burst=10):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.user_rate = user_requests_per_minute / 60
+        self.user_burst = user_burst
+        self.upstream = TokenBucket(upstream_requests_per_minute / 60, upstream_burst)
+
+        self._cond = threading.Condition()
+        self._queue = []
+        self._seq = itertools.count()
+        self._user_buckets = {}
+        self._active = 0
+        # Exponentially weighted average call duration, used for Retry-After
+        self._service_time = 5.0
+        self._stats = {
+            'admitted': 0,
+            'throttled': 0,
+            'shed': 0,
+            'timed_out': 0,
+            'completed': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+            'queue_depth_max': 0,
+        }
+
+    def _user_bucket(self, user_key):
+        bucket = self._user_buckets.get(user_key)
+        if bucket is None:
+            if len(self._user_buckets) > 10000:
+                # Buckets that have refilled completely carry no state
+                now = time.monotonic()
+                for key, b in list(self._user_buckets.items()):
+                    b._refill(now)
+                    if b.tokens >= b.capacity:
+                        del self._user_buckets[key]
+            bucket = self._user_buckets[user_key] = TokenBucket(self.user_rate, self.user_burst)
+        return bucket
+
+    def _retry_after(self):
+        return self._service_time * (len(self._queue) + 1) / self.max_concurrency
+
+    def _admit(self, waited):
+        self._active += 1
+        self._stats['admitted'] += 1
+        self._stats['wait_seconds_total'] += waited
+        self._stats['wait_seconds_max'] = max(self._stats['wait_seconds_max'], waited)
+
+    def acquire(self, user_key=None, priority=PRIORITY_INTERACTIVE):
+        """Block until the call may proceed, or raise GenerationRejected"""
+        start = time.monotonic()
+        try:
+            self._acquire(user_key, priority)
+        except GenerationRejected as e:
+            metrics.GENERATION_ADMISSIONS.inc(e.outcome)
+            raise
+        metrics.GENERATION_ADMISSIONS.inc('admitted')
+        metrics.GENERATION_QUEUE_WAIT.observe(time.monotonic() - start)
+
+    def _acquire(self, user_key, priority):
+        with self._cond:
+            if user_key is not None:
+                wait = self._user_bucket(user_key).take()
+                if wait:
+                    self._stats['throttled'] += 1
+                    raise GenerationThrottled('Too many generation requests', wait)
+
+            if not self._queue and self._active < self.max_concurrency and not self.upstream.take():
+                self._admit(0)
+                return
+
+            if len(self._queue) >= self.max_queue:
+                self._stats['shed'] += 1
+                if user_key is not None:
+                    self._user_bucket(user_key).give_back()
+                raise GenerationOverloaded('Generation is overloaded', self._retry_after())
+
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._queue, ticket)
+            self._stats['queue_depth_max'] = max(self._stats['queue_depth_max'], len(self._queue))
+            start = time.monotonic()
+            deadline = start + self.max_wait
+            while True:
+                timeout = deadline - time.monotonic()
+                if self._queue[0] == ticket and self._active < self.max_concurrency:
+                    upstream_wait = self.upstream.take()
+                    if not upstream_wait:
+                        heapq.heappop(self._queue)
+                        self._admit(time.monotonic() - start)
+                        # The next ticket may be admissible as well
+                        self._cond.notify_all()
+                        return
+                    timeout = min(timeout, upstream_wait)
+                if deadline - time.monotonic() <= 0:
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+                    self._stats['timed_out'] += 1
+                    self._cond.notify_all()
+                    raise GenerationTimedOut('Timed out waiting for a generation slot', self._retry_after())
+                self._cond.wait(timeout)
+
+    def release(self, duration=None):
+        with self._cond:
+            self._active -= 1
+            self._stats['completed'] += 1
+            if duration is not None:
+                self._service_time = 0.8 * self._service_time + 0.2 * duration
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, user_key=None, priority=PRIORITY_INTERACTIVE):
+        """Hold an admission slot for the duration of the block"""
+        self.acquire(user_key, priority)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    def take_upstream(self):
+        """
+        Take an upstream token for another call within an admitted slot (e.g. a
+        fallback) without waiting; returns 0 or the seconds until one is available
+        """
+        with self._cond:
+            return self.upstream.take()
+
+    def try_acquire_extra(self):
+        """
+        Reserve a slot and an upstream token for an extra concurrent call (a
+        hedge) if both are free and nobody is queued; release with release_extra()
+        """
+        with self._cond:
+            if self._queue or self._active >= self.max_concurrency or self.upstream.take():
+                return False
+            self._active += 1
+            return True
+
+    def release_extra(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def pause_upstream(self, seconds):
+        """Stop admitting calls for `seconds`, e.g. after an upstream 429"""
+        with self._cond:
+            self.upstream.pause(seconds)
+
+    def metrics(self):
+        """Snapshot of the current queue state and counters"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'active': self._active,
+                'queue_depth': len(self._queue),
+                'max_concurrency': self.max_concurrency,
+                'max_queue': self.max_queue,
+                'service_seconds_avg': round(self._service_time, 3),
+                'wait_seconds_avg': (
+                    stats['wait_seconds_total'] / stats['admitted'] if stats['admitted'] else 0.0
+                ),
+            })
+            return stats
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Process-wide scheduler configured from settings.GENERATION_SCHEDULER"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                options = getattr(settings, 'GENERATION_SCHEDULER', {})
+                _scheduler = GenerationScheduler(**{k.lower(): v for k, v in options.items()})
+    return _scheduler
@@ -0,0 +1,79 @@
+"""
+Plain-dict serialization of lists for the JSON API.
+
+Rows are read with `.values()` so no model instances are built, and only the
+columns (and annotations) needed for the requested fields are selected.
+"""
+
+
+def _split_lines(content):
+    return [line.strip() for line in content.splitlines() if line.strip()]
+
+
+def _split_tags(tags):
+    return [tag.strip() for tag in tags.split(',') if tag.strip()]
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+# API field -> (columns to select, getter over the values() row)
+LIST_FIELDS = {
+    'id': (('pk',), lambda row: row['pk']),
+    'title': (('title',), lambda row: row['title']),
+    'description': (('description',), lambda row: row['description']),
+    'items': (('content',), lambda row: _split_lines(row['content'])),
+    'tags': (('tags',), lambda row: _split_tags(row['tags'])),
+    'prompt': (('prompt',), lambda row: row['prompt']),
+    'is_public': (('is_public',), lambda row: row['is_public']),
+    'created_at': (('created_at',), lambda row: _isoformat(row['created_at'])),
+    'updated_at': (('updated_at',), lambda row: _isoformat(row['updated_at'])),
+    'owner': (('owner__username',), lambda row: row['owner__username']),
+    'original_list': (('original_list',), lambda row: row['original_list']),
+    'like_count': (('like_count',), lambda row: row['like_count']),
+    'fork_count': (('fork_count',), lambda row: row['fork_count']),
+    'liked': (('liked',), lambda row: row['liked']),
+    'forked': (('forked',), lambda row: row['forked']),
+}
+
+DEFAULT_LIST_FIELDS = tuple(LIST_FIELDS)
+
+# Short card payload used for feeds and lineage entries
+SUMMARY_LIST_FIELDS = (
+    'id', 'title', 'owner', 'is_public', 'created_at', 'original_list',
+    'like_count', 'fork_count', 'liked', 'forked',
+)
+
+
+def parse_fields(value, default=DEFAULT_LIST_FIELDS):
+    """
+    Parse a comma-separated `fields` query parameter.
+    Raises ValueError naming any unknown fields, or if the value names none.
+    """
+    if not value:
+        return tuple(default)
+    fields = tuple(dict.fromkeys(f.strip() for f in value.split(',') if f.strip()))
+    if not fields:
+        raise ValueError("No fields requested")
+    unknown = [f for f in fields if f not in LIST_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def prepare_queryset(queryset, fields, user):
+    """Add only the annotations the requested fields need"""
+    if 'liked' in fields or 'forked' in fields:
+        queryset = queryset.with_viewer_flags(user)
+    return queryset
+
+
+def serialize_lists(queryset, fields, user):
+    """Serialize a List queryset into a list of dicts with the given fields"""
+    columns = []
+    for field in fields:
+        columns.extend(LIST_FIELDS[field][0])
+    getters = [(field, LIST_FIELDS[field][1]) for field in fields]
+    rows = prepare_queryset(queryset, fields, user).values(*dict.fromkeys(columns))
+    return [{field: getter(row) for field, getter in getters} for row in rows]
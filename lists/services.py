@@ -3,26 +3,122 @@ import json
 import requests
 from typing import Dict
 import logging
+import os
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from . import metrics
+from .hedging import get_latency_tracker, hedged_call, model_setting
+from .promptcache import get_prompt_cache
+from .scheduler import PRIORITY_INTERACTIVE, GenerationOverloaded, get_scheduler
 
 logger = logging.getLogger(__name__)
 
+_http_session = None
+_http_session_pid = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """
+    Process-wide keep-alive session for upstream calls, so generations reuse
+    pooled TLS connections. A forked worker gets its own session (sockets
+    must not be shared across processes).
+    """
+    global _http_session, _http_session_pid
+    pid = os.getpid()
+    if _http_session is None or _http_session_pid != pid:
+        with _http_session_lock:
+            if _http_session is None or _http_session_pid != pid:
+                pool_size = getattr(settings, 'GENERATION_SCHEDULER', {}).get('MAX_CONCURRENCY', 4)
+                session = requests.Session()
+                session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+                session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+                _http_session, _http_session_pid = session, pid
+    return _http_session
+
+# Strict structured output: the API rejects anything but this shape
+LIST_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "generated_list",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "title": {"type": "string"},
+                "content": {"type": "array", "items": {"type": "string"}},
+            },
+            "required": ["title", "content"],
+            "additionalProperties": False,
+        },
+    },
+}
+
 class ListGenerationService:
     def __init__(self):
         self.api_key = settings.OPENAI_API_KEY
-        self.api_url = "https://api.openai.com/v1/chat/completions"
+        self.api_url = f"{settings.OPENAI_BASE_URL.rstrip('/')}/chat/completions"
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
         logger.info("ListGenerationService initialized")
 
-    def generate_list(self, prompt: str) -> Dict:
+    def generate_list(self, prompt: str, user_key=None, priority: int = PRIORITY_INTERACTIVE) -> Dict:
         """
         Generate a list using OpenAI's API based on the user's prompt.
         Returns a dictionary containing the title and content.
+
+        A stored generation for a similar prompt is returned from the prompt
+        cache when there is one. Otherwise the call waits for an admission
+        slot from the generation scheduler, which raises GenerationRejected
+        when it sheds load.
+        """
+        prompt_cache = get_prompt_cache()
+        if prompt_cache is not None:
+            cached = prompt_cache.lookup(prompt)
+            if cached is not None:
+                logger.info(f"Prompt cache hit for prompt: {prompt}")
+                return cached
+
+        with get_scheduler().slot(user_key, priority):
+            result = self._request_list(prompt)
+
+        if prompt_cache is not None:
+            prompt_cache.store(prompt, result)
+        return result
+
+    def _request_list(self, prompt: str) -> Dict:
+        """
+        Try each model tier in order until one returns a valid list.
+        Calls within a tier are hedged (see lists.hedging).
         """
         logger.info(f"Generating list for prompt: {prompt}")
-        
+        tiers = model_setting('TIERS')
+        errors = []
+        for i, tier in enumerate(tiers):
+            if i:
+                # The admission token covered the first tier; a fallback needs
+                # its own and must not run while upstream calls are paused
+                wait = get_scheduler().take_upstream()
+                if wait:
+                    logger.warning(f"Not falling back to {tier['MODEL']}, upstream is rate limited for {wait:.1f}s")
+                    raise GenerationOverloaded(
+                        f"Upstream rate limited after: {'; '.join(errors)}", wait
+                    )
+            try:
+                return self._request_tier(prompt, tier)
+            except Exception as e:
+                errors.append(f"{tier['MODEL']}: {str(e)}")
+                if i + 1 < len(tiers):
+                    metrics.LLM_FALLBACKS.inc(tier['MODEL'])
+                    logger.warning(f"Model {tier['MODEL']} failed, falling back to {tiers[i + 1]['MODEL']}: {str(e)}")
+        logger.error(f"All model tiers failed: {'; '.join(errors)}")
+        raise Exception(f"Failed to generate list: {'; '.join(errors)}")
+
+    def _request_tier(self, prompt: str, tier: Dict) -> Dict:
+        """One tier: a strict-JSON call with bounded output, hedged past the model's p95"""
         system_prompt = """You are a helpful assistant that generates concise, simple lists based on user prompts.
         Your task is to create a list with the following rules:
         1. Generate no more than 10 items
@@ -49,56 +145,102 @@ class ListGenerationService:
             ]
         }"""
 
+        model = tier['MODEL']
+        payload = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.7,
+            "max_tokens": tier.get('MAX_TOKENS', 400),
+            "response_format": LIST_RESPONSE_FORMAT,
+        }
+        timeout = tier.get('TIMEOUT', 30)
+        tracker = get_latency_tracker()
+
+        def may_hedge():
+            return model_setting('HEDGE') and get_scheduler().try_acquire_extra()
+
+        result, winner = hedged_call(
+            lambda: self._call(payload, timeout), tracker.hedge_delay(model),
+            may_hedge, get_scheduler().release_extra
+        )
+        if winner is not None:
+            metrics.LLM_HEDGES.inc(model, winner)
+            logger.info(f"Hedged call to {model} answered by the {winner} request")
+        return result
+
+    def _call(self, payload: Dict, timeout: float) -> Dict:
+        """Make one chat-completions call and parse the list out of it"""
+        model = payload['model']
         try:
-            payload = {
-                "model": "gpt-4",
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": 0.7
-            }
-            
-            logger.info("Making request to OpenAI API")
-            response = requests.post(self.api_url, headers=self.headers, json=payload)
+            start = time.perf_counter()
+            logger.info(f"Making request to OpenAI API ({model})")
+            response = self._post(payload, timeout)
             logger.info(f"OpenAI API response status: {response.status_code}")
-            
+
+            if response.status_code == 429:
+                # Hold back every caller in this process until the limit resets
+                get_scheduler().pause_upstream(self._retry_after(response))
+
             if response.status_code != 200:
                 logger.error(f"OpenAI API error: {response.text}")
                 raise Exception(f"OpenAI API error: {response.text}")
-            
-            result = response.json()
-            logger.info("Successfully got JSON response from OpenAI")
-            
-            content = result['choices'][0]['message']['content']
-            logger.info(f"Raw content from OpenAI: {content}")
-            
-            try:
-                # Parse the JSON response
-                parsed_content = json.loads(content)
-                logger.info("Successfully parsed content as JSON")
-                
-                # Ensure all required fields are present
-                required_fields = ['title', 'content']
-                for field in required_fields:
-                    if field not in parsed_content:
-                        logger.error(f"Missing required field: {field}")
-                        raise ValueError(f"Missing required field: {field}")
-                
-                # Ensure content is a list and has 10 or fewer items
-                if not isinstance(parsed_content['content'], list):
-                    parsed_content['content'] = parsed_content['content'].split('\n')
-                parsed_content['content'] = parsed_content['content'][:10]
-                
-                logger.info("All validation passed, returning result")
-                return parsed_content
-            except json.JSONDecodeError as e:
-                logger.error(f"JSON decode error: {str(e)}")
-                raise Exception("Failed to parse OpenAI response as JSON")
-            
+
+            choice = response.json()['choices'][0]
+            if choice.get('finish_reason') == 'length':
+                raise Exception(f"Response truncated at max_tokens={payload['max_tokens']}")
+            parsed_content = json.loads(choice['message']['content'])
         except requests.exceptions.RequestException as e:
             logger.error(f"Request error: {str(e)}")
             raise Exception(f"API request failed: {str(e)}")
-        except Exception as e:
-            logger.error(f"General error: {str(e)}")
-            raise Exception(f"Failed to generate list: {str(e)}") 
\ No newline at end of file
+        except (json.JSONDecodeError, KeyError, IndexError, TypeError) as e:
+            logger.error(f"Could not parse OpenAI response: {str(e)}")
+            raise Exception("Failed to parse OpenAI response as JSON")
+        get_latency_tracker().record(model, time.perf_counter() - start)
+
+        # The schema guarantees the shape; still validate what the list needs
+        if not isinstance(parsed_content, dict) or not parsed_content.get('title'):
+            raise Exception("Missing required field: title")
+        content = parsed_content.get('content')
+        if isinstance(content, str):
+            content = content.split('\n')
+        if not isinstance(content, list):
+            raise Exception("Missing required field: content")
+        parsed_content['content'] = [str(item) for item in content][:10]
+        return parsed_content
+
+    def _post(self, payload, timeout=None):
+        """POST to the chat-completions API, recording latency, status and token usage"""
+        model = payload['model']
+        start = time.perf_counter()
+        try:
+            response = get_http_session().post(self.api_url, headers=self.headers, json=payload, timeout=timeout)
+        except requests.exceptions.RequestException:
+            metrics.LLM_REQUESTS.inc(model, 'error')
+            raise
+        finally:
+            metrics.LLM_LATENCY.observe(time.perf_counter() - start, model)
+        metrics.LLM_REQUESTS.inc(model, str(response.status_code))
+        if response.status_code == 200:
+            try:
+                usage = response.json().get('usage') or {}
+            except ValueError:
+                usage = {}
+            for kind in ('prompt_tokens', 'completion_tokens'):
+                if usage.get(kind):
+                    metrics.LLM_TOKENS.inc(model, kind[:-len('_tokens')], amount=usage[kind])
+        return response
+
+    def warm_up(self, timeout=2.0):
+        """Open a pooled connection to the upstream API (lists models; no tokens used)"""
+        models_url = f"{settings.OPENAI_BASE_URL.rstrip('/')}/models"
+        get_http_session().get(models_url, headers=self.headers, timeout=timeout)
+
+    @staticmethod
+    def _retry_after(response) -> float:
+        try:
+            return max(1.0, float(response.headers.get('Retry-After', 1)))
+        except ValueError:
+            return 1.0
@@ -1,12 +1,23 @@
+from collections import namedtuple
+
 from django import template
+from lists import likebuffer
 
 register = template.Library()
 
+PREVIEW_ITEMS = 3
+
+Preview = namedtuple('Preview', ['lines', 'more'])
+
 @register.filter
 def has_forked(list_obj, user):
     """Check if a user has forked a list"""
     if not user.is_authenticated:
         return False
+    # Querysets built with with_viewer_flags() already carry the answer
+    forked = getattr(list_obj, 'forked', None)
+    if forked is not None:
+        return forked
     return list_obj.forks.filter(owner=user).exists()
 
 @register.filter
@@ -14,4 +25,26 @@ def has_liked(list_obj, user):
     """Check if a user has liked a list"""
     if not user.is_authenticated:
         return False
-    return user.liked_lists.filter(id=list_obj.id).exists() 
\ No newline at end of file
+    # Querysets built with with_viewer_flags() already carry the answer, with
+    # unflushed likes overlaid by likebuffer.apply_pending() in the view
+    liked = getattr(list_obj, 'liked', None)
+    if liked is not None:
+        return liked
+    if likebuffer.enabled():
+        pending = likebuffer.pending_state(user.pk, list_obj.pk)
+        if pending is not None:
+            return pending
+    return user.liked_lists.filter(id=list_obj.id).exists()
+
+@register.filter
+def preview_items(content):
+    """First few non-empty lines of a list's content, and whether there are more"""
+    lines = []
+    for line in content.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if len(lines) == PREVIEW_ITEMS:
+            return Preview(lines, True)
+        lines.append(line)
+    return Preview(lines, False)
@@ -1,3 +1,1140 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import admin as list_admin, likebuffer, metrics
+from .api import MAX_LINEAGE_DEPTH
+from .backends import CachedModelBackend
+from .caching import FileCache
+from .hedging import hedged_call
+from .jobs import QueueFull, TooManyJobs, claim_job, run_job, submit_generation_job
+from .models import GenerationJob, Like, List
+from .openai_stub import CANNED_LISTS, StubConfig, make_server
+from .templatetags.list_extras import preview_items
+from .promptcache import PromptIndex, normalize, prompt_key
+from .services import ListGenerationService, get_http_session
+from .scheduler import (
+    PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, GenerationOverloaded, GenerationScheduler,
+    GenerationThrottled,
+)
+from .transfer import MAX_IMPORT_ERRORS, ListImporter
+from .views import MAX_BATCH_OPERATIONS, MAX_DRAWER_PREFETCH
+
+# Seconds from the first line of the entry point to a warmed-up application
+STARTUP_BUDGET_SECONDS = float(os.getenv('STARTUP_BUDGET_SECONDS', '3'))
+
+STARTUP_SCRIPT = (
+    "import importlib, json, sys\n"
+    "importlib.import_module(sys.argv[1])\n"
+    "from listlab.serving import STARTUP\n"
+    "print(json.dumps(STARTUP))\n"
+)
+
+
+class StartupTimeTests(SimpleTestCase):
+    """Load each entry point in a fresh interpreter, as a server would"""
+
+    def load(self, module):
+        # Warm-up opens the database, so point it at a scratch file rather than db.sqlite3
+        db_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, db_dir)
+        env = dict(
+            os.environ, DJANGO_SETTINGS_MODULE='listlab.settings', SERVING_WARM_LLM='0',
+            SQLITE_PATH=os.path.join(db_dir, 'startup.sqlite3'), METRICS_DIR=db_dir,
+        )
+        env.pop('LISTLAB_FORKED_WORKERS', None)
+        result = subprocess.run(
+            [sys.executable, '-c', STARTUP_SCRIPT, module],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=60,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertNotIn('Warm-up step', result.stderr)
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    def test_startup_within_budget(self):
+        for module in ('listlab.wsgi', 'listlab.asgi'):
+            with self.subTest(module=module):
+                startup = self.load(module)
+                for step in ('import', 'compile_templates', 'populate_urls', 'connect_databases'):
+                    self.assertIn(step, startup)
+                self.assertLess(
+                    startup['total'], STARTUP_BUDGET_SECONDS,
+                    f'{module} took {startup["total"]:.2f}s to start: {startup}'
+                )
+
+
+class CachedUserTests(TestCase):
+    """The session user is served from the cache until it or its profile changes"""
+
+    def setUp(self):
+        cache.clear()
+        self.backend = CachedModelBackend()
+        self.user = User.objects.create_user('cached', password='pw')
+
+    def test_second_lookup_needs_no_queries(self):
+        self.backend.get_user(self.user.pk)
+        with self.assertNumQueries(0):
+            user = self.backend.get_user(self.user.pk)
+            self.assertEqual(user.userprofile.user_id, self.user.pk)
+
+    def test_profile_change_invalidates(self):
+        self.backend.get_user(self.user.pk)
+        profile = self.user.userprofile
+        profile.bio = 'Updated'
+        profile.save()
+        self.assertEqual(self.backend.get_user(self.user.pk).userprofile.bio, 'Updated')
+
+    def test_user_change_invalidates(self):
+        self.backend.get_user(self.user.pk)
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(self.backend.get_user(self.user.pk))
+
+    def test_deleted_user_is_not_served(self):
+        self.backend.get_user(self.user.pk)
+        self.user.delete()
+        self.assertIsNone(self.backend.get_user(self.user.pk))
+
+    def test_request_user_comes_from_the_cache(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('profile'))
+        with self.assertNumQueries(0):
+            self.backend.get_user(self.user.pk)
+
+
+class FileCacheTests(SimpleTestCase):
+    def test_culls_at_most_once_per_interval(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        file_cache = FileCache(location, {'OPTIONS': {'MAX_ENTRIES': 2, 'CULL_INTERVAL': 60}})
+        with mock.patch.object(file_cache, '_list_cache_files', wraps=file_cache._list_cache_files) as listing:
+            for i in range(5):
+                file_cache.set(f'key{i}', i)
+        self.assertEqual(listing.call_count, 1)
+        self.assertEqual(file_cache.get('key4'), 4)
+
+
+class ListPagesTests(TestCase):
+    """The list pages render with DEBUG off, showing only the lists they should"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='pw')
+        self.public = List.objects.create(title='Public list', content='One\nTwo', owner=self.owner)
+        self.private = List.objects.create(title='Private list', owner=self.owner, is_public=False)
+
+    def get(self, name, *args):
+        response = self.client.get(reverse(name, args=args))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_public_home(self):
+        response = self.get('home')
+        self.assertContains(response, 'lists/css/list_grid.css')
+        self.assertContains(response, 'Public list')
+        self.assertNotContains(response, 'Private list')
+
+    def test_explore(self):
+        response = self.get('explore')
+        self.assertContains(response, 'lists/css/list_grid.css')
+        self.assertContains(response, 'Public list')
+        self.assertNotContains(response, 'Private list')
+
+    def test_my_lists(self):
+        self.client.force_login(self.owner)
+        response = self.get('home')
+        self.assertContains(response, 'lists/css/list_grid.css')
+        self.assertContains(response, 'Public list')
+        self.assertContains(response, 'Private list')
+
+    def test_my_public_lists(self):
+        self.client.force_login(self.owner)
+        response = self.get('my_public_lists')
+        self.assertContains(response, 'Public list')
+        self.assertNotContains(response, 'Private list')
+
+    def test_user_lists(self):
+        response = self.get('user_lists', 'owner')
+        self.assertContains(response, 'Public list')
+        self.assertNotContains(response, 'Private list')
+
+
+class ListGridTests(TestCase):
+    """Grid pages run the same queries however many cards they show"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='pw')
+        self.viewer = User.objects.create_user('viewer', password='pw')
+
+    def add_lists(self, count):
+        for i in range(count):
+            list_obj = List.objects.create(title=f'List {i}', content='One', owner=self.owner)
+            Like.objects.create(user=self.viewer, list=list_obj)
+            list_obj.fork(self.viewer, is_public=False)
+            list_obj.fork(self.owner)
+        List.objects.recount()
+
+    def assertConstantQueries(self, url):
+        self.add_lists(2)
+        # The first request also loads the session user into the cache
+        self.assertEqual(self.client.get(url).status_code, 200)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        self.add_lists(10)
+        with self.assertNumQueries(len(few)):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_explore(self):
+        self.client.force_login(self.viewer)
+        response = self.assertConstantQueries(reverse('explore'))
+        self.assertContains(response, 'like-button liked', count=12)
+        self.assertContains(response, 'fork-button forked', count=12)
+
+    def test_public_home(self):
+        self.assertConstantQueries(reverse('home'))
+
+    def test_own_lists(self):
+        self.client.force_login(self.owner)
+        self.assertConstantQueries(reverse('home'))
+
+    def test_preview_items_are_the_first_lines(self):
+        self.assertEqual(preview_items('  First item  \n\nSecond item\n'), (['First item', 'Second item'], False))
+        self.assertEqual(preview_items('a\nb\nc\nd'), (['a', 'b', 'c'], True))
+        self.assertEqual(preview_items('a\nb\nc\n\n'), (['a', 'b', 'c'], False))
+        self.assertEqual(preview_items(''), ([], False))
+
+
+class ListDrawersTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='pw')
+        self.stranger = User.objects.create_user('stranger', password='pw')
+        self.public = List.objects.create(title='Public', content='One', owner=self.owner)
+        self.private = List.objects.create(title='Private', content='One', owner=self.owner, is_public=False)
+
+    def drawers(self, ids):
+        response = self.client.get(reverse('list_drawers'), {'ids': ','.join(str(pk) for pk in ids)})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['drawers']
+
+    def test_leaves_out_lists_the_user_cannot_see(self):
+        ids = [self.public.pk, self.private.pk, 999999]
+        self.assertEqual(set(self.drawers(ids)), {str(self.public.pk)})
+        self.client.force_login(self.stranger)
+        self.assertEqual(set(self.drawers(ids)), {str(self.public.pk)})
+
+    def test_owner_gets_their_private_list(self):
+        self.client.force_login(self.owner)
+        drawers = self.drawers([self.public.pk, self.private.pk])
+        self.assertEqual(set(drawers), {str(self.public.pk), str(self.private.pk)})
+        self.assertIn('Private', drawers[str(self.private.pk)])
+
+    def test_rejects_bad_and_too_many_ids(self):
+        url = reverse('list_drawers')
+        self.assertEqual(self.client.get(url, {'ids': '1,x'}).status_code, 400)
+        too_many = ','.join(str(pk) for pk in range(1, MAX_DRAWER_PREFETCH + 2))
+        self.assertEqual(self.client.get(url, {'ids': too_many}).status_code, 400)
+        # Repeated ids count once
+        self.assertEqual(self.client.get(url, {'ids': ','.join(['1'] * (MAX_DRAWER_PREFETCH + 1))}).status_code, 200)
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='pw')
+        self.viewer = User.objects.create_user('viewer', password='pw')
+        self.public = List.objects.create(title='Public', content='One\nTwo', tags='a, b', owner=self.owner)
+        self.private = List.objects.create(title='Private', owner=self.owner, is_public=False)
+
+    def get_json(self, url, status=200, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status)
+        return response.json()
+
+    def test_field_selection(self):
+        url = reverse('api_list_detail', args=[self.public.pk])
+        self.assertEqual(self.get_json(url, fields='title,items'), {'title': 'Public', 'items': ['One', 'Two']})
+        self.assertEqual(self.get_json(url, fields='tags, title,tags'), {'tags': ['a', 'b'], 'title': 'Public'})
+        self.assertIn('liked', self.get_json(url))
+
+    def test_rejects_bad_fields(self):
+        url = reverse('api_list_detail', args=[self.public.pk])
+        self.assertEqual(self.get_json(url, 400, fields=',,')['error'], 'No fields requested')
+        self.assertEqual(self.get_json(url, 400, fields='title,secret')['error'], 'Unknown fields: secret')
+        self.get_json(reverse('api_explore'), 400, fields=',')
+
+    def test_etag_answers_304(self):
+        url = reverse('api_list_detail', args=[self.public.pk])
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, headers={'if-none-match': etag}).status_code, 304)
+        List.objects.filter(pk=self.public.pk).update(title='Renamed')
+        response = self.client.get(url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_private_list_is_404_for_others(self):
+        url = reverse('api_list_detail', args=[self.private.pk])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_login(self.viewer)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(reverse('api_list_lineage', args=[self.private.pk])).status_code, 404)
+        self.client.force_login(self.owner)
+        self.assertEqual(self.get_json(url, fields='title'), {'title': 'Private'})
+
+    def test_pagination(self):
+        for i in range(4):
+            List.objects.create(title=f'Extra {i}', owner=self.viewer)
+        url = reverse('api_explore')
+        first = self.get_json(url, page_size=2, fields='title')
+        self.assertEqual(first['results'], [{'title': 'Extra 3'}, {'title': 'Extra 2'}])
+        self.assertTrue(first['has_next'])
+        last = self.get_json(url, page=3, page_size=2, fields='title')
+        self.assertEqual(last['results'], [{'title': 'Public'}])
+        self.assertFalse(last['has_next'])
+        self.assertEqual(self.get_json(url, page_size=1000)['page_size'], 100)
+
+    def test_user_lists_hide_private_from_others(self):
+        url = reverse('api_user_lists', args=['owner'])
+        self.assertEqual(self.get_json(url, fields='title')['results'], [{'title': 'Public'}])
+        self.client.force_login(self.owner)
+        self.assertEqual(len(self.get_json(url)['results']), 2)
+
+    def test_lineage_walks_ancestors_in_one_query(self):
+        chain = [self.public]
+        for i in range(10):
+            chain.append(List.objects.create(title=f'Fork {i}', owner=self.viewer, original_list=chain[-1]))
+        List.objects.filter(pk=chain[3].pk).update(is_public=False)
+        url = reverse('api_list_lineage', args=[chain[-1].pk])
+        # The list, the ancestor ids, the ancestors and the forks
+        with self.assertNumQueries(4):
+            lineage = self.get_json(url, fields='title')
+        self.assertEqual(
+            [a['title'] for a in lineage['ancestors']],
+            [c.title for c in reversed(chain[:-1]) if c.pk != chain[3].pk],
+        )
+        self.assertEqual(self.get_json(reverse('api_list_lineage', args=[chain[0].pk]))['forks'][0]['id'], chain[1].pk)
+
+    def test_lineage_stops_on_cycles_and_depth(self):
+        first = List.objects.create(title='First', owner=self.owner)
+        second = List.objects.create(title='Second', owner=self.owner, original_list=first)
+        List.objects.filter(pk=first.pk).update(original_list=second)
+        lineage = self.get_json(reverse('api_list_lineage', args=[first.pk]), fields='id')
+        self.assertEqual(lineage['ancestors'], [{'id': second.pk}])
+
+        chain = [self.public]
+        for i in range(MAX_LINEAGE_DEPTH + 5):
+            chain.append(List.objects.create(title=f'Deep {i}', owner=self.owner, original_list=chain[-1]))
+        lineage = self.get_json(reverse('api_list_lineage', args=[chain[-1].pk]), fields='id')
+        self.assertEqual(len(lineage['ancestors']), MAX_LINEAGE_DEPTH)
+        self.assertEqual(lineage['ancestors'][0], {'id': chain[-2].pk})
+
+
+class BatchListsTests(TestCase):
+    """Operations are replayed in order; each gets its own result"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='pw')
+        self.viewer = User.objects.create_user('viewer', password='pw')
+        self.public = List.objects.create(title='Public', owner=self.owner, is_public=True)
+        self.private = List.objects.create(title='Private', owner=self.owner, is_public=False)
+        self.own = List.objects.create(title='Own', owner=self.viewer, is_public=False)
+
+    def batch(self, user, operations):
+        self.client.force_login(user)
+        response = self.client.post(
+            reverse('batch_lists'),
+            json.dumps({'operations': [{'action': a, 'list_id': pk} for a, pk in operations]}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_toggles_replay_in_order(self):
+        results = self.batch(self.viewer, [
+            ('toggle_like', self.public.pk),
+            ('toggle_like', self.public.pk),
+            ('toggle_like', self.public.pk),
+        ])
+        self.assertEqual([r['liked'] for r in results], [True, False, True])
+        self.assertTrue(Like.objects.filter(user=self.viewer, list=self.public).exists())
+        self.public.refresh_from_db()
+        self.assertEqual(self.public.like_count, 1)
+        self.assertEqual(results[-1]['count'], 1)
+
+    def test_private_list_of_another_user(self):
+        results = self.batch(self.viewer, [
+            ('like', self.private.pk),
+            ('publish', self.private.pk),
+            ('delete', self.private.pk),
+        ])
+        self.assertEqual(
+            [r['error'] for r in results],
+            ['This list is private', 'Permission denied', 'Permission denied'],
+        )
+        self.assertFalse(Like.objects.exists())
+        self.private.refresh_from_db()
+        self.assertFalse(self.private.is_public)
+
+    def test_per_item_results_do_not_abort_the_batch(self):
+        results = self.batch(self.viewer, [
+            ('like', 999999),
+            ('explode', self.public.pk),
+            ('like', self.public.pk),
+            ('publish', self.own.pk),
+        ])
+        self.assertEqual([r['success'] for r in results], [False, False, True, True])
+        self.assertEqual(results[0]['error'], 'List not found')
+        self.assertEqual(results[1]['error'], 'Invalid action')
+        self.own.refresh_from_db()
+        self.assertTrue(self.own.is_public)
+
+    def test_delete_then_like(self):
+        results = self.batch(self.viewer, [
+            ('like', self.own.pk),
+            ('delete', self.own.pk),
+            ('like', self.own.pk),
+        ])
+        self.assertEqual([r['success'] for r in results], [True, True, False])
+        self.assertEqual(results[2]['error'], 'List not found')
+        self.assertFalse(List.objects.filter(pk=self.own.pk).exists())
+        self.assertFalse(Like.objects.exists())
+
+    def test_rejects_oversized_batch(self):
+        self.client.force_login(self.viewer)
+        operations = [{'action': 'like', 'list_id': self.public.pk}] * (MAX_BATCH_OPERATIONS + 1)
+        response = self.client.post(
+            reverse('batch_lists'), json.dumps({'operations': operations}), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class ToggleLikeTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='pw')
+        self.viewer = User.objects.create_user('viewer', password='pw')
+        self.list = List.objects.create(title='Public', owner=self.owner)
+        self.client.force_login(self.viewer)
+
+    def toggle(self):
+        response = self.client.post(reverse('toggle_like', args=[self.list.pk]))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_like_and_unlike(self):
+        self.assertEqual(self.toggle(), {'liked': True, 'count': 1})
+        self.assertEqual(self.toggle(), {'liked': False, 'count': 0})
+
+    def test_unlike_that_lost_a_race_leaves_the_count(self):
+        self.toggle()
+        other = User.objects.create_user('other', password='pw')
+        Like.objects.create(user=other, list=self.list)
+        List.objects.filter(pk=self.list.pk).update(like_count=2)
+        # A concurrent unlike from the same user already removed the row
+        with mock.patch('django.db.models.query.QuerySet.delete', return_value=(0, {})):
+            self.assertEqual(self.toggle(), {'liked': False, 'count': 2})
+
+
+class ListAdminTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', password='pw')
+        self.client.force_login(self.admin)
+        for title in ('Banana bread', 'banjo songs', 'Urban walks', 'Élan vital'):
+            List.objects.create(title=title, owner=self.admin, is_public=False)
+
+    def changelist(self, **params):
+        response = self.client.get(reverse('admin:lists_list_changelist'), params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def search(self, term):
+        return sorted(str(obj) for obj in self.changelist(q=term).context['cl'].result_list)
+
+    def test_title_prefix_search(self):
+        self.assertEqual(self.search('BAN'), ['Banana bread', 'banjo songs'])
+        self.assertEqual(self.search('Élan'), ['Élan vital'])
+        self.assertEqual(self.search('@admin'), self.search(''))
+        pk = List.objects.get(title='Urban walks').pk
+        self.assertEqual(self.search(str(pk)), ['Urban walks'])
+
+    def test_prefix_search_uses_the_lower_title_index(self):
+        model_admin = list_admin.ListAdmin(List, list_admin.admin.site)
+        queryset, _ = model_admin.get_search_results(None, List.objects.all(), 'ban')
+        self.assertIn('lists_list_title_lower_idx', queryset.explain())
+
+    def test_estimated_count_paginator(self):
+        with mock.patch.object(list_admin, 'EXACT_COUNT_THRESHOLD', 2):
+            paginator = list_admin.EstimatedCountPaginator(List.objects.all(), 10)
+            self.assertEqual(paginator.count, List.objects.order_by('-pk').first().pk)
+            # Filtered changelists count exactly, but no further than the threshold
+            paginator = list_admin.EstimatedCountPaginator(List.objects.filter(is_public=False), 10)
+            self.assertEqual(paginator.count, 2)
+        paginator = list_admin.EstimatedCountPaginator(List.objects.filter(is_public=False), 10)
+        self.assertEqual(paginator.count, 4)
+
+    def test_actions_update_the_selection(self):
+        banana = List.objects.get(title='Banana bread')
+        Like.objects.create(user=self.admin, list=banana)
+        selected = list(List.objects.filter(title__in=['Banana bread', 'Urban walks']).values_list('pk', flat=True))
+        for action in ('publish', 'recount'):
+            response = self.client.post(
+                reverse('admin:lists_list_changelist'), {'action': action, '_selected_action': selected}
+            )
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            sorted(List.objects.filter(is_public=True).values_list('title', flat=True)), ['Banana bread', 'Urban walks']
+        )
+        banana.refresh_from_db()
+        self.assertEqual(banana.like_count, 1)
+        self.client.post(reverse('admin:lists_list_changelist'), {'action': 'unpublish', '_selected_action': selected})
+        self.assertFalse(List.objects.filter(is_public=True).exists())
+
+
+class GenerationSchedulerTests(SimpleTestCase):
+    def scheduler(self, **options):
+        options = dict(dict(max_concurrency=1, max_queue=2, max_wait=5, upstream_requests_per_minute=6000,
+                            upstream_burst=100, user_requests_per_minute=6000, user_burst=100), **options)
+        return GenerationScheduler(**options)
+
+    def start_waiter(self, scheduler, admitted, priority, name):
+        def wait():
+            scheduler.acquire(priority=priority)
+            admitted.append(name)
+            scheduler.release()
+        thread = threading.Thread(target=wait)
+        thread.start()
+        return thread
+
+    def wait_for_queue(self, scheduler, depth):
+        deadline = time.monotonic() + 5
+        while scheduler.metrics()['queue_depth'] < depth:
+            self.assertLess(time.monotonic(), deadline, 'waiter never queued')
+            time.sleep(0.01)
+
+    def test_sheds_when_queue_is_full(self):
+        scheduler = self.scheduler(max_queue=1)
+        scheduler.acquire()
+        admitted = []
+        thread = self.start_waiter(scheduler, admitted, PRIORITY_INTERACTIVE, 'queued')
+        self.wait_for_queue(scheduler, 1)
+        with self.assertRaises(GenerationOverloaded) as cm:
+            scheduler.acquire()
+        self.assertGreaterEqual(cm.exception.retry_after, 1)
+        self.assertEqual(scheduler.metrics()['shed'], 1)
+        scheduler.release()
+        thread.join(5)
+        self.assertEqual(admitted, ['queued'])
+
+    def test_times_out_waiting_for_a_slot(self):
+        scheduler = self.scheduler(max_wait=0.1)
+        scheduler.acquire()
+        start = time.monotonic()
+        with self.assertRaises(GenerationOverloaded):
+            scheduler.acquire()
+        self.assertLess(time.monotonic() - start, 2)
+        metrics = scheduler.metrics()
+        self.assertEqual(metrics['timed_out'], 1)
+        self.assertEqual(metrics['queue_depth'], 0)
+
+    def test_interactive_calls_overtake_background_calls(self):
+        scheduler = self.scheduler()
+        scheduler.acquire()
+        admitted = []
+        background = self.start_waiter(scheduler, admitted, PRIORITY_BACKGROUND, 'background')
+        self.wait_for_queue(scheduler, 1)
+        interactive = self.start_waiter(scheduler, admitted, PRIORITY_INTERACTIVE, 'interactive')
+        self.wait_for_queue(scheduler, 2)
+        scheduler.release()
+        background.join(5)
+        interactive.join(5)
+        self.assertEqual(admitted, ['interactive', 'background'])
+
+    def test_throttles_per_user(self):
+        scheduler = self.scheduler(max_concurrency=10, user_requests_per_minute=1, user_burst=2)
+        scheduler.acquire(user_key=1)
+        scheduler.acquire(user_key=1)
+        with self.assertRaises(GenerationThrottled):
+            scheduler.acquire(user_key=1)
+        scheduler.acquire(user_key=2)
+
+
+@override_settings(GENERATION_JOBS={
+    'MAX_ATTEMPTS': 2, 'RETRY_BACKOFF': 5, 'LEASE_SECONDS': 300, 'MAX_ACTIVE_PER_USER': 3,
+    'MAX_QUEUED': 5, 'MAX_DEFERRALS': 2, 'POLL_INTERVAL': 1.0,
+})
+class GenerationJobTests(TestCase):
+    RESULT = {'title': 'Books', 'description': '', 'items': ['One'], 'tags': []}
+
+    def setUp(self):
+        self.user = User.objects.create_user('writer', password='pw')
+        generate = mock.patch('lists.jobs.ListGenerationService')
+        self.generate_list = generate.start().return_value.generate_list
+        self.generate_list.return_value = self.RESULT
+        self.addCleanup(generate.stop)
+
+    def claim(self):
+        job = claim_job('worker')
+        self.assertIsNotNone(job)
+        return job
+
+    def submit_view(self, title, **headers):
+        self.client.force_login(self.user)
+        return self.client.post(
+            reverse('generate_list_content'), {'title': title},
+            headers=dict({'x-requested-with': 'XMLHttpRequest'}, **headers),
+        )
+
+    def test_idempotency_key_returns_the_same_job(self):
+        first = submit_generation_job(self.user, 'books', idempotency_key='k1')
+        self.assertEqual(submit_generation_job(self.user, 'other', idempotency_key='k1').pk, first.pk)
+        # Without a key an unfinished job for the same prompt is reused
+        self.assertEqual(submit_generation_job(self.user, 'films').pk, submit_generation_job(self.user, 'films').pk)
+        self.assertEqual(GenerationJob.objects.count(), 2)
+
+    def test_failed_job_is_requeued_by_its_key(self):
+        job = submit_generation_job(self.user, 'books', idempotency_key='k1')
+        GenerationJob.objects.filter(pk=job.pk).update(status=GenerationJob.FAILED, attempts=2, deferrals=2)
+        job = submit_generation_job(self.user, 'books', idempotency_key='k1')
+        self.assertEqual((job.status, job.attempts, job.deferrals), (GenerationJob.PENDING, 0, 0))
+
+    def test_limits_unfinished_jobs_per_user(self):
+        for i in range(3):
+            submit_generation_job(self.user, f'prompt {i}')
+        with self.assertRaises(TooManyJobs):
+            submit_generation_job(self.user, 'one more')
+        response = self.submit_view('one more')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_full_queue_answers_503(self):
+        other = User.objects.create_user('other', password='pw')
+        GenerationJob.objects.bulk_create(GenerationJob(user=other, prompt=f'p{i}') for i in range(5))
+        with self.assertRaises(QueueFull):
+            submit_generation_job(self.user, 'books')
+        response = self.submit_view('books')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+
+    def test_submit_and_poll_status(self):
+        response = self.submit_view('books', **{'idempotency-key': 'k1'})
+        self.assertEqual(response.status_code, 202)
+        status_url = response.json()['status_url']
+        self.assertEqual(self.client.get(status_url).json()['status'], 'pending')
+
+        run_job(self.claim())
+        payload = self.client.get(status_url).json()
+        self.assertEqual((payload['status'], payload['attempts']), ('succeeded', 1))
+        self.assertEqual(payload['result'], self.RESULT)
+
+        self.client.force_login(User.objects.create_user('stranger', password='pw'))
+        self.assertEqual(self.client.get(status_url).status_code, 404)
+
+    def test_claim_is_exclusive_and_waits_for_run_after(self):
+        job = submit_generation_job(self.user, 'books')
+        GenerationJob.objects.filter(pk=job.pk).update(run_after=timezone.now() + timezone.timedelta(minutes=1))
+        self.assertIsNone(claim_job('worker'))
+        GenerationJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        self.assertEqual(self.claim().locked_by, 'worker')
+        self.assertIsNone(claim_job('other'))
+
+    def test_expired_lease_is_reclaimed(self):
+        submit_generation_job(self.user, 'books')
+        stale = self.claim()
+        GenerationJob.objects.filter(pk=stale.pk).update(started_at=timezone.now() - timezone.timedelta(seconds=301))
+        job = claim_job('rescuer')
+        self.assertEqual((job.locked_by, job.attempts), ('rescuer', 2))
+        # The first worker lost the lease, so its result is dropped
+        run_job(stale)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), (GenerationJob.RUNNING, 'rescuer'))
+
+    def test_failures_retry_with_backoff_then_fail(self):
+        self.generate_list.side_effect = Exception('Upstream broke')
+        job = submit_generation_job(self.user, 'books')
+        run_job(self.claim())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.error), (GenerationJob.PENDING, 1, 'Upstream broke'))
+        self.assertGreater(job.run_after, timezone.now())
+
+        GenerationJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        run_job(self.claim())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (GenerationJob.FAILED, 2))
+
+    def test_deferrals_do_not_spend_attempts_but_are_capped(self):
+        self.generate_list.side_effect = GenerationOverloaded('Generation is overloaded', 7)
+        job = submit_generation_job(self.user, 'books')
+        for deferrals in (1, 2):
+            run_job(self.claim())
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts, job.deferrals), (GenerationJob.PENDING, 0, deferrals))
+            self.assertIsNone(job.started_at)
+            GenerationJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        run_job(self.claim())
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationJob.FAILED)
+        self.assertIn('Gave up after 2 deferrals', job.error)
+
+    def test_user_start_rate_is_shared_by_all_workers(self):
+        # Starts recorded by other worker processes count against the user too
+        started = timezone.now() - timezone.timedelta(seconds=30)
+        GenerationJob.objects.bulk_create(
+            GenerationJob(user=self.user, prompt=f'p{i}', status=GenerationJob.SUCCEEDED, started_at=started)
+            for i in range(settings.GENERATION_SCHEDULER['USER_REQUESTS_PER_MINUTE'])
+        )
+        job = submit_generation_job(self.user, 'books')
+        run_job(self.claim())
+        job.refresh_from_db()
+        self.generate_list.assert_not_called()
+        self.assertEqual((job.status, job.attempts, job.deferrals), (GenerationJob.PENDING, 0, 1))
+        self.assertGreater(job.run_after, timezone.now() + timezone.timedelta(seconds=25))
+
+
+class OpenAIStubTests(SimpleTestCase):
+    """ListGenerationService against the offline stub, over real HTTP"""
+
+    def start_stub(self, **options):
+        config = StubConfig(**dict(dict(latency=0, distribution='fixed', seed=1), **options))
+        server = make_server('127.0.0.1', 0, config)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        base_url = f'http://127.0.0.1:{server.server_address[1]}/v1'
+        stub_settings = override_settings(
+            OPENAI_BASE_URL=base_url, OPENAI_API_KEY='stub',
+            GENERATION_MODELS={**settings.GENERATION_MODELS, 'HEDGE': False},
+        )
+        stub_settings.enable()
+        self.addCleanup(stub_settings.disable)
+        for patcher in (
+            mock.patch('lists.services.get_scheduler', return_value=self.scheduler),
+            mock.patch('lists.services.get_prompt_cache', return_value=None),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return config, base_url
+
+    def setUp(self):
+        self.scheduler = GenerationScheduler(upstream_requests_per_minute=6000, upstream_burst=100)
+
+    def test_generates_a_list(self):
+        config, _ = self.start_stub()
+        result = ListGenerationService().generate_list('Things to pack for a weekend hike')
+        self.assertIn(result['title'], [payload['title'] for payload in CANNED_LISTS])
+        self.assertTrue(result['content'])
+        self.assertTrue(all(isinstance(item, str) for item in result['content']))
+        self.assertLessEqual(len(result['content']), 10)
+        self.assertEqual(config.stats['ok'], 1)
+
+    def test_rate_limit_pauses_upstream_calls(self):
+        config, _ = self.start_stub(rate_limit_rate=1.0, retry_after=7)
+        with self.assertRaises(GenerationOverloaded) as cm:
+            ListGenerationService().generate_list('Houseplants for a dark room')
+        # The 429's Retry-After stops the fallback tier and later callers alike
+        self.assertIn(cm.exception.retry_after, (7, 8))
+        self.assertEqual(config.stats['rate_limited'], 1)
+        self.assertGreater(self.scheduler.take_upstream(), 6)
+
+    def test_models_endpoint(self):
+        _, base_url = self.start_stub()
+        ListGenerationService().warm_up()
+        response = get_http_session().get(f'{base_url}/models', timeout=5)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['object'], 'list')
+
+
+class ListImporterTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        # Occupies the exported ids, so imported lists must be remapped
+        self.existing = [List.objects.create(title=f'Existing {i}', owner=self.alice) for i in range(5)]
+
+    def lines(self, *records):
+        return [json.dumps(record) for record in records]
+
+    def test_remaps_ids_and_links_forks_across_batches(self):
+        lines = self.lines(
+            {'id': 1, 'title': 'Original', 'owner': 'alice'},
+            {'id': 2, 'title': 'Fork', 'owner': 'bob', 'original_list': 1},
+            {'id': 3, 'title': 'Fork of fork', 'owner': 'alice', 'original_list': 2},
+        )
+        stats = ListImporter(batch_size=1).run(lines)
+        self.assertEqual((stats.created, stats.forks_linked, stats.skipped), (3, 2, 0))
+        original = List.objects.get(title='Original')
+        fork = List.objects.get(title='Fork')
+        self.assertNotIn(original.pk, {l.pk for l in self.existing})
+        self.assertEqual(fork.original_list_id, original.pk)
+        self.assertEqual(List.objects.get(title='Fork of fork').original_list_id, fork.pk)
+        self.assertEqual(original.fork_count, 1)
+
+    def test_links_forks_that_precede_their_original(self):
+        lines = self.lines(
+            {'id': 12, 'title': 'Late fork', 'owner': 'bob', 'original_list': 10},
+            {'id': 11, 'title': 'Orphan', 'owner': 'bob', 'original_list': 999},
+            {'id': 10, 'title': 'Original', 'owner': 'alice'},
+        )
+        stats = ListImporter(batch_size=1).run(lines)
+        self.assertEqual((stats.created, stats.forks_linked), (3, 1))
+        original = List.objects.get(title='Original')
+        self.assertEqual(List.objects.get(title='Late fork').original_list_id, original.pk)
+        self.assertIsNone(List.objects.get(title='Orphan').original_list_id)
+        self.assertEqual(original.fork_count, 1)
+
+    def test_keep_ids_links_out_of_order_forks(self):
+        List.objects.all().delete()
+        lines = self.lines(
+            {'id': 101, 'title': 'Fork', 'owner': 'bob', 'original_list': 100},
+            {'id': 100, 'title': 'Original', 'owner': 'alice'},
+        )
+        stats = ListImporter(batch_size=1, keep_ids=True).run(lines)
+        self.assertEqual((stats.created, stats.forks_linked), (2, 1))
+        self.assertEqual(List.objects.get(pk=101).original_list_id, 100)
+
+    def test_skips_bad_lines(self):
+        lines = ['not json', '[1, 2]', '"text"'] + self.lines(
+            {'id': 1, 'title': 'Nobody', 'owner': 'nobody'},
+            {'id': 2, 'title': 'Kept', 'owner': 'alice'},
+        )
+        stats = ListImporter().run(lines)
+        self.assertEqual((stats.created, stats.skipped, stats.error_count), (1, 4, 4))
+        self.assertIn('line 2: expected a JSON object', stats.errors)
+
+    def test_skips_records_with_bad_fields(self):
+        lines = self.lines(
+            {'id': 1, 'title': None, 'owner': 'alice'},
+            {'id': 2, 'title': 7, 'owner': 'alice'},
+            {'id': 3, 'title': 'Bad date', 'owner': 'alice', 'created_at': 'last tuesday'},
+            {'id': 4, 'title': 'No visibility', 'owner': 'alice', 'is_public': None},
+            {'id': 5, 'title': 'Bad fork', 'owner': 'alice', 'original_list': 'one'},
+            {'id': 6, 'title': 'x' * 201, 'owner': 'alice'},
+            {'id': 7, 'title': 'Kept', 'owner': 'alice', 'created_at': '2024-01-02T03:04:05+00:00'},
+        )
+        stats = ListImporter(batch_size=3).run(lines)
+        self.assertEqual((stats.created, stats.skipped), (1, 6))
+        self.assertEqual(stats.errors, [
+            'line 1: title must be a string',
+            'line 2: title must be a string',
+            "line 3: created_at is not a valid datetime: 'last tuesday'",
+            'line 4: is_public must be true or false',
+            'line 5: original_list must be a positive integer',
+            'line 6: title is longer than 200 characters',
+        ])
+        kept = List.objects.get(title='Kept')
+        self.assertEqual(kept.created_at.isoformat(), '2024-01-02T03:04:05+00:00')
+
+    def test_keep_ids_skips_ids_that_exist(self):
+        lines = self.lines(
+            {'id': self.existing[0].pk, 'title': 'Clash', 'owner': 'alice'},
+            {'title': 'No id', 'owner': 'alice'},
+            {'id': 500, 'title': 'New', 'owner': 'alice'},
+            {'id': 500, 'title': 'Repeat', 'owner': 'alice'},
+        )
+        stats = ListImporter(keep_ids=True).run(lines)
+        self.assertEqual((stats.created, stats.skipped), (1, 3))
+        self.assertEqual(stats.errors, [
+            'line 2: id is required with keep_ids',
+            f'line 1: list {self.existing[0].pk} already exists',
+            'line 4: list 500 already exists',
+        ])
+        self.assertEqual(List.objects.get(pk=500).title, 'New')
+
+    def test_caps_stored_errors(self):
+        lines = ['{'] * (MAX_IMPORT_ERRORS + 10)
+        stats = ListImporter().run(lines)
+        self.assertEqual(stats.error_count, MAX_IMPORT_ERRORS + 10)
+        self.assertEqual(len(stats.errors), MAX_IMPORT_ERRORS)
+
+
+class ExportListsTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='pw')
+        bob = User.objects.create_user('bob', password='pw')
+        self.original = List.objects.create(title='Original', content='One', owner=self.alice)
+        List.objects.create(title='Fork', owner=self.alice, original_list=self.original, is_public=False)
+        List.objects.create(title='Not mine', owner=bob)
+
+    def records(self, response):
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_streams_own_lists(self):
+        self.client.force_login(self.alice)
+        records = self.records(self.client.get(reverse('export_lists')))
+        self.assertEqual([r['title'] for r in records], ['Original', 'Fork'])
+        self.assertEqual(records[1]['original_list'], self.original.pk)
+        self.assertEqual(records[0]['owner'], 'alice')
+        # Only staff may export everything
+        records = self.records(self.client.get(reverse('export_lists'), {'scope': 'all'}))
+        self.assertEqual(len(records), 2)
+
+    def test_export_round_trips_through_the_importer(self):
+        self.client.force_login(self.alice)
+        lines = b''.join(self.client.get(reverse('export_lists')).streaming_content).splitlines()
+        stats = ListImporter().run(lines)
+        self.assertEqual((stats.created, stats.forks_linked, stats.skipped), (2, 1, 0))
+        fork = List.objects.filter(title='Fork').order_by('-pk').first()
+        self.assertEqual(fork.original_list.title, 'Original')
+        self.assertNotEqual(fork.original_list_id, self.original.pk)
+
+    async def test_streams_under_asgi(self):
+        client = AsyncClient()
+        await client.aforce_login(self.alice)
+        response = await client.get(reverse('export_lists'))
+        self.assertTrue(response.streaming)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual([json.loads(line)['title'] for line in body.splitlines()], ['Original', 'Fork'])
+
+
+class LikeBufferTests(TestCase):
+    def setUp(self):
+        log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, log_dir)
+        self.log_path = os.path.join(log_dir, 'likes.log')
+        override = self.settings(
+            LIKE_BUFFER={'ENABLED': True, 'LOG_PATH': self.log_path},
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.owner = User.objects.create_user('owner')
+        self.users = [User.objects.create_user(f'user{i}') for i in range(2)]
+        self.list = List.objects.create(title='Liked', owner=self.owner, is_public=True)
+
+    def rotate(self):
+        """Rotate the log the way flush() does, returning the rotated path"""
+        rotated = f'{self.log_path}.{time.time_ns():020d}.flushing'
+        os.rename(self.log_path, rotated)
+        return rotated
+
+    def assertLikedBy(self, users):
+        self.assertEqual(
+            set(Like.objects.filter(list=self.list).values_list('user_id', flat=True)),
+            {user.pk for user in users},
+        )
+        self.list.refresh_from_db()
+        self.assertEqual(self.list.like_count, len(users))
+
+    def test_flush_applies_the_last_state_per_user(self):
+        first, second = self.users
+        likebuffer.record_toggle(first.pk, self.list.pk, True)
+        likebuffer.record_toggle(second.pk, self.list.pk, True)
+        likebuffer.record_toggle(second.pk, self.list.pk, False)
+        self.assertFalse(Like.objects.exists())
+        self.assertEqual(likebuffer.flush(), (1, 1, 1))
+        self.assertLikedBy([first])
+
+    def test_interrupted_flush_is_redone_idempotently(self):
+        for user in self.users:
+            likebuffer.record_toggle(user.pk, self.list.pk, True)
+        # The flusher committed but died before deleting the rotated log
+        rotated = self.rotate()
+        likebuffer._apply(likebuffer._read_states([rotated]))
+        self.assertLikedBy(self.users)
+
+        likebuffer.flush()
+        self.assertLikedBy(self.users)
+        self.assertFalse(os.path.exists(rotated))
+
+    def test_leftover_log_replays_before_newer_toggles(self):
+        user = self.users[0]
+        likebuffer.record_toggle(user.pk, self.list.pk, True)
+        # The flusher rotated the log and died before applying it
+        self.rotate()
+        likebuffer.record_toggle(user.pk, self.list.pk, False)
+        likebuffer.flush()
+        self.assertLikedBy([])
+
+    def test_views_read_pending_state(self):
+        user = self.users[0]
+        self.client.force_login(user)
+        url = reverse('toggle_like', args=[self.list.pk])
+        self.assertTrue(self.client.post(url).json()['liked'])
+        self.assertFalse(self.client.post(url).json()['liked'])
+        self.assertTrue(self.client.post(url).json()['liked'])
+
+        # The batch endpoint sees the unflushed like and toggles it off
+        response = self.client.post(
+            reverse('batch_lists'),
+            json.dumps({'operations': [{'action': 'toggle_like', 'list_id': self.list.pk}]}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.json()['results'][0]['liked'], False)
+        self.assertEqual(response.json()['results'][0]['count'], 0)
+        self.assertFalse(Like.objects.exists())
+
+        likebuffer.flush()
+        self.assertLikedBy([])
+
+    def test_grid_reads_pending_state_once_per_page(self):
+        user = self.users[0]
+        others = [List.objects.create(title=f'Other {i}', owner=self.owner) for i in range(5)]
+        Like.objects.create(user=user, list=others[0])
+        likebuffer.record_states(user.pk, {self.list.pk: True, others[0].pk: False})
+        self.client.force_login(user)
+        with mock.patch.object(likebuffer.cache, 'get', wraps=likebuffer.cache.get) as cache_get:
+            response = self.client.get(reverse('explore'))
+        liked_keys = [c for c in cache_get.call_args_list if c.args[0].startswith('lists:likes:')]
+        self.assertEqual(len(liked_keys), 1)
+        self.assertContains(response, 'like-button liked', count=1)
+        self.assertContains(response, f'data-list-id="{self.list.pk}"')
+
+
+class PromptCacheTests(TestCase):
+    def setUp(self):
+        self.index = PromptIndex(threshold=0.8, max_entries=100, refresh_interval=0)
+
+    def store(self, prompt):
+        result = {'title': prompt, 'content': prompt}
+        self.index.store(prompt, result)
+        return result
+
+    def test_rephrasings_share_an_entry(self):
+        result = self.store('Healthy breakfasts')
+        self.assertEqual(self.index.lookup('ideas for a healthy breakfast'), result)
+        self.assertEqual(self.index.lookup('Healthy breakfast ideas!'), result)
+
+    def test_negation_is_not_a_match(self):
+        self.store('breakfast with eggs')
+        self.assertIsNone(self.index.lookup('breakfast without eggs'))
+        self.store('breakfast without eggs')
+        self.assertEqual(self.index.lookup('Breakfasts without egg')['title'], 'breakfast without eggs')
+
+    def test_qualifier_is_not_a_match(self):
+        self.store('best horror movies')
+        self.assertIsNone(self.index.lookup('worst horror movies'))
+
+    def test_extra_word_is_not_a_match(self):
+        self.store('horror movies for kids')
+        self.assertIsNone(self.index.lookup('horror movies'))
+        self.assertIsNone(self.index.lookup('horror movies for kids from the 1980s'))
+
+    def test_role_words_and_order_keep_prompts_apart(self):
+        pairs = [
+            ('gifts for mom from dad', 'gifts for dad from mom'),
+            ('flights from london to paris', 'flights from paris to london'),
+            ('things to make in winter', 'things to do in winter'),
+            ('things to do in winter', 'winter'),
+            ('c++ books', 'c books'),
+            ('no sugar desserts', 'sugar desserts'),
+        ]
+        for stored, other in pairs:
+            with self.subTest(stored=stored, other=other):
+                self.assertNotEqual(prompt_key(normalize(stored)), prompt_key(normalize(other)))
+                self.store(stored)
+                self.assertIsNone(self.index.lookup(other))
+                self.assertEqual(self.index.lookup(stored.upper())['title'], stored)
+
+    def test_normalized_key_keeps_order_and_roles(self):
+        self.assertEqual(prompt_key(normalize('Flights from London to Paris')), 'flight from:london to:pari')
+        self.assertEqual(prompt_key(normalize('Give me some ideas for healthy breakfasts')), 'healthi breakfast')
+        self.assertEqual(prompt_key(normalize('Books about C#')), 'book about:c#')
+
+
+class HedgedCallTests(SimpleTestCase):
+    def test_hedge_slot_is_held_until_the_loser_finishes(self):
+        scheduler = GenerationScheduler(max_concurrency=2, upstream_requests_per_minute=6000, upstream_burst=100)
+        scheduler.acquire()
+        calls = []
+        slow_done = threading.Event()
+
+        def call():
+            calls.append(1)
+            if len(calls) == 1:
+                # The first call is slow and loses to the hedge
+                time.sleep(0.3)
+                slow_done.set()
+                return 'first'
+            return 'second'
+
+        result, winner = hedged_call(call, 0.05, scheduler.try_acquire_extra, scheduler.release_extra)
+        self.assertEqual((result, winner), ('second', 'second'))
+        scheduler.release()
+        # The abandoned first call still holds the hedge's slot
+        self.assertEqual(scheduler.metrics()['active'], 1)
+        self.assertTrue(slow_done.wait(5))
+        deadline = time.monotonic() + 5
+        while scheduler.metrics()['active'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(scheduler.metrics()['active'], 0)
+
+    def test_no_hedge_without_a_free_slot(self):
+        scheduler = GenerationScheduler(max_concurrency=1, upstream_requests_per_minute=6000, upstream_burst=100)
+        scheduler.acquire()
+        result, winner = hedged_call(
+            lambda: time.sleep(0.1) or 'only', 0.01, scheduler.try_acquire_extra, scheduler.release_extra
+        )
+        self.assertEqual((result, winner), ('only', None))
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.metrics_dir)
+        self.settings_override = override_settings(METRICS={**settings.METRICS, 'DIR': self.metrics_dir, 'TOKEN': 'secret'})
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def dead_pid(self):
+        process = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True, text=True)
+        return int(process.stdout)
+
+    def test_anonymous_is_forbidden(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 403)
+
+    def test_token_and_staff_are_allowed(self):
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('listlab_http_requests_total', response.content.decode())
+
+        self.client.force_login(User.objects.create(username='staff', is_staff=True))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+        self.client.force_login(User.objects.create(username='member'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+    def test_unknown_methods_share_one_label(self):
+        before = metrics.registry.collect()['listlab_http_requests_total']
+        self.client.generic('BREW', reverse('home'))
+        self.client.generic('PROPFIND', reverse('home'))
+        after = metrics.registry.collect()['listlab_http_requests_total']
+        new = {labels for labels in after if after[labels] != before.get(labels)}
+        self.assertEqual({labels[1] for labels in new}, {'other'})
+
+    def test_dead_snapshots_are_folded_into_one_file(self):
+        for _ in range(3):
+            dead = os.path.join(self.metrics_dir, f'{self.dead_pid()}-1.json')
+            with open(dead, 'w') as f:
+                json.dump({'listlab_llm_requests_total': [[['gpt', '200'], 2]]}, f)
+        live = os.path.join(self.metrics_dir, f'{os.getppid()}-1.json')
+        with open(live, 'w') as f:
+            json.dump({'listlab_llm_requests_total': [[['gpt', '200'], 5]]}, f)
+
+        collected = metrics.registry.collect()['listlab_llm_requests_total']
+        self.assertEqual(collected[('gpt', '200')] - metrics.LLM_REQUESTS.values.get(('gpt', '200'), 0), 11)
+        self.assertEqual(sorted(os.listdir(self.metrics_dir)), sorted(['.lock', 'merged.json', os.path.basename(live)]))
+
+        # Folding again keeps the totals: merged.json is read, not folded twice
+        self.assertEqual(metrics.registry.fold_dead_snapshots(), 0)
+        collected = metrics.registry.collect()['listlab_llm_requests_total']
+        self.assertEqual(collected[('gpt', '200')] - metrics.LLM_REQUESTS.values.get(('gpt', '200'), 0), 11)
@@ -0,0 +1,401 @@
+"""
+Streaming NDJSON export and batched import of lists.
+
+One JSON object per line; `owner` is exported as a username and
+`original_list` as the exported id of the list it was forked from.
+Export reads with `.iterator()` and import writes in fixed-size batches, so
+memory stays flat regardless of corpus size. The importer's old -> new id map
+and the forks still waiting for their original live in temporary tables on
+the import's database connection, not in Python.
+"""
+import itertools
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import List
+
+EXPORT_FIELDS = (
+    'id', 'title', 'description', 'content', 'tags', 'prompt', 'is_public',
+    'created_at', 'updated_at', 'owner__username', 'original_list',
+)
+
+
+def export_records(queryset, chunk_size=2000):
+    """Yield one plain dict per list, reading the queryset in chunks"""
+    rows = queryset.order_by('pk').values(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    for row in rows:
+        row['owner'] = row.pop('owner__username')
+        row['created_at'] = row['created_at'].isoformat()
+        row['updated_at'] = row['updated_at'].isoformat()
+        yield row
+
+
+def ndjson_lines(records):
+    """Encode dicts as newline-delimited JSON byte strings"""
+    for record in records:
+        yield json.dumps(record, separators=(',', ':')).encode() + b'\n'
+
+
+async def async_chunks(chunks, batch_size=100):
+    """
+    Serve a sync iterator (e.g. one reading the database) from async code,
+    pulling `batch_size` items per hop to the sync thread. Under ASGI a sync
+    iterator would make Django buffer the whole response in memory.
+    """
+    iterator = iter(chunks)
+    take = sync_to_async(lambda: list(itertools.islice(iterator, batch_size)))
+    while True:
+        batch = await take()
+        if not batch:
+            return
+        for chunk in batch:
+            yield chunk
+
+
+def gzip_chunks(chunks, level=6):
+    """Gzip-compress a stream of byte strings incrementally"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# Error messages kept for reporting; later ones are only counted
+MAX_IMPORT_ERRORS = 100
+
+
+class ImportStats:
+    def __init__(self):
+        self.created = 0
+        self.skipped = 0
+        self.users_created = 0
+        self.forks_linked = 0
+        self.error_count = 0
+        self.errors = []
+
+    def error(self, message):
+        self.skipped += 1
+        self.error_count += 1
+        if len(self.errors) < MAX_IMPORT_ERRORS:
+            self.errors.append(message)
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'skipped': self.skipped,
+            'users_created': self.users_created,
+            'forks_linked': self.forks_linked,
+        }
+
+
+def _text(record, name, max_length=None):
+    value = record.get(name, '')
+    if not isinstance(value, str):
+        raise ValueError(f"{name} must be a string")
+    if max_length is not None and len(value) > max_length:
+        raise ValueError(f"{name} is longer than {max_length} characters")
+    return value
+
+
+def _optional_id(record, name):
+    value = record.get(name)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+        raise ValueError(f"{name} must be a positive integer")
+    return value
+
+
+def _optional_datetime(record, name):
+    value = record.get(name)
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"{name} must be an ISO 8601 string")
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValueError(f"{name} is not a valid datetime: {value!r}")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def clean_record(record):
+    """
+    Check the fields of one exported list and return them with their Python
+    types; raises ValueError naming the first bad field. Missing text fields
+    are empty, a missing is_public is True and missing timestamps are now.
+    """
+    is_public = record.get('is_public', True)
+    if not isinstance(is_public, bool):
+        raise ValueError("is_public must be true or false")
+    owner = record.get('owner')
+    if not isinstance(owner, str) or not owner:
+        raise ValueError("owner must be a username")
+    return {
+        'id': _optional_id(record, 'id'),
+        'title': _text(record, 'title', List._meta.get_field('title').max_length),
+        'description': _text(record, 'description'),
+        'content': _text(record, 'content'),
+        'tags': _text(record, 'tags', List._meta.get_field('tags').max_length),
+        'prompt': _text(record, 'prompt'),
+        'is_public': is_public,
+        'owner': owner,
+        'original_list': _optional_id(record, 'original_list'),
+        'created_at': _optional_datetime(record, 'created_at'),
+        'updated_at': _optional_datetime(record, 'updated_at'),
+    }
+
+
+class ListImporter:
+    """
+    Import NDJSON lines in batches of `batch_size` using bulk_create.
+
+    Owners are resolved by username (optionally creating missing users).
+    With `keep_ids` the exported ids are reused, which suits restoring into
+    an empty database; otherwise new ids are assigned and `original_list`
+    references are remapped.
+    """
+
+    ID_MAP_TABLE = 'lists_import_id_map'
+    PENDING_FORKS_TABLE = 'lists_import_pending_forks'
+
+    def __init__(self, batch_size=1000, keep_ids=False, create_users=False):
+        self.batch_size = batch_size
+        self.keep_ids = keep_ids
+        self.create_users = create_users
+        self.stats = ImportStats()
+        self.owner_ids = {}
+
+    def run(self, lines):
+        self._create_tables()
+        try:
+            batch = []
+            for number, line in enumerate(lines, 1):
+                if isinstance(line, bytes):
+                    line = line.decode()
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    self.stats.error(f"line {number}: {str(e)}")
+                    continue
+                if not isinstance(record, dict):
+                    self.stats.error(f"line {number}: expected a JSON object")
+                    continue
+                try:
+                    record = clean_record(record)
+                except ValueError as e:
+                    self.stats.error(f"line {number}: {str(e)}")
+                    continue
+                if self.keep_ids and record['id'] is None:
+                    self.stats.error(f"line {number}: id is required with keep_ids")
+                    continue
+                batch.append((number, record))
+                if len(batch) >= self.batch_size:
+                    self._import_batch(batch)
+                    batch = []
+            if batch:
+                self._import_batch(batch)
+            self._link_pending_forks()
+        finally:
+            self._drop_tables()
+        if self.keep_ids:
+            self._reset_sequence()
+        return self.stats
+
+    def _create_tables(self):
+        qn = connection.ops.quote_name
+        self._drop_tables()
+        with connection.cursor() as cursor:
+            # Temporary tables are private to this connection and dropped with it
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE {qn(self.ID_MAP_TABLE)} "
+                f"(old_id bigint PRIMARY KEY, new_id bigint NOT NULL)"
+            )
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE {qn(self.PENDING_FORKS_TABLE)} "
+                f"(list_id bigint PRIMARY KEY, original_id bigint NOT NULL)"
+            )
+
+    def _drop_tables(self):
+        qn = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            for table in (self.ID_MAP_TABLE, self.PENDING_FORKS_TABLE):
+                cursor.execute(f"DROP TABLE IF EXISTS {qn(table)}")
+
+    def _chunks(self, values, size=500):
+        values = list(values)
+        for i in range(0, len(values), size):
+            yield values[i:i + size]
+
+    def _store_ids(self, pairs):
+        """Record old -> new ids; a repeated exported id maps to its latest import"""
+        qn = connection.ops.quote_name
+        table = qn(self.ID_MAP_TABLE)
+        pairs = list(dict(pairs).items())
+        with connection.cursor() as cursor:
+            for chunk in self._chunks(pairs):
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(
+                    f"DELETE FROM {table} WHERE old_id IN ({placeholders})", [old for old, _ in chunk]
+                )
+                cursor.executemany(f"INSERT INTO {table} (old_id, new_id) VALUES (%s, %s)", chunk)
+
+    def _lookup_ids(self, old_ids):
+        """New ids of the given exported ids that have been imported so far"""
+        if self.keep_ids:
+            return {pk: pk for pk in List.objects.filter(pk__in=old_ids).values_list('pk', flat=True)}
+        qn = connection.ops.quote_name
+        found = {}
+        with connection.cursor() as cursor:
+            for chunk in self._chunks(old_ids):
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(
+                    f"SELECT old_id, new_id FROM {qn(self.ID_MAP_TABLE)} WHERE old_id IN ({placeholders})", chunk
+                )
+                found.update(cursor.fetchall())
+        return found
+
+    def _store_pending(self, pairs):
+        if not pairs:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {connection.ops.quote_name(self.PENDING_FORKS_TABLE)} "
+                f"(list_id, original_id) VALUES (%s, %s)",
+                pairs
+            )
+
+    def _resolve_owners(self, usernames):
+        missing = {name for name in usernames if name not in self.owner_ids}
+        if not missing:
+            return
+        for pk, username in User.objects.filter(username__in=missing).values_list('pk', 'username'):
+            self.owner_ids[username] = pk
+        missing -= set(self.owner_ids)
+        if missing and self.create_users:
+            users = [User(username=name) for name in missing]
+            for user in users:
+                user.set_unusable_password()
+            # Saved one by one so the post_save handlers create profiles
+            for user in users:
+                user.save()
+                self.owner_ids[user.username] = user.pk
+            self.stats.users_created += len(users)
+
+    def _import_batch(self, records):
+        """Insert a batch of (line number, cleaned record) pairs"""
+        self._resolve_owners({record['owner'] for _, record in records})
+        taken = set()
+        if self.keep_ids:
+            taken = set(List.objects.filter(pk__in=[record['id'] for _, record in records])
+                        .values_list('pk', flat=True))
+        objs = []
+        sources = []
+        for number, record in records:
+            owner_id = self.owner_ids.get(record['owner'])
+            if owner_id is None:
+                self.stats.error(f"line {number}: unknown owner {record['owner']!r}")
+                continue
+            if self.keep_ids and record['id'] in taken:
+                self.stats.error(f"line {number}: list {record['id']} already exists")
+                continue
+            obj = List(
+                title=record['title'],
+                description=record['description'],
+                content=record['content'],
+                tags=record['tags'],
+                prompt=record['prompt'],
+                is_public=record['is_public'],
+                owner_id=owner_id,
+            )
+            if self.keep_ids:
+                obj.pk = record['id']
+                taken.add(obj.pk)
+            objs.append(obj)
+            sources.append(record)
+
+        with transaction.atomic():
+            List.objects.bulk_create(objs, batch_size=self.batch_size)
+            if not self.keep_ids:
+                self._store_ids(
+                    (record['id'], obj.pk)
+                    for obj, record in zip(objs, sources)
+                    if record['id'] is not None
+                )
+            originals = {record['original_list'] for record in sources} - {None}
+            resolved = self._lookup_ids(originals)
+            pending = []
+            for obj, record in zip(objs, sources):
+                # auto_now/auto_now_add overwrite timestamps on insert; restore them here
+                if record['created_at']:
+                    obj.created_at = record['created_at']
+                if record['updated_at']:
+                    obj.updated_at = record['updated_at']
+                original = record['original_list']
+                if original is not None:
+                    if original in resolved:
+                        obj.original_list_id = resolved[original]
+                        self.stats.forks_linked += 1
+                    else:
+                        pending.append((obj.pk, original))
+            self._store_pending(pending)
+            List.objects.bulk_update(objs, ['created_at', 'updated_at', 'original_list'], batch_size=self.batch_size)
+            linked = {obj.original_list_id for obj in objs if obj.original_list_id}
+            if linked:
+                List.objects.filter(pk__in=linked).recount()
+        self.stats.created += len(objs)
+
+    def _link_pending_forks(self):
+        """Link forks that appeared before their original in the stream, a batch at a time"""
+        qn = connection.ops.quote_name
+        pending = qn(self.PENDING_FORKS_TABLE)
+        if self.keep_ids:
+            query = (
+                f"SELECT p.list_id, l.{qn(List._meta.pk.column)} FROM {pending} p "
+                f"INNER JOIN {qn(List._meta.db_table)} l ON l.{qn(List._meta.pk.column)} = p.original_id "
+            )
+        else:
+            query = (
+                f"SELECT p.list_id, m.new_id FROM {pending} p "
+                f"INNER JOIN {qn(self.ID_MAP_TABLE)} m ON m.old_id = p.original_id "
+            )
+        query += "WHERE p.list_id > %s ORDER BY p.list_id LIMIT %s"
+
+        last = 0
+        while True:
+            with connection.cursor() as cursor:
+                cursor.execute(query, [last, self.batch_size])
+                rows = cursor.fetchall()
+            if not rows:
+                break
+            last = rows[-1][0]
+            with transaction.atomic():
+                List.objects.bulk_update(
+                    [List(pk=list_id, original_list_id=target) for list_id, target in rows],
+                    ['original_list'], batch_size=self.batch_size
+                )
+                List.objects.filter(pk__in={target for _, target in rows}).recount()
+            self.stats.forks_linked += len(rows)
+
+    def _reset_sequence(self):
+        statements = connection.ops.sequence_reset_sql(no_style(), [List])
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
@@ -1,11 +1,15 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.home, name='home'),
     path('explore/', views.explore, name='explore'),
     path('create/', views.create_list, name='create_list'),
     path('create/generate/', views.generate_list_content, name='generate_list_content'),
+    path('create/generate/<uuid:job_id>/', views.generation_job_status, name='generation_job_status'),
+    path('create/generate/metrics/', views.generation_metrics, name='generation_metrics'),
+    path('list/batch/', views.batch_lists, name='batch_lists'),
+    path('list/drawers/', views.list_drawers, name='list_drawers'),
     path('list/<int:pk>/', views.list_detail, name='list_detail'),
     path('list/<int:pk>/fork/', views.fork_list, name='fork_list'),
     path('list/<int:pk>/edit/', views.edit_list, name='edit_list'),
@@ -16,4 +20,10 @@ urlpatterns = [
     path('user/<str:username>/lists/', views.user_lists, name='user_lists'),
     path('register/', views.register, name='register'),
     path('profile/', views.profile, name='profile'),
+    path('export/', views.export_lists, name='export_lists'),
+    path('metrics', views.prometheus_metrics, name='metrics'),
+    path('api/explore/', api.explore, name='api_explore'),
+    path('api/lists/<int:pk>/', api.list_detail, name='api_list_detail'),
+    path('api/lists/<int:pk>/lineage/', api.list_lineage, name='api_list_lineage'),
+    path('api/users/<str:username>/lists/', api.user_lists, name='api_user_lists'),
 ] 
\ No newline at end of file
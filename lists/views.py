@@ -1,20 +1,35 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import login
 from django.contrib import messages
-from django.http import JsonResponse
-from django.db.models import Q
-from .models import List, UserProfile
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.db import transaction
+from django.db.models import Count, F, Prefetch
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_POST
+from .models import GenerationJob, List, Like, UserProfile
 from .forms import (
     ListPromptForm, ListForkForm, ListEditForm,
     UserRegistrationForm, UserProfileForm
 )
-from .services import ListGenerationService
+from . import likebuffer, metrics
+from .jobs import QueueFull, TooManyJobs, job_setting, submit_generation_job
+from .promptcache import cache_setting
+from .transfer import async_chunks, export_records, ndjson_lines
 import json
 import logging
 
 logger = logging.getLogger(__name__)
 
+BATCH_ACTIONS = ('like', 'unlike', 'toggle_like', 'publish', 'unpublish', 'toggle_visibility', 'delete')
+MAX_BATCH_OPERATIONS = 200
+MAX_DRAWER_PREFETCH = 50
+
 def home(request):
     """Homepage view - shows user's lists if authenticated, or public lists if not"""
     if request.user.is_authenticated:
@@ -23,12 +38,7 @@ def home(request):
         # Handle search query
         query = request.GET.get('q', '')
         if query:
-            lists = lists.filter(
-                Q(title__icontains=query) |
-                Q(description__icontains=query) |
-                Q(content__icontains=query) |
-                Q(tags__icontains=query)
-            )
+            lists = lists.search(query)
         
         # Filter lists based on visibility parameter
         visibility = request.GET.get('visibility', 'all')
@@ -37,14 +47,16 @@ def home(request):
         elif visibility == 'private':
             lists = lists.filter(is_public=False)
             
-        lists = lists.order_by('-created_at')
+        lists = likebuffer.apply_pending(
+            lists.with_viewer_flags(request.user).order_by('-created_at'), request.user
+        )
         return render(request, 'lists/home_authenticated.html', {
             'lists': lists,
             'current_visibility': visibility,
             'query': query
         })
     else:
-        lists = List.objects.filter(is_public=True).order_by('-created_at')
+        lists = List.objects.filter(is_public=True).with_viewer_flags(request.user).order_by('-created_at')
         return render(request, 'lists/home_public.html', {
             'lists': lists
         })
@@ -73,7 +85,7 @@ def create_list(request):
 
 @login_required
 def generate_list_content(request):
-    """AJAX endpoint for generating list content"""
+    """AJAX endpoint that queues a list generation job and returns its id"""
     if not request.method == 'POST' or not request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({'error': 'Invalid request'}, status=400)
     
@@ -81,13 +93,109 @@ def generate_list_content(request):
     if not title:
         return JsonResponse({'error': 'Title is required'}, status=400)
     
-    service = ListGenerationService()
+    idempotency_key = request.headers.get('Idempotency-Key') or request.POST.get('idempotency_key')
     try:
-        result = service.generate_list(title)
-        return JsonResponse(result)
-    except Exception as e:
-        logger.error(f"Error generating list: {str(e)}")
-        return JsonResponse({'error': str(e)}, status=400)
+        job = submit_generation_job(request.user, title, idempotency_key=idempotency_key)
+    except TooManyJobs as e:
+        response = JsonResponse({'error': str(e)}, status=429)
+        response['Retry-After'] = str(int(job_setting('POLL_INTERVAL')) + 1)
+        return response
+    except QueueFull as e:
+        response = JsonResponse({'error': str(e)}, status=503)
+        response['Retry-After'] = str(e.retry_after)
+        return response
+    return JsonResponse(_job_payload(job), status=202)
+
+@login_required
+def generation_job_status(request, job_id):
+    """Status (and result once finished) of one of the user's generation jobs"""
+    job = get_object_or_404(GenerationJob, pk=job_id, user=request.user)
+    return JsonResponse(_job_payload(job))
+
+def _job_payload(job):
+    payload = {
+        'job_id': str(job.pk),
+        'status': job.status,
+        'attempts': job.attempts,
+        'status_url': reverse('generation_job_status', args=[job.pk]),
+    }
+    if job.status == GenerationJob.SUCCEEDED:
+        payload['result'] = job.result
+    elif job.status == GenerationJob.FAILED:
+        payload['error'] = job.error
+    else:
+        payload['poll_after_ms'] = int(job_setting('POLL_INTERVAL') * 1000)
+    if job.started_at:
+        payload['queue_seconds'] = job.queue_seconds
+    if job.run_seconds is not None:
+        payload['run_seconds'] = job.run_seconds
+    return payload
+
+@staff_member_required
+def generation_metrics(request):
+    """
+    Job queue, scheduler, prompt cache and per-model figures for generation.
+    Generation runs in the worker processes, so everything but the job
+    counts comes from the multi-process metrics registry (see /metrics).
+    """
+    collected = metrics.registry.collect()
+
+    def summary(histogram, labels=()):
+        state = collected[histogram.name].get(labels, [[0] * len(histogram.buckets), 0.0, 0])
+        return {
+            'count': state[2],
+            'avg': state[1] / state[2] if state[2] else None,
+            'p50': histogram.quantile(state, 0.5),
+            'p95': histogram.quantile(state, 0.95),
+        }
+
+    scheduler = {outcome: 0 for outcome in ('admitted', 'throttled', 'shed', 'timed_out')}
+    for (outcome,), value in collected[metrics.GENERATION_ADMISSIONS.name].items():
+        scheduler[outcome] = value
+    scheduler['wait_seconds'] = summary(metrics.GENERATION_QUEUE_WAIT)
+
+    hits = collected[metrics.CACHE_REQUESTS.name].get(('prompt', 'hit'), 0)
+    misses = collected[metrics.CACHE_REQUESTS.name].get(('prompt', 'miss'), 0)
+    similarity = collected[metrics.PROMPT_SIMILARITY.name].get((), [[]])[0]
+
+    models = {}
+    for (model,) in collected[metrics.LLM_LATENCY.name]:
+        models[model] = {'latency_seconds': summary(metrics.LLM_LATENCY, (model,)), 'hedges': {}, 'fallbacks': 0}
+    for (model, winner), value in collected[metrics.LLM_HEDGES.name].items():
+        models.setdefault(model, {'hedges': {}, 'fallbacks': 0})['hedges'][winner] = value
+    for (model,), value in collected[metrics.LLM_FALLBACKS.name].items():
+        models.setdefault(model, {'hedges': {}, 'fallbacks': 0})['fallbacks'] = value
+
+    return JsonResponse({
+        'jobs': dict(GenerationJob.objects.order_by().values_list('status').annotate(Count('pk'))),
+        'scheduler': scheduler,
+        'prompt_cache': {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+            'threshold': cache_setting('THRESHOLD'),
+            'similarity_histogram': {
+                f'{bound:.2f}': count for bound, count in zip(metrics.PROMPT_SIMILARITY.buckets, similarity)
+            },
+        },
+        'models': models,
+    })
+
+def prometheus_metrics(request):
+    """
+    Metrics of all worker processes in the Prometheus text format.
+    Open to staff, a matching bearer token (METRICS['TOKEN']) or the
+    addresses in METRICS['ALLOWED_IPS'], which is empty by default.
+    """
+    token = metrics.metrics_setting('TOKEN')
+    allowed = (
+        request.user.is_staff
+        or (token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'))
+        or request.META.get('REMOTE_ADDR') in metrics.metrics_setting('ALLOWED_IPS')
+    )
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 def explore(request):
     """Explore all public lists with search functionality"""
@@ -95,14 +203,11 @@ def explore(request):
     lists = List.objects.filter(is_public=True)
     
     if query:
-        lists = lists.filter(
-            Q(title__icontains=query) |
-            Q(description__icontains=query) |
-            Q(content__icontains=query) |
-            Q(tags__icontains=query)
-        )
+        lists = lists.search(query)
     
-    lists = lists.order_by('-created_at')
+    lists = likebuffer.apply_pending(
+        lists.with_viewer_flags(request.user).order_by('-created_at'), request.user
+    )
     
     return render(request, 'lists/explore.html', {
         'lists': lists,
@@ -131,12 +236,21 @@ def save_list(request):
         return redirect('list_detail', pk=list_obj.pk)
     return redirect('home')
 
+def _drawer_queryset(user):
+    """Lists with everything list_detail_content.html needs, in a fixed number of queries"""
+    return (
+        List.objects.with_viewer_flags(user)
+        .select_related('owner')
+        .prefetch_related(Prefetch('forks', queryset=List.objects.select_related('owner')))
+    )
+
 def list_detail(request, pk):
     """View a single list"""
-    list_obj = get_object_or_404(List, pk=pk)
+    list_obj = get_object_or_404(_drawer_queryset(request.user), pk=pk)
     if not list_obj.is_public and list_obj.owner != request.user:
         messages.error(request, 'This list is private.')
         return redirect('home')
+    likebuffer.apply_pending([list_obj], request.user)
     
     fork_form = ListForkForm() if request.user.is_authenticated else None
     
@@ -153,6 +267,32 @@ def list_detail(request, pk):
         'fork_form': fork_form
     })
 
+def list_drawers(request):
+    """
+    Drawer HTML for many lists at once, for the grid to prefetch.
+    Takes ?ids=1,2,3 and returns {"drawers": {"1": "<html>", ...}}; lists that
+    are missing or not visible to the user are left out.
+    """
+    try:
+        ids = {int(pk) for pk in request.GET.get('ids', '').split(',') if pk.strip()}
+    except ValueError:
+        return JsonResponse({'error': 'Invalid request'}, status=400)
+    if len(ids) > MAX_DRAWER_PREFETCH:
+        return JsonResponse({'error': f'At most {MAX_DRAWER_PREFETCH} lists per request'}, status=400)
+
+    lists = likebuffer.apply_pending(
+        _drawer_queryset(request.user).visible_to(request.user).filter(pk__in=ids), request.user
+    )
+    fork_form = ListForkForm() if request.user.is_authenticated else None
+    drawers = {
+        str(list_obj.pk): render_to_string('lists/list_detail_content.html', {
+            'list': list_obj,
+            'fork_form': fork_form
+        }, request)
+        for list_obj in lists
+    }
+    return JsonResponse({'drawers': drawers})
+
 @login_required
 def fork_list(request, pk):
     """Fork an existing list"""
@@ -166,10 +306,11 @@ def fork_list(request, pk):
                 new_owner=request.user,
                 is_public=data.get('is_public', True)
             )
+            metrics.FORKS.inc()
             return JsonResponse({
                 'success': True,
                 'fork_id': forked_list.pk,
-                'fork_count': original_list.forks.count()
+                'fork_count': List.objects.filter(pk=original_list.pk).values_list('fork_count', flat=True).get()
             })
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=400)
@@ -182,6 +323,7 @@ def fork_list(request, pk):
                 new_owner=request.user,
                 is_public=form.cleaned_data['is_public']
             )
+            metrics.FORKS.inc()
             messages.success(request, 'List forked successfully!')
             return redirect('list_detail', pk=forked_list.pk)
     return redirect('list_detail', pk=pk)
@@ -267,6 +409,22 @@ def profile(request):
     
     return render(request, 'lists/profile.html', context)
 
+@login_required
+def export_lists(request):
+    """
+    Stream the user's lists as NDJSON (staff may pass ?scope=all).
+    Compression is negotiated by GZipMiddleware via Accept-Encoding.
+    """
+    lists = List.objects.filter(owner=request.user)
+    if request.GET.get('scope') == 'all' and request.user.is_staff:
+        lists = List.objects.all()
+    content = ndjson_lines(export_records(lists))
+    if isinstance(request, ASGIRequest):
+        content = async_chunks(content)
+    response = StreamingHttpResponse(content, content_type='application/x-ndjson')
+    response['Content-Disposition'] = 'attachment; filename="lists.ndjson"'
+    return response
+
 @login_required
 def delete_list(request, pk):
     """Delete a list"""
@@ -280,27 +438,43 @@ def delete_list(request, pk):
 @login_required
 def toggle_like(request, pk):
     """Toggle like status for a list"""
-    list_obj = get_object_or_404(List, pk=pk)
+    list_obj = get_object_or_404(List.objects.with_viewer_flags(request.user), pk=pk)
     
     # Check if list is public or user is owner
-    if not list_obj.is_public and list_obj.owner != request.user:
+    if not list_obj.is_public and list_obj.owner_id != request.user.pk:
         return JsonResponse({'error': 'This list is private'}, status=403)
     
-    # Check if user has already liked the list
-    like = list_obj.likes.filter(user=request.user).first()
+    if likebuffer.enabled():
+        # Write-behind: record the toggle and report the user's own view of it
+        pending = likebuffer.pending_state(request.user.pk, pk)
+        liked = not (list_obj.liked if pending is None else pending)
+        likebuffer.record_toggle(request.user.pk, pk, liked)
+        metrics.LIKES.inc('like' if liked else 'unlike')
+        return JsonResponse({
+            'liked': liked,
+            'count': max(0, list_obj.like_count + int(liked) - int(list_obj.liked))
+        })
     
-    if like:
+    # Only a row this request actually removed or added moves the counter, so
+    # two concurrent toggles from the same user cannot count twice
+    if list_obj.liked:
         # Unlike
-        like.delete()
+        deleted, _ = Like.objects.filter(list=list_obj, user=request.user).delete()
         liked = False
+        if deleted:
+            List.objects.filter(pk=pk, like_count__gt=0).update(like_count=F('like_count') - 1)
     else:
         # Like
-        list_obj.likes.create(user=request.user)
+        _, created = Like.objects.get_or_create(list=list_obj, user=request.user)
         liked = True
+        if created:
+            List.objects.filter(pk=pk).update(like_count=F('like_count') + 1)
+    list_obj.refresh_from_db(fields=['like_count'])
+    metrics.LIKES.inc('like' if liked else 'unlike')
     
     return JsonResponse({
         'liked': liked,
-        'count': list_obj.likes.count()
+        'count': list_obj.like_count
     })
 
 @login_required
@@ -318,3 +492,127 @@ def toggle_visibility(request, pk):
         })
     
     return JsonResponse({'error': 'Invalid request'}, status=400)
+
+@login_required
+@require_POST
+def batch_lists(request):
+    """
+    Apply many (action, list_id) operations in one request.
+
+    Expects JSON like {"operations": [{"action": "like", "list_id": 1}, ...]}.
+    Permissions and current like state are loaded with one query each, the
+    operations are replayed in order against that snapshot, and the net
+    changes are written in a single transaction with bulk/set-based queries.
+    """
+    try:
+        operations = json.loads(request.body)['operations']
+        operations = [(str(op['action']), int(op['list_id'])) for op in operations]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Invalid request'}, status=400)
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return JsonResponse({'error': f'At most {MAX_BATCH_OPERATIONS} operations per request'}, status=400)
+
+    list_ids = {list_id for _, list_id in operations}
+    lists = {
+        row['pk']: row
+        for row in List.objects.filter(pk__in=list_ids).values('pk', 'owner_id', 'is_public', 'like_count')
+    }
+    liked_stored = set(
+        Like.objects.filter(user=request.user, list_id__in=lists).values_list('list_id', flat=True)
+    )
+    buffered = likebuffer.enabled()
+    liked_before = set(liked_stored)
+    if buffered:
+        # Unflushed toggles take precedence over the stored likes
+        for list_id, pending in likebuffer.pending_states(request.user.pk, lists).items():
+            if pending:
+                liked_before.add(list_id)
+            else:
+                liked_before.discard(list_id)
+    public_before = {pk for pk, row in lists.items() if row['is_public']}
+
+    liked = set(liked_before)
+    public = set(public_before)
+    deleted = set()
+    results = []
+    for action, list_id in operations:
+        result = {'action': action, 'list_id': list_id}
+        row = lists.get(list_id)
+        is_owner = row is not None and row['owner_id'] == request.user.pk
+        if action not in BATCH_ACTIONS:
+            result['error'] = 'Invalid action'
+        elif row is None or list_id in deleted:
+            result['error'] = 'List not found'
+        elif action in ('like', 'unlike', 'toggle_like'):
+            if list_id not in public and not is_owner:
+                result['error'] = 'This list is private'
+            else:
+                if action == 'like' or (action == 'toggle_like' and list_id not in liked):
+                    liked.add(list_id)
+                else:
+                    liked.discard(list_id)
+                result['liked'] = list_id in liked
+        elif not is_owner:
+            result['error'] = 'Permission denied'
+        elif action == 'delete':
+            deleted.add(list_id)
+            result['deleted'] = True
+        else:
+            if action == 'publish' or (action == 'toggle_visibility' and list_id not in public):
+                public.add(list_id)
+            else:
+                public.discard(list_id)
+            result['is_public'] = list_id in public
+        result['success'] = 'error' not in result
+        results.append(result)
+
+    liked -= deleted
+    unliked = (liked_before - liked) - deleted
+    with transaction.atomic():
+        if not buffered:
+            Like.objects.bulk_create(
+                [Like(user=request.user, list_id=pk) for pk in liked - liked_before],
+                ignore_conflicts=True
+            )
+            if unliked:
+                Like.objects.filter(user=request.user, list_id__in=unliked).delete()
+        now = timezone.now()
+        published = (public - public_before) - deleted
+        if published:
+            List.objects.filter(pk__in=published, owner=request.user).update(is_public=True, updated_at=now)
+        unpublished = (public_before - public) - deleted
+        if unpublished:
+            List.objects.filter(pk__in=unpublished, owner=request.user).update(is_public=False, updated_at=now)
+        if deleted:
+            List.objects.filter(pk__in=deleted, owner=request.user).delete()
+        if liked != liked_before:
+            if not buffered:
+                List.objects.filter(pk__in=liked ^ liked_before).recount()
+            metrics.LIKES.inc('like', amount=len(liked - liked_before))
+            metrics.LIKES.inc('unlike', amount=len(unliked))
+
+    if buffered:
+        # Likes go through the write-behind buffer like single toggles do, so
+        # a later flush cannot overwrite them
+        likebuffer.record_states(
+            request.user.pk, {pk: pk in liked for pk in (liked ^ liked_before) - deleted}
+        )
+
+    like_ids = {r['list_id'] for r in results if 'liked' in r} - deleted
+    if buffered:
+        # Stored count adjusted by the user's own unflushed state, as in toggle_like
+        for result in results:
+            if 'liked' in result and result['list_id'] in like_ids:
+                list_id = result['list_id']
+                result['count'] = max(
+                    0, lists[list_id]['like_count'] + int(list_id in liked) - int(list_id in liked_stored)
+                )
+    elif like_ids:
+        counts = dict(
+            List.objects.filter(pk__in=like_ids).values_list('pk', 'like_count')
+        )
+        for result in results:
+            if 'liked' in result and result['list_id'] in counts:
+                result['count'] = counts[result['list_id']]
+
+    return JsonResponse({'results': results})
@@ -0,0 +1,378 @@
+// Masonry-style layout: place each card in the currently shortest column
+var GRID_COLUMN_WIDTH = 300;
+var GRID_GUTTER = 16;
+
+function layoutGrid(grid) {
+    var items = grid.querySelectorAll('.grid-item');
+    var available = grid.parentElement.clientWidth;
+    var columns = Math.max(1, Math.floor((available + GRID_GUTTER) / (GRID_COLUMN_WIDTH + GRID_GUTTER)));
+    var heights = new Array(columns).fill(0);
+
+    grid.style.position = 'relative';
+    grid.style.width = (columns * (GRID_COLUMN_WIDTH + GRID_GUTTER) - GRID_GUTTER) + 'px';
+
+    items.forEach(function(item) {
+        var column = heights.indexOf(Math.min.apply(null, heights));
+        item.style.position = 'absolute';
+        item.style.left = (column * (GRID_COLUMN_WIDTH + GRID_GUTTER)) + 'px';
+        item.style.top = heights[column] + 'px';
+        heights[column] += item.offsetHeight + parseFloat(getComputedStyle(item).marginBottom);
+    });
+
+    grid.style.height = Math.max.apply(null, heights) + 'px';
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    var grid = document.querySelector('.list-grid');
+    if (!grid) return;
+    layoutGrid(grid);
+
+    // Re-layout once fonts/images have loaded and whenever the viewport changes
+    var resizeTimer;
+    window.addEventListener('load', function() {
+        layoutGrid(grid);
+    });
+    window.addEventListener('resize', function() {
+        clearTimeout(resizeTimer);
+        resizeTimer = setTimeout(function() {
+            layoutGrid(grid);
+        }, 100);
+    });
+    grid.addEventListener('load', function() {
+        layoutGrid(grid);
+    }, true);
+
+    observeCardsForPrefetch(grid);
+});
+
+// Drawer prefetch: fetch drawer HTML for the cards in (or near) the viewport
+// in batches, so opening a drawer usually needs no request at all
+var DRAWER_CACHE_TTL = 60 * 1000;
+var DRAWER_BATCH_SIZE = 50;
+var DRAWER_PREFETCH_DELAY = 150;
+var drawerCache = new Map();
+var drawerPending = new Set();
+// Bumped on every invalidation, so a batch that was already in flight
+// cannot put back HTML from before the change
+var drawerGeneration = new Map();
+
+function getCachedDrawer(listId) {
+    var entry = drawerCache.get(String(listId));
+    if (!entry) return null;
+    if (Date.now() - entry.fetchedAt > DRAWER_CACHE_TTL) {
+        drawerCache.delete(String(listId));
+        return null;
+    }
+    return entry.html;
+}
+
+function invalidateDrawer(listId) {
+    var id = String(listId);
+    drawerGeneration.set(id, (drawerGeneration.get(id) || 0) + 1);
+    drawerCache.delete(id);
+}
+
+function prefetchDrawers(ids) {
+    var grid = document.querySelector('.list-grid');
+    if (!grid || !grid.dataset.drawersUrl) return;
+
+    var wanted = ids.map(String).filter(function(id) {
+        return !drawerPending.has(id) && getCachedDrawer(id) === null;
+    });
+    for (var i = 0; i < wanted.length; i += DRAWER_BATCH_SIZE) {
+        var batch = wanted.slice(i, i + DRAWER_BATCH_SIZE);
+        batch.forEach(function(id) { drawerPending.add(id); });
+        fetchDrawerBatch(grid.dataset.drawersUrl, batch);
+    }
+}
+
+function fetchDrawerBatch(url, batch) {
+    var started = new Map(batch.map(id => [id, drawerGeneration.get(id) || 0]));
+    fetch(`${url}?ids=${batch.join(',')}`, {
+        headers: {
+            'X-Requested-With': 'XMLHttpRequest'
+        }
+    })
+    .then(response => response.json())
+    .then(data => {
+        var fetchedAt = Date.now();
+        Object.entries(data.drawers || {}).forEach(([id, html]) => {
+            if ((drawerGeneration.get(id) || 0) !== started.get(id)) return;
+            drawerCache.set(id, {html: html, fetchedAt: fetchedAt});
+        });
+    })
+    .catch(error => console.error('Error:', error))
+    .finally(() => {
+        batch.forEach(function(id) { drawerPending.delete(id); });
+    });
+}
+
+function observeCardsForPrefetch(grid) {
+    if (!('IntersectionObserver' in window) || !grid.dataset.drawersUrl) return;
+
+    var visible = new Set();
+    var timer;
+    var observer = new IntersectionObserver(function(entries) {
+        entries.forEach(function(entry) {
+            var id = entry.target.dataset.listId;
+            if (entry.isIntersecting) {
+                visible.add(id);
+            } else {
+                visible.delete(id);
+            }
+        });
+        // Wait for scrolling to settle before asking for the visible cards
+        clearTimeout(timer);
+        timer = setTimeout(function() {
+            prefetchDrawers(Array.from(visible));
+        }, DRAWER_PREFETCH_DELAY);
+    }, {rootMargin: '200px'});
+
+    grid.querySelectorAll('.list-card[data-list-id]').forEach(function(card) {
+        observer.observe(card);
+    });
+}
+
+function getLoginURL() {
+    var grid = document.querySelector('.list-grid');
+    return grid ? grid.dataset.loginUrl : '/accounts/login/';
+}
+
+function openDrawer(listId) {
+    const drawer = document.getElementById('drawer');
+    const overlay = document.getElementById('drawerOverlay');
+    const content = document.getElementById('drawerContent');
+
+    // Show drawer and overlay
+    drawer.classList.add('active');
+    overlay.classList.add('active');
+    document.body.style.overflow = 'hidden';
+
+    // Use the prefetched drawer when there is one
+    const cached = getCachedDrawer(listId);
+    if (cached !== null) {
+        showDrawerContent(content, cached, listId);
+        return;
+    }
+
+    // Show loading state
+    content.innerHTML = `
+        <div class="drawer-loading">
+            <div class="spinner-border text-primary" role="status">
+                <span class="visually-hidden">Loading...</span>
+            </div>
+        </div>
+    `;
+
+    // Fetch list details
+    fetch(`/list/${listId}/`, {
+        headers: {
+            'X-Requested-With': 'XMLHttpRequest'
+        }
+    })
+    .then(response => response.text())
+    .then(html => showDrawerContent(content, html, listId))
+    .catch(error => {
+        content.innerHTML = '<div class="alert alert-danger">Error loading list details</div>';
+        console.error('Error:', error);
+    });
+}
+
+function showDrawerContent(content, html, listId) {
+    content.innerHTML = html;
+
+    // Re-initialize interactive elements
+    content.querySelectorAll('button').forEach(button => {
+        if (button.classList.contains('like-button')) {
+            button.onclick = (e) => toggleLike(e, listId);
+        } else if (button.classList.contains('fork-button')) {
+            button.onclick = (e) => quickFork(e, listId);
+        } else if (button.classList.contains('visibility-button')) {
+            button.onclick = (e) => toggleVisibility(e, listId);
+        }
+    });
+
+    // Update URLs to prevent navigation
+    content.querySelectorAll('a').forEach(link => {
+        if (link.href.includes('/list/')) {
+            const linkListId = link.href.match(/\/list\/(\d+)/)[1];
+            link.onclick = (e) => {
+                e.preventDefault();
+                openDrawer(linkListId);
+            };
+        }
+    });
+
+    // Initialize any Bootstrap components
+    if (content.querySelector('[data-bs-toggle="modal"]')) {
+        new bootstrap.Modal(content.querySelector('.modal'));
+    }
+}
+
+function closeDrawer() {
+    const drawer = document.getElementById('drawer');
+    const overlay = document.getElementById('drawerOverlay');
+    
+    drawer.classList.remove('active');
+    overlay.classList.remove('active');
+    document.body.style.overflow = '';
+}
+
+// Close drawer on escape key
+document.addEventListener('keydown', function(event) {
+    if (event.key === 'Escape') {
+        closeDrawer();
+    }
+});
+
+// Add CSRF token handling
+function getCSRFToken() {
+    const csrfTokenElement = document.querySelector('[name=csrfmiddlewaretoken]');
+    if (!csrfTokenElement) {
+        console.error('CSRF token not found');
+        return null;
+    }
+    return csrfTokenElement.value;
+}
+
+// Update toggleLike function
+function toggleLike(event, listId) {
+    event.stopPropagation();
+    
+    const csrfToken = getCSRFToken();
+    if (!csrfToken) return;
+    
+    if (event.currentTarget.hasAttribute('disabled')) {
+        window.location.href = getLoginURL();
+        return;
+    }
+    
+    const button = event.currentTarget;
+    const icon = button.querySelector('i');
+    const countSpan = button.querySelector('.like-count');
+    
+    fetch(`/list/${listId}/like/`, {
+        method: 'POST',
+        headers: {
+            'X-CSRFToken': csrfToken,
+            'X-Requested-With': 'XMLHttpRequest'
+        }
+    })
+    .then(response => response.json())
+    .then(data => {
+        invalidateDrawer(listId);
+        if (data.liked) {
+            button.classList.add('liked');
+            icon.classList.remove('bi-heart');
+            icon.classList.add('bi-heart-fill');
+        } else {
+            button.classList.remove('liked');
+            icon.classList.remove('bi-heart-fill');
+            icon.classList.add('bi-heart');
+        }
+        countSpan.textContent = data.count;
+    })
+    .catch(error => console.error('Error:', error));
+}
+
+// Update quickFork function
+function quickFork(event, listId) {
+    event.stopPropagation();
+    
+    const csrfToken = getCSRFToken();
+    if (!csrfToken) return;
+    
+    if (event.currentTarget.hasAttribute('disabled')) {
+        window.location.href = getLoginURL();
+        return;
+    }
+    
+    const button = event.currentTarget;
+    const icon = button.querySelector('i');
+    const countSpan = button.querySelector('.fork-count');
+    
+    fetch(`/list/${listId}/fork/`, {
+        method: 'POST',
+        headers: {
+            'X-CSRFToken': csrfToken,
+            'X-Requested-With': 'XMLHttpRequest'
+        },
+        body: JSON.stringify({
+            is_public: true
+        })
+    })
+    .then(response => response.json())
+    .then(data => {
+        invalidateDrawer(listId);
+        if (data.success) {
+            button.classList.add('forked');
+            icon.classList.remove('bi-diagram-2');
+            icon.classList.add('bi-diagram-2-fill');
+            countSpan.textContent = data.fork_count;
+            
+            const toast = document.createElement('div');
+            toast.className = 'toast align-items-center text-white bg-success border-0 position-fixed bottom-0 end-0 m-3';
+            toast.setAttribute('role', 'alert');
+            toast.innerHTML = `
+                <div class="d-flex">
+                    <div class="toast-body">
+                        List forked successfully! <a href="/list/${data.fork_id}/" class="text-white text-decoration-underline">View your fork</a>
+                    </div>
+                    <button type="button" class="btn-close btn-close-white me-2 m-auto" data-bs-dismiss="toast"></button>
+                </div>
+            `;
+            document.body.appendChild(toast);
+            new bootstrap.Toast(toast).show();
+        }
+    })
+    .catch(error => console.error('Error:', error));
+}
+
+// Update toggleVisibility function
+function toggleVisibility(event, listId) {
+    event.stopPropagation();
+    
+    const csrfToken = getCSRFToken();
+    if (!csrfToken) return;
+    
+    const button = event.currentTarget;
+    const icon = button.querySelector('i');
+    
+    fetch(`/list/${listId}/toggle-visibility/`, {
+        method: 'POST',
+        headers: {
+            'X-CSRFToken': csrfToken,
+            'X-Requested-With': 'XMLHttpRequest'
+        }
+    })
+    .then(response => response.json())
+    .then(data => {
+        invalidateDrawer(listId);
+        if (data.is_public) {
+            button.classList.add('public');
+            icon.classList.remove('bi-eye-slash-fill');
+            icon.classList.add('bi-eye-fill');
+            button.title = 'Make private';
+        } else {
+            button.classList.remove('public');
+            icon.classList.remove('bi-eye-fill');
+            icon.classList.add('bi-eye-slash-fill');
+            button.title = 'Make public';
+        }
+        
+        const toast = document.createElement('div');
+        toast.className = 'toast align-items-center text-white bg-success border-0 position-fixed bottom-0 end-0 m-3';
+        toast.setAttribute('role', 'alert');
+        toast.innerHTML = `
+            <div class="d-flex">
+                <div class="toast-body">
+                    ${data.message}
+                </div>
+                <button type="button" class="btn-close btn-close-white me-2 m-auto" data-bs-dismiss="toast"></button>
+            </div>
+        `;
+        document.body.appendChild(toast);
+        new bootstrap.Toast(toast).show();
+    })
+    .catch(error => console.error('Error:', error));
+}